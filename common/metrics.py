@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+Lightweight, in-process metrics for the daemons.
+
+There are counters, gauges and histograms, which are exported in the
+Prometheus text exposition format either via a local Unix socket (connect to it
+and it writes out the current values) or by being written to a text file (which
+is what node_exporter's textfile collector wants).
+
+The recording side is kept as cheap as we can make it since it's in the hot
+paths: a counter is an addition and a histogram is a bisect and a couple of
+additions. All the formatting is done at export time, so if nobody is looking
+then that's all we pay. Counters and gauges can be given a function, which is
+only called at export time, to read values which something else is already
+keeping track of.
+
+Example::
+
+    import metrics
+
+    _FRAMES     = metrics.counter  ('frames_total',   'Frames processed')
+    _FRAME_TIME = metrics.histogram('frame_seconds',  'Time per frame')
+
+    metrics.serve('/tmp/my.metrics.sock')
+
+    with _FRAME_TIME.time():
+        do_frame()
+    _FRAMES.inc()
+
+and then ``socat - UNIX-CONNECT:/tmp/my.metrics.sock`` to see them.
+"""
+
+from __future__ import print_function, division
+
+from   abc    import abstractmethod
+from   bisect import bisect_left
+
+import logging as LOG
+import os
+import threading
+import time
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+# ----------------------------------------------------------------------
+
+# What we use to time things
+_now = getattr(time, 'monotonic', time.time)
+
+# The default histogram buckets, in seconds. These cover everything from a
+# fraction of a millisecond up to a slow e-ink refresh.
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005,
+                   0.001,  0.0025,  0.005,
+                   0.01,   0.025,   0.05,
+                   0.1,    0.25,    0.5,
+                   1.0,    2.5,     5.0,
+                   10.0,   25.0)
+
+# ----------------------------------------------------------------------
+
+class _Metric():
+    """
+    The base class for all the metrics.
+    """
+    # What Prometheus calls this type of metric
+    TYPE = None
+
+    def __init__(self, name, help):
+        """
+        :type name: str
+        :param name:
+            The metric name, e.g. ``vest_frames_total``.
+        :type help: str
+        :param help:
+            What the metric means.
+        """
+        self._name = name
+        self._help = help
+
+
+    @property
+    def name(self):
+        """
+        The metric's name.
+        """
+        return self._name
+
+
+    def expose(self):
+        """
+        Get the metric in the text exposition format, as a list of lines.
+        """
+        lines = ['# HELP %s %s' % (self._name, self._help),
+                 '# TYPE %s %s' % (self._name, self.TYPE)]
+        lines.extend(self._samples())
+        return lines
+
+
+    @abstractmethod
+    def _samples(self):
+        """
+        The sample lines for this metric.
+        """
+        pass
+
+
+class Counter(_Metric):
+    """
+    A value which only goes up. This can either be incremented directly or, if
+    it's given a function, it calls that whenever it's exported.
+    """
+    TYPE = 'counter'
+
+    def __init__(self, name, help, function=None):
+        """
+        :type function: callable
+        :param function:
+            If given, what to call to get the value at export time.
+        """
+        super(Counter, self).__init__(name, help)
+        self._function = function
+        self.value     = 0
+
+
+    def inc(self, amount=1):
+        """
+        Add to the counter.
+        """
+        self.value += amount
+
+
+    def _samples(self):
+        value = self.value if self._function is None else self._function()
+        return ['%s %s' % (self._name, _format(value))]
+
+
+class Gauge(_Metric):
+    """
+    A value which can go up and down. This can either be set directly or,
+    if it's given a function, it calls that whenever it's exported.
+    """
+    TYPE = 'gauge'
+
+    def __init__(self, name, help, function=None):
+        """
+        :type function: callable
+        :param function:
+            If given, what to call to get the value at export time.
+        """
+        super(Gauge, self).__init__(name, help)
+        self._function = function
+        self.value     = 0
+
+
+    def set(self, value):
+        """
+        Set the gauge's value.
+        """
+        self.value = value
+
+
+    def _samples(self):
+        value = self.value if self._function is None else self._function()
+        return ['%s %s' % (self._name, _format(value))]
+
+
+class Histogram(_Metric):
+    """
+    A distribution of observed values, counted into buckets.
+    """
+    TYPE = 'histogram'
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        """
+        :type buckets: tuple
+        :param buckets:
+            The upper bounds of the buckets, in increasing order. There is
+            always an implicit ``+Inf`` one on the end.
+        """
+        super(Histogram, self).__init__(name, help)
+        self._bounds = tuple(float(b) for b in buckets)
+        if list(self._bounds) != sorted(set(self._bounds)):
+            raise ValueError("Buckets must be increasing: %s" % (buckets,))
+
+        # These are per-bucket, not cumulative, counts; we add them up when we
+        # export them. The last one is the +Inf bucket.
+        self._counts = [0] * (len(self._bounds) + 1)
+        self.sum     = 0.0
+        self.count   = 0
+
+
+    def observe(self, value):
+        """
+        Record a value.
+        """
+        self._counts[bisect_left(self._bounds, value)] += 1
+        self.sum   += value
+        self.count += 1
+
+
+    def time(self):
+        """
+        Get a context manager which observes how long its body took, in
+        seconds.
+        """
+        return _Timer(self)
+
+
+    def _samples(self):
+        lines = []
+        total = 0
+        for (bound, count) in zip(self._bounds + (float('inf'),),
+                                  self._counts):
+            total += count
+            lines.append('%s_bucket{le="%s"} %d' %
+                         (self._name, _format(bound), total))
+        lines.append('%s_sum %s'   % (self._name, _format(self.sum)))
+        lines.append('%s_count %d' % (self._name, self.count))
+        return lines
+
+
+class _Timer():
+    """
+    Times a block of code into a histogram.
+    """
+    __slots__ = ('_histogram', '_start')
+
+    def __init__(self, histogram):
+        self._histogram = histogram
+        self._start     = None
+
+
+    def __enter__(self):
+        self._start = _now()
+        return self
+
+
+    def __exit__(self, *args):
+        self._histogram.observe(_now() - self._start)
+        return False
+
+# ----------------------------------------------------------------------
+
+class Registry():
+    """
+    A collection of metrics.
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._lock    = threading.Lock()
+
+
+    def counter(self, name, help, function=None):
+        """
+        Get the `Counter` with the given name, creating it if needed.
+        """
+        return self._get(Counter, name, help, function)
+
+
+    def gauge(self, name, help, function=None):
+        """
+        Get the `Gauge` with the given name, creating it if needed.
+        """
+        return self._get(Gauge, name, help, function)
+
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        """
+        Get the `Histogram` with the given name, creating it if needed.
+        """
+        return self._get(Histogram, name, help, buckets)
+
+
+    def expose(self):
+        """
+        Get all the metrics in the text exposition format.
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.expose())
+        lines.append('')
+        return '\n'.join(lines)
+
+
+    def _get(self, cls, name, help, *args):
+        """
+        Get or create a metric.
+        """
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, help, *args)
+                self._metrics[name] = metric
+            elif not isinstance(metric, cls):
+                raise ValueError("%s is already a %s" % (name, metric.TYPE))
+            return metric
+
+
+# The default registry, which the module-level functions use
+REGISTRY = Registry()
+
+def counter(name, help, function=None):
+    """
+    @see Registry.counter()
+    """
+    return REGISTRY.counter(name, help, function)
+
+
+def gauge(name, help, function=None):
+    """
+    @see Registry.gauge()
+    """
+    return REGISTRY.gauge(name, help, function)
+
+
+def histogram(name, help, buckets=DEFAULT_BUCKETS):
+    """
+    @see Registry.histogram()
+    """
+    return REGISTRY.histogram(name, help, buckets)
+
+# ----------------------------------------------------------------------
+
+class _Handler(socketserver.BaseRequestHandler):
+    """
+    Writes out the metrics to whoever connected.
+    """
+    def handle(self):
+        self.request.sendall(self.server.registry.expose().encode('utf-8'))
+
+
+def serve(path, registry=REGISTRY):
+    """
+    Serve the metrics on a Unix domain socket, in a background thread. Anyone
+    who connects gets the current values written to them.
+
+    :type path: str
+    :param path:
+        The path of the socket. Any existing file there is removed.
+
+    :return: The server, which can be ``shutdown()``.
+    """
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+    server = socketserver.UnixStreamServer(path, _Handler)
+    server.registry = registry
+    thread = threading.Thread(target=server.serve_forever, name='metrics')
+    thread.daemon = True
+    thread.start()
+    LOG.info("Serving metrics on %s", path)
+    return server
+
+
+def write_textfile(path, registry=REGISTRY):
+    """
+    Write the metrics to a file. We do this via a temporary file so that
+    anything reading it never sees a partial version.
+
+    :type path: str
+    :param path:
+        The path of the file to write.
+    """
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'wt') as fh:
+        fh.write(registry.expose())
+    os.rename(tmp, path)
+
+
+def _format(value):
+    """
+    Format a value as Prometheus wants it.
+    """
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+if __name__ == "__main__":
+    # Show what the output looks like, and how cheap the recording is
+    frames = counter  ('example_frames_total', 'Example frames')
+    times  = histogram('example_frame_seconds', 'Example frame times')
+    n = 100000
+    start = _now()
+    for i in range(n):
+        with times.time():
+            frames.inc()
+    took = _now() - start
+    print(REGISTRY.expose())
+    print("%0.2fus per timed increment" % (took / n * 1e6))
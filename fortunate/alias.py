@@ -0,0 +1,77 @@
+"""
+Weighted random sampling in constant time, using Vose's alias method.
+
+The table is built once, in O(n), from the weights of the ``n`` things. Then
+each sample is one random index and one biased coin flip: the coin says
+whether to have the thing at that index or its "alias". See "Darts, Dice, and
+Coins: Sampling from a Discrete Distribution" by Keith Schwarz for the details.
+"""
+
+import numpy as np
+import random
+
+# ----------------------------------------------------------------------
+
+class AliasTable():
+    """
+    A table for sampling indices in proportion to their weights.
+    """
+    def __init__(self, weights):
+        """
+        :type weights: array-like
+        :param weights:
+            The non-negative weight of each index. They don't need to add up
+            to anything in particular, but at least one must be positive.
+        """
+        weights = np.asarray(weights, dtype=np.float64)
+        size    = len(weights)
+        total   = float(weights.sum()) if size else 0.0
+        if total <= 0 or not np.isfinite(total) or np.any(weights < 0):
+            raise ValueError("Can't sample from weights totalling %s" % total)
+
+        # Scale the weights so that they average 1, and then pair up the ones
+        # below with the ones above. Anything left over at the end is
+        # (numerically close to) exactly 1.
+        scaled = (weights * (size / total)).tolist()
+        prob   = [1.0] * size
+        alias  = list(range(size))
+        small  = [i for (i, p) in enumerate(scaled) if p <  1.0]
+        large  = [i for (i, p) in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            prob [s] = scaled[s]
+            alias[s] = l
+            scaled[l] = (scaled[l] + scaled[s]) - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+
+        # We keep these as lists since picking single elements out of lists is
+        # quicker than out of arrays
+        self.size   = size
+        self._prob  = prob
+        self._alias = alias
+
+
+    def sample(self, rng=random):
+        """
+        Pick an index.
+
+        :type rng: random.Random
+        :param rng:
+            Where the randomness comes from.
+        """
+        i = int(rng.random() * self.size)
+        return i if rng.random() < self._prob[i] else self._alias[i]
+
+
+    def probabilities(self):
+        """
+        The probability of sampling each index, as worked back out from the
+        table. This is for checking it.
+        """
+        result = np.array(self._prob)
+        np.add.at(result, self._alias, 1.0 - result)
+        return result / self.size
@@ -0,0 +1,1151 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for picking fortunes.
+
+These run over a made-up corpus of fortune files, generated in a temporary
+directory, so that they can be run anywhere and at any size.
+"""
+
+from   fortune import Fortune
+from   history import History
+from   index   import minhash
+from   pink    import (Canvas, InkyDisplay, Pink, SSD1675Display,
+                       inky_buffer, layout, ssd1675_buffer)
+from   pink    import _paragraphs as pink_paragraphs, _wrap as pink_wrap
+from   server  import FortuneClient, FortuneServer
+
+import asyncio
+import multiprocessing
+import pack
+import threading
+
+import argparse
+import logging
+import math
+import numpy as np
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import watcher
+
+from   types   import SimpleNamespace
+
+# ----------------------------------------------------------------------
+
+# What the made-up fortunes are made up of
+_WORDS = ('the', 'a', 'computer', 'never', 'always', 'wisdom', 'fool', 'cat',
+          'time', 'love', 'money', 'work', 'program', 'bug', 'life', 'who',
+          'what', 'is', 'and', 'or', 'not', 'will', 'can', 'you', 'your',
+          'unix', 'mind', 'truth', 'day', 'night', 'old', 'new', 'man',
+          'woman', 'dog', 'sleep', 'think', 'know', 'happy', 'world')
+
+
+def make_corpus(directory, files, fortunes, seed=0, categories=('misc',)):
+    """
+    Make a fortune corpus.
+
+    :type directory: str
+    :param directory:
+        Where to put it.
+    :type files: int
+    :param files:
+        How many fortune files to make.
+    :type fortunes: int
+    :param fortunes:
+        How many fortunes to put in each.
+    :type categories: tuple
+    :param categories:
+        The sub-directories to spread the files over.
+
+    :return: The paths of the files.
+    """
+    rng   = random.Random(seed)
+    paths = []
+    for i in range(files):
+        subdir = os.path.join(directory, categories[i % len(categories)])
+        os.makedirs(subdir, exist_ok=True)
+        path = os.path.join(subdir, 'fortunes-%04d' % i)
+        write_fortunes(path,
+                       (make_fortune(rng) for _ in range(fortunes)))
+        paths.append(path)
+    return paths
+
+
+def make_fortune(rng):
+    """
+    Make up a fortune.
+    """
+    return '\n'.join(' '.join(rng.choice(_WORDS)
+                              for _ in range(rng.randint(3, 10)))
+                     for _ in range(rng.randint(1, 4)))
+
+
+def write_fortunes(path, fortunes, encoding=None):
+    """
+    Write a fortune file, and the data file which marks it as one.
+    """
+    with open(path, 'wt', encoding=encoding) as fh:
+        fh.write('%\n')
+        for fortune in fortunes:
+            fh.write(fortune)
+            fh.write('\n%\n')
+    with open(path + '.dat', 'wb'):
+        pass
+
+def evict(paths):
+    """
+    Ask the kernel to drop the given files, and everything under the given
+    directories, from the page cache; so that the next read of them is cold.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            evict(os.path.join(subdir, filename)
+                  for (subdir, _, files) in os.walk(path)
+                  for filename in files)
+            continue
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.fdatasync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def disk_usage(path):
+    """
+    How much space a file, or everything under a directory, takes up on disk;
+    as the ``(bytes, blocks in bytes)`` which it has, rounded up to blocks.
+    """
+    if os.path.isdir(path):
+        paths = [os.path.join(subdir, name)
+                 for (subdir, dirs, files) in os.walk(path)
+                 for name in dirs + files]
+    else:
+        paths = [path]
+    stats = [os.lstat(p) for p in paths]
+    return (sum(s.st_size for s in stats), sum(s.st_blocks for s in stats) * 512)
+
+# ----------------------------------------------------------------------
+
+def bench_pick(args):
+    """
+    Time picking fortunes from corpora of different sizes, rescanning the files
+    for each pick as it used to be done against keeping the file table up to
+    date with a watcher; and how long it takes for a new file to show up.
+    """
+    for files in args.files:
+        directory = tempfile.mkdtemp(prefix='fortune-bench-')
+        try:
+            make_corpus(directory, files, args.fortunes,
+                        categories=('a', 'b', 'c', 'd'))
+
+            for kind in args.watchers:
+                if kind == 'inotify':
+                    watch = watcher.InotifyWatcher(directory)
+                else:
+                    watch = watcher.PollingWatcher(directory)
+                fortune = Fortune(directory, max_length=args.max_length,
+                                  watch=watch, index_dir=None)
+
+                # Rescanning for each pick, which is what we used to do
+                start = time.perf_counter()
+                for _ in range(args.picks):
+                    fortune._update((directory,))
+                    fortune.pick()
+                rescan = (time.perf_counter() - start) / args.picks
+
+                # And with the watcher
+                start = time.perf_counter()
+                for _ in range(args.picks):
+                    fortune.pick()
+                watched = (time.perf_counter() - start) / args.picks
+
+                # Drop in a new file and see how long it takes to appear
+                path = os.path.join(directory, 'a', 'new-%s' % kind)
+                write_fortunes(path, ('Something new',))
+                start = time.perf_counter()
+                while path not in fortune._files:
+                    if time.perf_counter() - start > 10:
+                        break
+                    fortune.pick()
+                    time.sleep(0.001)
+                appeared = time.perf_counter() - start
+                watch.close()
+
+                print("%5d files %-7s: rescanning %8.1fus/pick, "
+                      "watching %6.1fus/pick, new file seen in %6.1fms" %
+                      (files, kind, rescan * 1e6, watched * 1e6,
+                       appeared * 1e3))
+        finally:
+            shutil.rmtree(directory)
+
+
+def bench_search(args):
+    """
+    Time building the index of a corpus, searching it by keywords and
+    categories, and updating it when a file changes.
+    """
+    directory = tempfile.mkdtemp(prefix='fortune-bench-')
+    try:
+        paths = make_corpus(directory, args.files, args.fortunes,
+                            categories=('computers', 'wisdom',
+                                        'off/art', 'off/racism'))
+        index_dir = os.path.join(directory, '.index')
+
+        # From scratch
+        start   = time.perf_counter()
+        fortune = Fortune(directory, max_length=args.max_length,
+                          index_dir=index_dir)
+        index   = fortune.index
+        built   = time.perf_counter() - start
+
+        # And loading it back again
+        start  = time.perf_counter()
+        loaded = Fortune(directory, max_length=args.max_length,
+                         index_dir=index_dir).index
+        load   = time.perf_counter() - start
+        print("%d fortunes in %d files, %d terms: "
+              "built in %0.2fs, loaded in %0.1fms" %
+              (index.size, args.files, len(loaded._terms),
+               built, load * 1e3))
+
+        # Searching
+        rng = random.Random(0)
+        for (query, categories) in ((None,                None          ),
+                                    ('unix',              None          ),
+                                    ('cat dog',           None          ),
+                                    (None,                ['computers'] ),
+                                    ('love money',        ['off/*']     ),
+                                    ('the old man think', ['wisdom']    )):
+            # Searching afresh each time, as if it was a different search
+            start = time.perf_counter()
+            for _ in range(args.picks):
+                index._searches.clear()
+                matches = len(index.search(query, categories, args.max_length))
+            fresh = (time.perf_counter() - start) / args.picks
+
+            # And picking, which will remember the search
+            start = time.perf_counter()
+            for _ in range(args.picks):
+                fortune.pick(query=query, categories=categories)
+            took = (time.perf_counter() - start) / args.picks
+            print("  query %-19r categories %-15r: %6d matches, "
+                  "%6.1fus/search %6.1fus/pick" %
+                  (query, categories, matches, fresh * 1e6, took * 1e6))
+
+        # Changing a file
+        write_fortunes(paths[0], (make_fortune(rng) for _ in range(args.fortunes)))
+        start = time.perf_counter()
+        index.sync(fortune._files.keys())
+        took = time.perf_counter() - start
+        print("Re-indexed one changed file in %0.1fms" % (took * 1e3,))
+    finally:
+        shutil.rmtree(directory)
+
+def bench_pack(args):
+    """
+    Compare picking from a pack against picking from the fortune files: how
+    big each is on disk, and how long it takes to start up and to pick with
+    nothing in the page cache.
+    """
+    directory = tempfile.mkdtemp(prefix='fortune-bench-', dir=args.tmp)
+    try:
+        tree      = os.path.join(directory, 'fortunes')
+        index_dir = os.path.join(directory, 'index')
+        make_corpus(tree, args.files, args.fortunes,
+                    categories=('computers', 'wisdom',
+                                'off/art', 'off/racism'))
+
+        # Build the tree's index ahead of time, as it would be normally
+        fortune = Fortune(tree, max_length=args.max_length,
+                          index_dir=index_dir)
+        fortune.index
+        fortune._watch.close()
+
+        for block_size in args.block_sizes:
+            filename = os.path.join(directory, 'fortunes-%d.pack' % block_size)
+            start = time.perf_counter()
+            pack.write(tree, fortune.files, filename, block_size=block_size)
+            packed = time.perf_counter() - start
+            (size, used) = disk_usage(filename)
+            print("Pack with %6d byte blocks: %9d bytes, %9d on disk, "
+                  "packed in %0.2fs" % (block_size, size, used, packed))
+        (size, used) = disk_usage(tree)
+        print("Fortune files:                %9d bytes, %9d on disk" %
+              (size, used))
+        (size, used) = disk_usage(index_dir)
+        print("And their index:              %9d bytes, %9d on disk" %
+              (size, used))
+
+        # Cold starts and picks, from the files and from each pack
+        sources = [('files', tree, (tree, index_dir))]
+        for block_size in args.block_sizes:
+            filename = os.path.join(directory, 'fortunes-%d.pack' % block_size)
+            sources.append(('%d pack' % block_size, filename, (filename,)))
+        for (name, source, cached) in sources:
+            starts = []
+            picks  = []
+            for _ in range(args.runs):
+                evict(cached)
+                start   = time.perf_counter()
+                fortune = Fortune(source, max_length=args.max_length,
+                                  index_dir=index_dir)
+                fortune.pick()
+                starts.append(time.perf_counter() - start)
+
+                for _ in range(args.picks):
+                    evict(cached)
+                    start = time.perf_counter()
+                    fortune.pick()
+                    picks.append(time.perf_counter() - start)
+                if fortune._watch is not None:
+                    fortune._watch.close()
+            starts.sort()
+            picks .sort()
+            print("  %-12s: cold start %7.1fms, cold pick %7.1fus median "
+                  "%7.1fus p90" %
+                  (name,
+                   starts[len(starts) // 2] * 1e3,
+                   picks [len(picks)  // 2] * 1e6,
+                   picks [len(picks) * 9 // 10] * 1e6))
+    finally:
+        shutil.rmtree(directory)
+
+
+def bench_history(args):
+    """
+    Check that nothing is picked again while it's in the no-repeat history,
+    including across a restart, and time picking with and without it.
+    """
+    directory = tempfile.mkdtemp(prefix='fortune-bench-')
+    try:
+        make_corpus(directory, args.files, args.fortunes)
+        filename = os.path.join(directory, '.history')
+
+        # Not every fortune file is UTF-8, and those have to be remembered too
+        rng = random.Random(1)
+        write_fortunes(os.path.join(directory, 'misc', 'latin-1'),
+                       ('%s caf\xe9' % make_fortune(rng)
+                        for _ in range(args.fortunes)),
+                       encoding='latin-1')
+
+        # Without it, how often do we see a repeat within the window
+        fortune = Fortune(directory, max_length=args.max_length,
+                          index_dir=None)
+        index   = fortune.index
+        start   = time.perf_counter()
+        plain   = [fortune.pick() for _ in range(args.picks)]
+        without = (time.perf_counter() - start) / args.picks
+
+        # With it, stopping half way through as if restarted
+        history = History(args.window, filename)
+        fortune = Fortune(directory, max_length=args.max_length,
+                          index_dir=None, history=history)
+        start   = time.perf_counter()
+        picked  = [fortune.pick() for _ in range(args.picks // 2)]
+        took    = time.perf_counter() - start
+        history.close()
+
+        history = History(args.window, filename)
+        fortune = Fortune(directory, max_length=args.max_length,
+                          index_dir=None, history=history)
+        start   = time.perf_counter()
+        picked += [fortune.pick() for _ in range(args.picks - len(picked))]
+        took   += time.perf_counter() - start
+        history.close()
+        took   /= args.picks
+
+        # And the way the server does it, only remembering once it's shown
+        history  = History(args.window, None)
+        fortune  = Fortune(directory, max_length=args.max_length,
+                           index_dir=None, history=history)
+        deferred = []
+        for _ in range(args.picks):
+            (text, fortune_hash) = fortune.pick(remember=False)
+            fortune.remember(fortune_hash)
+            deferred.append(text)
+
+        def repeats(texts):
+            last    = {}
+            repeats = 0
+            for (i, text) in enumerate(texts):
+                key = ' '.join(text.lower().split())
+                if key in last and i - last[key] <= args.window:
+                    repeats += 1
+                last[key] = i
+            return repeats
+
+        before = repeats(plain)
+        after  = repeats(picked)
+        later  = repeats(deferred)
+        print("%d fortunes, window of %d, %d picks" %
+              (index.size, args.window, args.picks))
+        print("  without history: %5d repeats in the window, %6.1fus/pick" %
+              (before, without * 1e6))
+        print("  with history:    %5d repeats in the window, %6.1fus/pick" %
+              (after, took * 1e6))
+        print("  remembered later: %5d repeats in the window" % later)
+
+        if args.check and (after or later):
+            print("FAILED")
+            sys.exit(1)
+    finally:
+        shutil.rmtree(directory)
+
+
+def bench_serve(args):
+    """
+    Time how many requests a second the fortune server can handle, with
+    different numbers of clients asking at once; against each of them picking
+    for themselves.
+    """
+    directory = tempfile.mkdtemp(prefix='fortune-bench-')
+    path      = os.path.join(directory, 'fortune.sock')
+    process   = None
+    try:
+        make_corpus(directory, args.files, args.fortunes)
+
+        # The server, in its own process as it would be
+        def serve():
+            logging.disable(logging.WARNING)
+            fortune = Fortune(directory, max_length=args.max_length,
+                              index_dir=None)
+            fortune.index
+            asyncio.run(FortuneServer(fortune, path).serve())
+        process = multiprocessing.Process(target=serve, daemon=True)
+        process.start()
+        start = time.monotonic()
+        while not os.path.exists(path):
+            if time.monotonic() - start > 30:
+                raise ValueError("Server didn't start")
+            time.sleep(0.01)
+
+        # What the displays look like
+        display = SimpleNamespace(width=args.width, height=args.height,
+                                  mode='P', white=0, black=1)
+
+        for op in args.ops:
+            for clients in args.clients:
+                counts = [0] * clients
+                stop   = threading.Event()
+                def ask(i):
+                    client = FortuneClient(path)
+                    while not stop.is_set():
+                        if op == 'pick':
+                            client.pick()
+                        else:
+                            client.frame(display)
+                        counts[i] += 1
+                    client.close()
+                threads = [threading.Thread(target=ask, args=(i,))
+                           for i in range(clients)]
+                start = time.perf_counter()
+                for thread in threads:
+                    thread.start()
+                time.sleep(args.seconds)
+                stop.set()
+                for thread in threads:
+                    thread.join()
+                took = time.perf_counter() - start
+                print("%-5s %3d clients: %8.1f requests/s" %
+                      (op, clients, sum(counts) / took))
+
+        # And each of them having their own, which costs the start up and the
+        # memory for each one
+        start   = time.perf_counter()
+        fortune = Fortune(directory, max_length=args.max_length,
+                          index_dir=None)
+        fortune.index
+        built   = time.perf_counter() - start
+        start   = time.perf_counter()
+        for _ in range(1000):
+            fortune.pick()
+        took    = (time.perf_counter() - start) / 1000
+        print("Local: %0.1fms to start, %8.1f picks/s" %
+              (built * 1e3, 1 / took))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.join()
+        shutil.rmtree(directory)
+
+
+def check_shared_duplicates():
+    """
+    Check that a fortune which is duplicated across categories can still be
+    picked when its canonical copy can't be: because that's in a category
+    which we didn't ask for, has no weight, or is too long.
+
+    :return: What went wrong, if anything.
+    """
+    shared    = "The only way to have a friend is to be one, they say."
+    spaced    = shared.replace(' ', '    ')
+    directory = tempfile.mkdtemp(prefix='fortune-bench-')
+    try:
+        rng = random.Random(0)
+        for (category, text) in (('aaa', spaced), ('bbb', shared)):
+            os.makedirs(os.path.join(directory, category))
+            write_fortunes(os.path.join(directory, category, 'fortunes'),
+                           [text] + [make_fortune(rng) for _ in range(5)])
+
+        problems = []
+        def check(what, ok):
+            if not ok:
+                problems.append(what)
+
+        fortune = Fortune(directory, index_dir=None)
+        index   = fortune.index
+        copies  = [i for i in index.live.tolist()
+                   if index.text(i).strip() in (shared, spaced)]
+        check("copies not clustered",
+              len(set(index.canonical[copies].tolist())) == 1)
+        bbb = [i for i in copies if index.text(i).strip() == shared]
+        def can_pick(ids):
+            return bool(np.isin(bbb, ids).all())
+
+        check("not picked from its other category",
+              can_pick(index.search(categories=['bbb'])))
+        check("not picked when its canonical copy is too long",
+              can_pick(index.search(max_length=len(shared) + 1)))
+        fortune.weights = [('aaa', 0)]
+        (ids, _) = fortune._alias_table(None, None)
+        check("not picked when its canonical copy has no weight",
+              can_pick(ids))
+        check("picked twice", len(np.intersect1d(ids, copies)) == 1)
+        return problems
+    finally:
+        shutil.rmtree(directory)
+
+
+def bench_dedup(args):
+    """
+    Make a corpus with known duplicates and near-duplicates in it, and see how
+    many of them indexing finds, what it gets wrong, and how quickly it goes.
+    """
+    rng       = random.Random(args.seed)
+    directory = tempfile.mkdtemp(prefix='fortune-bench-')
+    try:
+        # Each fortune is new, or a copy of an earlier one, which is either
+        # exact but for its case and spacing or has a bit added on the end
+        originals = []
+        origin_of = {}
+        kinds     = {}
+        for i in range(args.files):
+            fortunes = []
+            for _ in range(args.fortunes):
+                roll = rng.random()
+                if originals and roll < args.exact:
+                    (origin, text) = rng.choice(originals)
+                    text = '\n'.join('  '.join(line.upper().split())
+                                     for line in text.split('\n'))
+                    kind = 'exact'
+                elif originals and roll < args.exact + args.near:
+                    (origin, text) = rng.choice(originals)
+                    text = '%s\n    -- %s' % (text, rng.choice(('Anonymous',
+                                                             'Mark Twain',
+                                                             'Unknown')))
+                    kind = 'near'
+                else:
+                    text   = make_fortune(rng)
+                    origin = len(originals)
+                    originals.append((origin, text))
+                    kind = 'original'
+                fortunes.append(text)
+                kinds[text] = kind
+                origin_of.setdefault(text, origin)
+            write_fortunes(os.path.join(directory, 'fortunes-%04d' % i),
+                           fortunes)
+
+        # Index it
+        start   = time.perf_counter()
+        fortune = Fortune(directory, max_length=args.max_length,
+                          index_dir=None)
+        index   = fortune.index
+        built   = time.perf_counter() - start
+        live    = index.live
+        size    = sum(index.location(i)[2] for i in live.tolist())
+
+        # How much of that was the finding of the duplicates
+        texts = [index.text(i).encode() for i in live.tolist()]
+        start = time.perf_counter()
+        minhash(texts)
+        signing = time.perf_counter() - start
+        index._canonical = None
+        start = time.perf_counter()
+        canonical = index.canonical
+        clustering = time.perf_counter() - start
+
+        # What it found against what we put in. A copy is found if it's with
+        # its original, and anything is wrong if it's with something else's.
+        ids      = live.tolist()
+        origins  = np.array([origin_of[index.text(i)] for i in ids])
+        kind_of  = [kinds[index.text(i)] for i in ids]
+        position = dict((i, n) for (n, i) in enumerate(ids))
+        roots    = canonical[live]
+        root_origin = origins[[position[int(c)] for c in roots]]
+        found = dict((kind, [0, 0]) for kind in ('exact', 'near'))
+        for (kind, i, root, mine, theirs) in zip(kind_of, ids, roots.tolist(),
+                                                 origins, root_origin):
+            if kind in found:
+                found[kind][0] += 1
+                found[kind][1] += (root != i and mine == theirs)
+        wrong = int(np.count_nonzero(origins != root_origin))
+
+        clusters = index.clusters()
+        sizes    = np.bincount([len(c) for c in clusters]) if clusters else []
+        print("%d fortunes, %d distinct, in %d clusters of duplicates" %
+              (len(live), len(index.search()), len(clusters)))
+        print("  cluster sizes: %s" %
+              ', '.join('%d x %d' % (n, c) for (n, c) in enumerate(sizes) if c))
+        for kind in ('exact', 'near'):
+            (total, hit) = found[kind]
+            print("  %-5s duplicates: %5d of %5d found (%5.1f%%)" %
+                  (kind, hit, total, 100 * hit / max(1, total)))
+        print("  wrongly clustered: %d" % wrong)
+        for cluster in clusters[:args.show]:
+            print("  ---")
+            for i in cluster[:3].tolist():
+                print("    %5d: %r" % (i, index.text(i)[:60]))
+        print("Indexed %0.1fMB in %0.2fs: %0.0f fortunes/s, %0.2fMB/s; "
+              "signatures %0.2fs, clustering %0.1fms" %
+              (size / 1e6, built, len(live) / built, size / 1e6 / built,
+               signing, clustering * 1e3))
+
+        # And that deduplicating never hides a fortune which could be picked
+        shared = check_shared_duplicates()
+        print("  duplicates across categories: %s" %
+              ('; '.join(shared) if shared else 'OK'))
+
+        if args.check and (found['exact'][0] != found['exact'][1] or wrong or
+                           shared):
+            print("FAILED")
+            sys.exit(1)
+    finally:
+        shutil.rmtree(directory)
+
+
+def corpus_texts(args):
+    """
+    Get some fortunes to render: from the fortunes directory, if given, or
+    else made up.
+    """
+    if args.fortunes_dir:
+        fortune = Fortune(args.fortunes_dir, max_length=args.max_length,
+                          index_dir=None)
+        ids = fortune.index.search(max_length=args.max_length).tolist()
+        random.Random(0).shuffle(ids)
+        return [fortune.index.text(i) for i in ids[:args.count]]
+    rng = random.Random(0)
+    return [make_fortune(rng) for _ in range(args.count)]
+
+
+def bench_render(args):
+    """
+    Time rendering fortunes with the glyph atlas against with PIL, and see how
+    different the results are.
+    """
+    texts = [layout(text, args.max_cols) for text in corpus_texts(args)]
+    for (mode, white, black) in (('1',   1,               0        ),
+                                 ('P',   0,               1        ),
+                                 ('RGB', (255, 255, 255), (0, 0, 0))):
+        display = Canvas(args.width, args.height, mode, white, black)
+        results = {}
+        for (name, atlas) in (('pil', False), ('atlas', True)):
+            pink  = Pink(display, atlas=atlas)
+            times = []
+            inks  = []
+            for text in texts:
+                start = time.perf_counter()
+                image = pink.render(text)
+                times.append(time.perf_counter() - start)
+                pixels = np.array(image)
+                inks.append(pixels.min(axis=2) < 128 if mode == 'RGB'
+                            else pixels == black)
+            times.sort()
+            results[name] = inks
+            stats = ""
+            if pink.atlas is not None:
+                stats = ", %d glyphs rasterised, %d reused" % (
+                    pink.atlas.misses, pink.atlas.hits
+                )
+            print("%-3s %-5s: %6.2fms mean, %6.2fms p50, %6.2fms p90%s" %
+                  (mode, name,
+                   sum(times) / len(times) * 1e3,
+                   times[len(times) // 2] * 1e3,
+                   times[len(times) * 9 // 10] * 1e3,
+                   stats))
+
+        # PIL anti-aliases in RGB, so that's expected to be more different
+        differ = np.mean([np.mean(a != b) for (a, b) in zip(results['pil'],
+                                                             results['atlas'])])
+        print("    %0.2f%% of pixels differ" % (differ * 100,))
+
+
+def bench_fit(args):
+    """
+    Compare fitting fortunes to the display, by searching over how to wrap
+    them as well as what size to draw them, with wrapping them to a fixed
+    width: the font size which we get, how long it takes to render, and how
+    close the search comes to trying every width.
+    """
+    texts   = corpus_texts(args)
+    display = Canvas(args.width, args.height, '1', 1, 0)
+    pink    = Pink(display)
+    for text in texts:
+        # Have the glyphs in the atlas so as to time the layouts, not PIL
+        pink.render_ink(*pink.fit(text))
+
+    results = {}
+    for (name, fit) in (
+            ('fixed',  lambda text: (layout(text, args.max_cols), None)),
+            ('fitted', pink.fit),
+    ):
+        times = []
+        sizes = []
+        for text in texts:
+            start = time.perf_counter()
+            (laid_out, size) = fit(text)
+            if size is None:
+                size = pink._fit_size(tuple(laid_out.split('\n')))
+            pink.render_ink(laid_out, size)
+            times.append(time.perf_counter() - start)
+            sizes.append(size)
+        times.sort()
+        results[name] = sizes
+        print("%-6s: %6.2fms mean, %6.2fms p50, %6.2fms p90; "
+              "font size %5.1f mean, %3d min" %
+              (name,
+               sum(times) / len(times) * 1e3,
+               times[len(times) // 2] * 1e3,
+               times[len(times) * 9 // 10] * 1e3,
+               np.mean(sizes), min(sizes)))
+
+    # What trying every width would have found, and how many layouts the
+    # search needed to get there
+    evaluations = []
+    best        = []
+    for text in texts:
+        pink.fit(text)
+        evaluations.append(pink.evaluations)
+        words = [p.split() for p in pink_paragraphs(text)]
+        size  = 0
+        for cols in range(max(len(w) for p in words for w in p),
+                          max(len(' '.join(p)) for p in words) + 1):
+            lines = tuple(line for p in words for line in pink_wrap(p, cols))
+            size  = max(size, pink._fit_size(lines))
+        best.append(size)
+    fitted  = np.array(results['fitted'])
+    best    = np.array(best)
+    optimal = np.mean(fitted == best)
+    print("Fitted sizes are the best possible for %0.1f%% of fortunes, "
+          "%0.2f smaller on average; %0.1f layouts each, at most %d" %
+          (optimal * 100, np.mean(best - fitted),
+           np.mean(evaluations), max(evaluations)))
+    print("%0.1f%% of fortunes are bigger fitted, %0.1f%% smaller" %
+          (np.mean(fitted > np.array(results['fixed'])) * 100,
+           np.mean(fitted < np.array(results['fixed'])) * 100))
+
+    if args.check and (optimal < 0.95 or max(evaluations) > args.max_layouts):
+        print("FAILED")
+        sys.exit(1)
+
+
+class FakeSSD1675():
+    """
+    Looks like the Adafruit SSD1675 driver, without its SPI bus: what would
+    have been sent to the controller is kept in `sent`. Its `image()` is the
+    driver's, drawing a pixel at a time through the rotated frame buffer.
+    """
+    def __init__(self, width, height, rotation):
+        self._native  = (width, height)
+        self._stride  = (width + 7) // 8 * 8
+        self._buffer1 = bytearray(self._stride * height // 8)
+        self.rotation = rotation
+        self.sent     = []
+
+
+    @property
+    def width(self):
+        return self._native[rotation_axis(self.rotation)]
+
+
+    @property
+    def height(self):
+        return self._native[1 - rotation_axis(self.rotation)]
+
+
+    def image(self, image):
+        (width, height) = self._native
+        self._buffer1[:] = b'\xff' * len(self._buffer1)
+        pix = image.load()
+        for y in range(image.size[1]):
+            for x in range(image.size[0]):
+                pixel = pix[x, y]
+                if pixel[0] < 0x80 and pixel[1] < 0x80 and pixel[2] < 0x80:
+                    # The frame buffer's rotation
+                    (nx, ny) = (x, y)
+                    if self.rotation == 1:
+                        (nx, ny) = (width - y - 1, x)
+                    elif self.rotation == 2:
+                        (nx, ny) = (width - x - 1, height - y - 1)
+                    elif self.rotation == 3:
+                        (nx, ny) = (y, height - x - 1)
+                    bit = ny * self._stride + nx
+                    self._buffer1[bit // 8] &= ~(0x80 >> (bit % 8)) & 0xff
+
+
+    def display(self):
+        self.sent.append(bytes(self._buffer1))
+
+
+def rotation_axis(rotation):
+    """
+    Which of the native width and height is the width, for a rotation.
+    """
+    return rotation % 2
+
+
+class FakeInky():
+    """
+    Looks like a black and white Inky, without its SPI bus: what would have
+    been sent to the controller is kept in `sent`. Its `set_image()` and
+    `show()` are what the Inky library does.
+    """
+    WHITE = 0
+    BLACK = 1
+    RED   = 2
+
+    def __init__(self, width, height, rotation, h_flip, v_flip):
+        self.width      = width
+        self.height     = height
+        self.resolution = (width, height)
+        self.rotation   = rotation
+        self.h_flip     = h_flip
+        self.v_flip     = v_flip
+        self.colour     = 'black'
+        self.buf        = np.zeros((height, width), dtype=np.uint8)
+        self.sent       = []
+
+
+    def set_image(self, image):
+        self.buf = np.array(image, dtype=np.uint8).reshape((self.height,
+                                                            self.width))
+
+
+    def show(self):
+        region = self.buf
+        if self.v_flip:
+            region = np.fliplr(region)
+        if self.h_flip:
+            region = np.flipud(region)
+        if self.rotation:
+            region = np.rot90(region, self.rotation // 90)
+        buf_a = np.packbits(np.where(region == self.BLACK, 0, 1)).tolist()
+        buf_b = np.packbits(np.where(region == self.RED,   1, 0)).tolist()
+        self._update(buf_a, buf_b)
+
+
+    def _update(self, buf_a, buf_b):
+        self.sent.append((bytes(buf_a), bytes(buf_b)))
+
+
+def bench_framebuffer(args):
+    """
+    Time turning rendered frames into what the e-ink controllers want, straight
+    from the ink against via an image, and check that the bytes which would be
+    sent over SPI are the same either way.
+    """
+    texts  = [layout(text, args.max_cols) for text in corpus_texts(args)]
+    failed = False
+
+    # The SSD1675 in each of its rotations, and the Inky with each of its
+    # flips, for a landscape display
+    displays = []
+    for rotation in range(4):
+        (width, height) = (args.height, args.width)
+        if rotation_axis(rotation):
+            (width, height) = (height, width)
+        display = SSD1675Display.__new__(SSD1675Display)
+        display._display = FakeSSD1675(width, height, rotation)
+        displays.append(("ssd1675 rotation %d" % rotation,
+                         display,
+                         lambda ink, d=display._display:
+                             ssd1675_buffer(ink, d.rotation)))
+    for (rotation, h_flip, v_flip) in ((0,   False, False),
+                                       (90,  False, False),
+                                       (180, True,  False),
+                                       (270, False, True )):
+        (width, height) = (args.width, args.height)
+        display = InkyDisplay.__new__(InkyDisplay)
+        display._display = FakeInky(width, height, rotation, h_flip, v_flip)
+        displays.append(("inky %d%s%s" % (rotation,
+                                          " h_flip" if h_flip else "",
+                                          " v_flip" if v_flip else ""),
+                         display,
+                         lambda ink, d=display._display:
+                             inky_buffer(ink, d)))
+
+    for (name, display, convert) in displays:
+        pink = Pink(display)
+        inks = [pink.render_ink(text).copy() for text in texts]
+
+        # Just the conversion, and the whole thing into the fake SPI
+        packing = []
+        for ink in inks:
+            start = time.perf_counter()
+            convert(ink)
+            packing.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        for ink in inks:
+            display.display_ink(ink)
+        direct = (time.perf_counter() - start) / len(inks)
+
+        # Whatever the driver next sends, without being given anything new,
+        # should still be the last frame
+        fake    = display._display
+        repaint = getattr(fake, 'show', None) or fake.display
+        repaint()
+        stale   = fake.sent.pop() != fake.sent[-1]
+
+        start = time.perf_counter()
+        for ink in inks:
+            display.display_image(pink._to_image(ink))
+        via_image = (time.perf_counter() - start) / len(inks)
+
+        sent    = display._display.sent
+        differ  = sum(a != b for (a, b) in zip(sent[:len(inks)],
+                                               sent[len(inks):]))
+        packing.sort()
+        p99     = packing[min(len(packing) - 1, len(packing) * 99 // 100)]
+        print("%-22s: packing %6.1fus mean, %6.1fus p99; "
+              "to SPI %7.2fms direct, %7.2fms via image; %d differ%s" %
+              (name,
+               sum(packing) / len(packing) * 1e6, p99 * 1e6,
+               direct * 1e3, via_image * 1e3, differ,
+               ", stale after" if stale else ""))
+        if differ or stale or p99 > args.budget / 1e3:
+            failed = True
+
+    if args.check and failed:
+        print("FAILED")
+        sys.exit(1)
+
+
+def bench_weights(args):
+    """
+    Check that picking with category weights gives each category as many
+    picks as it should, using a chi-squared test, and time building the alias
+    table and picking from it.
+    """
+    directory = tempfile.mkdtemp(prefix='fortune-bench-')
+    try:
+        make_corpus(directory, args.files, args.fortunes,
+                    categories=('computers', 'wisdom',
+                                'off/art', 'off/racism'))
+        weights = {'wisdom' : args.wisdom,
+                   'off/*'  : 0}
+        fortune = Fortune(directory, max_length=args.max_length,
+                          index_dir=None, weights=weights)
+        index   = fortune.index
+
+        # Building the table
+        start = time.perf_counter()
+        (ids, alias) = fortune._alias_table(None, None)
+        built = time.perf_counter() - start
+
+        # What we expect, by category
+        per_category = np.ones(len(index.category_names))
+        for (pattern, weight) in fortune.weights:
+            per_category[index.category_mask((pattern,))] = weight
+        counts   = np.bincount(index.category_of[ids],
+                               minlength=len(per_category))
+        expected = counts * per_category
+        expected = expected / expected.sum() * args.picks
+
+        # Picking, counting what we get
+        rng      = random.Random(args.seed)
+        picked   = [0] * args.picks
+        start    = time.perf_counter()
+        for i in range(args.picks):
+            picked[i] = ids[alias.sample(rng)]
+        took     = (time.perf_counter() - start) / args.picks
+        observed = np.bincount(index.category_of[np.array(picked)],
+                               minlength=len(per_category))
+
+        # Pearson's chi-squared over the categories which we can get, with
+        # the Wilson-Hilferty approximation for the p-value so as to not need
+        # scipy
+        can   = expected > 0
+        chi2  = float((((observed[can] - expected[can]) ** 2) /
+                       expected[can]).sum())
+        dof   = max(1, int(can.sum()) - 1)
+        z     = (((chi2 / dof) ** (1 / 3) - (1 - 2 / (9 * dof))) /
+                 math.sqrt(2 / (9 * dof)))
+        p     = 0.5 * math.erfc(z / math.sqrt(2))
+        never = int(observed[~can].sum())
+
+        for (name, number) in sorted(zip(index.category_names,
+                                         range(len(per_category)))):
+            print("  %-12s weight %4.1f: expected %8.1f, got %7d" %
+                  (name, per_category[number], expected[number],
+                   observed[number]))
+        print("Table of %d fortunes built in %0.1fms, %0.2fus/pick" %
+              (len(ids), built * 1e3, took * 1e6))
+        print("chi2=%0.2f with %d dof, p=%0.4f; %d picks of zero weight" %
+              (chi2, dof, p, never))
+
+        if args.check and (p < 0.001 or never):
+            print("FAILED")
+            sys.exit(1)
+    finally:
+        shutil.rmtree(directory)
+
+# ----------------------------------------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest='bench')
+    subparsers.required = True
+
+    sub = subparsers.add_parser('pick', help=bench_pick.__doc__)
+    sub.add_argument('--files', type=int, nargs='+', default=[10, 100, 1000])
+    sub.add_argument('--fortunes', type=int, default=100,
+                     help='How many fortunes in each file')
+    sub.add_argument('--picks', type=int, default=200)
+    sub.add_argument('--max-length', type=int, default=800)
+    sub.add_argument('--watchers', nargs='+', default=['inotify', 'polling'],
+                     choices=['inotify', 'polling'])
+    sub.set_defaults(function=bench_pick)
+
+    sub = subparsers.add_parser('search', help=bench_search.__doc__)
+    sub.add_argument('--files', type=int, default=400)
+    sub.add_argument('--fortunes', type=int, default=100,
+                     help='How many fortunes in each file')
+    sub.add_argument('--picks', type=int, default=1000)
+    sub.add_argument('--max-length', type=int, default=800)
+    sub.set_defaults(function=bench_search)
+
+    sub = subparsers.add_parser('pack', help=bench_pack.__doc__)
+    sub.add_argument('--files', type=int, default=400)
+    sub.add_argument('--fortunes', type=int, default=100,
+                     help='How many fortunes in each file')
+    sub.add_argument('--block-sizes', type=int, nargs='+',
+                     default=[4096, 8192, 32768])
+    sub.add_argument('--runs', type=int, default=5,
+                     help='How many times to start up')
+    sub.add_argument('--picks', type=int, default=100,
+                     help='How many picks after each start')
+    sub.add_argument('--max-length', type=int, default=800)
+    sub.add_argument('--tmp', default=None,
+                     help='Where to make the corpus, e.g. on the SD card')
+    sub.set_defaults(function=bench_pack)
+
+    sub = subparsers.add_parser('history', help=bench_history.__doc__)
+    sub.add_argument('--files', type=int, default=20)
+    sub.add_argument('--fortunes', type=int, default=100,
+                     help='How many fortunes in each file')
+    sub.add_argument('--window', type=int, default=1000)
+    sub.add_argument('--picks', type=int, default=10000)
+    sub.add_argument('--max-length', type=int, default=800)
+    sub.add_argument('--check', action='store_true',
+                     help='Exit with an error if anything was repeated')
+    sub.set_defaults(function=bench_history)
+
+    sub = subparsers.add_parser('serve', help=bench_serve.__doc__)
+    sub.add_argument('--files', type=int, default=100)
+    sub.add_argument('--fortunes', type=int, default=100,
+                     help='How many fortunes in each file')
+    sub.add_argument('--max-length', type=int, default=800)
+    sub.add_argument('--clients', type=int, nargs='+', default=[1, 4, 16])
+    sub.add_argument('--ops', nargs='+', default=['pick', 'frame'],
+                     choices=['pick', 'frame'])
+    sub.add_argument('--width', type=int, default=212,
+                     help='The width of the displays to render for')
+    sub.add_argument('--height', type=int, default=104,
+                     help='The height of the displays to render for')
+    sub.add_argument('--seconds', type=float, default=2.0,
+                     help='How long to ask for')
+    sub.set_defaults(function=bench_serve)
+
+    sub = subparsers.add_parser('dedup', help=bench_dedup.__doc__)
+    sub.add_argument('--files', type=int, default=100)
+    sub.add_argument('--fortunes', type=int, default=200,
+                     help='How many fortunes in each file')
+    sub.add_argument('--exact', type=float, default=0.05,
+                     help='The fraction of exact duplicates')
+    sub.add_argument('--near', type=float, default=0.05,
+                     help='The fraction of near-duplicates')
+    sub.add_argument('--max-length', type=int, default=800)
+    sub.add_argument('--show', type=int, default=3,
+                     help='How many clusters to show')
+    sub.add_argument('--seed', type=int, default=0)
+    sub.add_argument('--check', action='store_true',
+                     help='Exit with an error if any exact duplicates were '
+                          'missed or anything was wrongly clustered')
+    sub.set_defaults(function=bench_dedup)
+
+    sub = subparsers.add_parser('render', help=bench_render.__doc__)
+    sub.add_argument('--fortunes-dir', default=None,
+                     help='Where to get the fortunes from, if not made up')
+    sub.add_argument('--count', type=int, default=200,
+                     help='How many fortunes to render')
+    sub.add_argument('--max-length', type=int, default=800)
+    sub.add_argument('--max-cols', type=int, default=36)
+    sub.add_argument('--width', type=int, default=212)
+    sub.add_argument('--height', type=int, default=104)
+    sub.set_defaults(function=bench_render)
+
+    sub = subparsers.add_parser('fit', help=bench_fit.__doc__)
+    sub.add_argument('--fortunes-dir', default=None,
+                     help='Where to get the fortunes from, if not made up')
+    sub.add_argument('--count', type=int, default=200,
+                     help='How many fortunes to fit')
+    sub.add_argument('--max-length', type=int, default=800)
+    sub.add_argument('--max-cols', type=int, default=36,
+                     help='The fixed width to compare with')
+    sub.add_argument('--width', type=int, default=212)
+    sub.add_argument('--height', type=int, default=104)
+    sub.add_argument('--max-layouts', type=int, default=12,
+                     help='The most layouts which fitting may take')
+    sub.add_argument('--check', action='store_true',
+                     help='Exit with an error if the search misses the best '
+                          'size too often, or takes too many layouts')
+    sub.set_defaults(function=bench_fit)
+
+    sub = subparsers.add_parser('framebuffer', help=bench_framebuffer.__doc__)
+    sub.add_argument('--fortunes-dir', default=None,
+                     help='Where to get the fortunes from, if not made up')
+    sub.add_argument('--count', type=int, default=100,
+                     help='How many fortunes to render')
+    sub.add_argument('--max-length', type=int, default=800)
+    sub.add_argument('--max-cols', type=int, default=36)
+    sub.add_argument('--width', type=int, default=250)
+    sub.add_argument('--height', type=int, default=122)
+    sub.add_argument('--budget', type=float, default=10.0,
+                     help='The most that packing a frame may take, in ms')
+    sub.add_argument('--check', action='store_true',
+                     help='Exit with an error if the bytes differ, or the '
+                          'packing is over budget')
+    sub.set_defaults(function=bench_framebuffer)
+
+    sub = subparsers.add_parser('weights', help=bench_weights.__doc__)
+    sub.add_argument('--files', type=int, default=40)
+    sub.add_argument('--fortunes', type=int, default=100,
+                     help='How many fortunes in each file')
+    sub.add_argument('--picks', type=int, default=200000)
+    sub.add_argument('--max-length', type=int, default=800)
+    sub.add_argument('--wisdom', type=float, default=5,
+                     help='The weight of the wisdom category')
+    sub.add_argument('--seed', type=int, default=0)
+    sub.add_argument('--check', action='store_true',
+                     help='Exit with an error if the check fails')
+    sub.set_defaults(function=bench_weights)
+
+    args = parser.parse_args()
+    args.function(args)
@@ -3,55 +3,61 @@
 Read fortunes and display them on an eink display.
 """
 
-from   fortune import Fortune
 from   pink    import Pink, InkyDisplay
+from   server  import FortuneClient
 
+import fortune
+import metrics
 import socket
 import time
 
+# Where the fortune server is, if there is one. Without it we pick our own.
+_SERVER_SOCKET = '/tmp/fortunate.sock'
+
+# Where to serve the metrics from, or None to not do so
+_METRICS_SOCKET = '/tmp/fortunate.metrics.sock'
+
+# The metrics which we record as we go
+_PICK_TIME    = metrics.histogram('fortunate_pick_seconds',
+                                  'Time taken to pick a fortune')
+_RENDER_TIME  = metrics.histogram('fortunate_render_seconds',
+                                  'Time taken to render a fortune')
+_REFRESH_TIME = metrics.histogram('fortunate_refresh_seconds',
+                                  'Time taken to refresh the display')
+_MISSES       = metrics.counter  ('fortunate_misses_total',
+                                  'Times we failed to pick a fortune')
+
 def main():
     # What and how we print to the display
-    fortune = Fortune(max_length=800)
+    source  = FortuneClient(_SERVER_SOCKET,
+                            fallback=lambda: fortune.create(max_length=800))
     pink    = Pink(InkyDisplay())
-    max_cols = 36
+
+    # Let people see how we are doing
+    if _METRICS_SOCKET:
+        metrics.serve(_METRICS_SOCKET)
 
     # Do this forever
     while True:
-        text = fortune.pick()
+        # The server might have rendered it for us already
+        with _PICK_TIME.time():
+            (text, image) = source.frame(pink.display)
         if not text:
+            _MISSES.inc()
             continue
-        text = text.split('\n')
-        line_length = max(len(line) for line in text)
-        if line_length > max_cols:
-            max_length = line_length // 2
-        else:
-            max_length = max_cols
-
-        lines = []
-        for line in text:
-            line = line.strip()
-            if not line:
-                continue
-            line = ' '.join(line.split())
-            if len(line) > max_length:
-                line1 = ''
-                line2 = ''
-                for word in line.split():
-                    if len(line1) < max_length:
-                        line1 = '%s%s ' % (line1, word)
-                    else:
-                        line2 = '%s%s ' % (line2, word)
-                if line1:
-                    lines.append(line1.strip()) 
-                if line2:
-                    lines.append(line2.strip())
-            else:
-                lines.append(line)
-        text = '\n'.join(lines)
 
         print('=' * 30)
         print(text)
-        pink.write(text)
+        if image is None:
+            # Render it ourselves, wrapped to be as big as it can be, straight
+            # into the display's bits
+            with _RENDER_TIME.time():
+                ink = pink.render_ink(*pink.fit(text))
+            with _REFRESH_TIME.time():
+                pink.show_ink(ink)
+        else:
+            with _REFRESH_TIME.time():
+                pink.show(image)
 
         # And wait 3 mins before reading again
         until = time.time() + 3 * 60
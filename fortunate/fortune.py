@@ -3,9 +3,23 @@
 """
 
 
+import argparse
 import logging as LOG
+import numpy as np
 import os
-import random
+import pack
+import watcher
+
+from   alias   import AliasTable
+from   history import History, HISTORY_SIZE
+from   index   import FortuneIndex, INDEX_DIR
+from   pack    import FortunePack
+
+# ----------------------------------------------------------------------
+
+# The category weights which we use by default, if they are there
+WEIGHTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'weights.conf')
 
 # ----------------------------------------------------------------------
 
@@ -14,122 +28,446 @@ class Fortune():
     A service which pulls out text from the fortune files and delivers it to the
     user.
     """
+    # How many alias tables, for different searches, we keep around
+    _MAX_TABLES = 16
+
+    # How many recently shown fortunes we'll throw back, for each pick, before
+    # we give up and show one again
+    _MAX_REJECTS = 100
+
     def __init__(self,
                  fortunes_dir="/usr/share/games/fortunes",
-                 max_length  =200):
+                 max_length  =200,
+                 watch       =None,
+                 index_dir   =INDEX_DIR,
+                 weights     =None,
+                 history     =None):
         """
         @see Service.__init__()
         
         :type fortunes_dir: str
         :param fortunes_dir:
-            The location of the fortune data files.
+            The location of the fortune data files, or of a pack of them as
+            made by `pack.write()`.
         :type max_length: int
         :param max_length:
             The maximum length of a selected fortune, in bytes.
+        :type watch: watcher.Watcher
+        :param watch:
+            What tells us about changes to the fortune files, if not the
+            default one for the directory. Packs aren't watched by default.
+        :type index_dir: str
+        :param index_dir:
+            Where to keep the index of the fortunes, or `None` to not keep it
+            on disk.
+        :type weights: list
+        :param weights:
+            The weights of the categories, as ``(pattern, weight)`` pairs,
+            where the later patterns take precedence. See `load_weights()`.
+        :type history: history.History
+        :param history:
+            The fortunes which were shown recently, which we won't pick again
+            until they drop out of it; or `None` to not care.
         """
-        self._dir     = fortunes_dir
+        self._dir     = os.path.abspath(fortunes_dir)
         self._max_len = int(max_length)
 
+        # If we were given a pack then that's all the fortunes, in one file.
+        # Rather than watching the directory which it's in, which could be
+        # most of the filesystem, we look at whether it was replaced on each
+        # pick, which is just a stat.
+        self._pack = os.path.isfile(self._dir)
+
+        # The fortune files which we know about, and their sizes. We keep this
+        # up to date by looking at what the watcher tells us has changed,
+        # rather than rescanning everything for every pick, so that new files
+        # show up without us having to be restarted.
+        if watch is None and not self._pack:
+            watch = watcher.create(self._dir)
+        self._watch = watch
+        self._files = {}
+        self._update((self._dir,))
+
+        # How much to weight each category by, and the alias tables which we
+        # pick from, which are built from those and the index when needed
+        self._weights = ()
+        self._tables  = {}
+        self._tables_index   = None
+        self._tables_version = None
+        self.weights = weights
+
+        # The index of the fortunes, for searching, which we load when it's
+        # first needed and which is brought up to date when the files change
+        self._index_dir   = index_dir
+        self._index       = None
+        self._index_dirty = True
+        self._pack_key    = None
+
+        # What we showed recently
+        self._history = history
 
-    def pick(self):
+
+    def pick(self, query=None, categories=None, remember=True):
         """
         Choose a random fortune. This is the meat of this class.
+
+        :type query: str
+        :param query:
+            If given, only pick fortunes with all the words in this.
+        :type categories: iterable
+        :param categories:
+            If given, only pick fortunes from these categories. These are the
+            files' paths under the fortunes directory, e.g. ``computers``, and
+            may be glob patterns, e.g. ``off/*``.
+        :type remember: bool
+        :param remember:
+            Whether to put the fortune in the history now, or to leave it to a
+            `remember()` for when it's actually shown.
+
+        :return: The fortune, or `None` if we couldn't find one. Without
+                 `remember` this is a ``(fortune, fingerprint)`` tuple instead,
+                 to hand the fingerprint to `remember()`.
         """
-        # We do this all from scratch each time since it's not _that_ expensive
-        # and it means we don't have to restart anything when new files are
-        # added. We have a list of filenames and the start and end of their data
-        # as part of the total count.
-        #
-        # We are effectively concatenating the files here so as to avoid
-        # bias. Consider: if you have two files, with one twice the size of the
-        # other, if we picked a random fortune from a random file then then
-        # fortunes in the smallee file would be twice as likely to come up as
-        # ones in the bigger one.
-        file_info = []
-        total_size = 0
-        for (subdir, _, files) in os.walk(self._dir, followlinks=True):
-            for filename in files:
-                # The fortune files have an associated .dat file, this means we
-                # can identify them by looking for that .dat file.
-                path = os.path.join(subdir, filename)
-                dat_path = path + '.dat'
-                LOG.debug("Candidate: %s %s", path, dat_path)
-                if os.path.exists(dat_path):
-                    # Open it to make sure can do so
-                    try:
-                        with open(path, 'rt'):
-                            # Get the file length to use it to accumulate into
-                            # our running counter, and to compute the file-
-                            # specifc stats.
-                            stat = os.stat(path)
-
-                            # The start of the file is the current total_size
-                            # and the end is that plus the file size
-                            start = total_size
-                            total_size += stat.st_size
-                            end = total_size
-                            file_info.append((path, start, end))
-                            LOG.debug("Adding %s[%d:%d]", path, start, end)
-                    except Exception as e:
-                        LOG.debug("Failed to add %s: %s", path, e)
+        # Bring the file table up to date. This is a cheap check unless
+        # something has changed. An unwatched pack is looked at every time,
+        # and only reopened if it was replaced.
+        if self._watch is None:
+            self._index_dirty = True
+        else:
+            changed = self._watch.changes()
+            if changed:
+                self._update(changed)
 
+        # We pick from the individual fortunes, each in proportion to the
+        # weight of its category. With the same weights everywhere that makes
+        # every fortune equally likely, no matter which file it's in.
+        table = self._alias_table(query, categories)
+        if table is None:
+            return None if remember else (None, None)
+        (ids, alias) = table
 
         # Keep trying this until we get something, or until we give up. Most of
         # the time we expect this to work on the first go unless something weird
-        # is going on.
-        for tries in range(10):
-            LOG.debug("Try #%d", tries)
-
-            # Now that we have a list of files, pick one at random by choosing a
-            # point somewhere in there
-            offset = random.randint(0, total_size)
-            LOG.debug("Picked offset %d", offset)
-
-            # Now we look for the file which contains that offset
-            for (filename, start, end) in file_info:
-                if start <= offset < end:
-                    with open(filename, 'rt') as fh:
-                        # Jump to the appropriate point in the file, according to
-                        # the offset (relative to the files's start in the overall
-                        # set)
-                        seek_offset = offset - start
-                        if seek_offset > 0:
-                            fh.seek(seek_offset)
-
-                        try:
-                            # Now look for the bracketing '%'s. Read in a nice big
-                            # chunk and hunt for it in there.
-                            chunk = fh.read(min(10 * self._max_len, 1024 * 1024))
-
-                            # The file could start with a bracketer and we want
-                            # to catch that
-                            if seek_offset == 0 and chunk.startswith('%\n'):
-                                s = 2
-                            else:
-                                s = chunk.index('\n%\n') + 3
-
-                            # Now look for the end. A properly-formed file
-                            # should have a '%\n' as its last line.
-                            e = chunk.index('\n%\n', s)
-
-                            # We found a match. Is it small enough?
-                            LOG.debug("Found section %s[%d:%d]", filename, s, e)
-                            if (e - s) > self._max_len:
-                                # Nope, go around and try again
-                                break
-                            else:
-                                # Yes!
-                                return chunk[s:e]
-
-                        except ValueError:
-                            # Find to match so give up and go around again
-                            break
+        # is going on, like a file changing under us.
+        index    = self.index
+        history  = self._history
+        rejected = 0
+        tries    = 0
+        while tries < 10:
+            fortune_id   = int(ids[alias.sample()])
+            fortune_hash = int(index.fingerprints[fortune_id])
+
+            # Anything shown recently gets thrown back, which we can tell
+            # without reading it. If most of what we could pick was shown
+            # recently then we'll have to show something again.
+            if history is not None:
+                if fortune_hash in history and rejected < self._MAX_REJECTS:
+                    rejected += 1
+                    continue
+
+            tries += 1
+            LOG.debug("Try #%d: fortune %d", tries, fortune_id)
+            text = index.text(fortune_id)
+            if text:
+                if not remember:
+                    return (text, fortune_hash)
+                if history is not None:
+                    history.add(fortune_hash)
+                return text
 
         # If we got here then we gave up trying
-        return None
+        return None if remember else (None, None)
+
+
+    def remember(self, fortune_hash):
+        """
+        Put a fortune, from `pick(remember=False)`, in the history now that it
+        has been shown.
+
+        :type fortune_hash: int
+        :param fortune_hash:
+            The fingerprint which `pick()` gave back with the fortune, or
+            `None` if it didn't find one.
+        """
+        if self._history is not None and fortune_hash is not None:
+            self._history.add(fortune_hash)
+
+
+    @property
+    def weights(self):
+        """
+        The weights of the categories, as ``(pattern, weight)`` pairs. Anything
+        which doesn't match any of the patterns has a weight of 1.
+        """
+        return self._weights
+
+
+    @weights.setter
+    def weights(self, weights):
+        if isinstance(weights, dict):
+            weights = weights.items()
+        weights = tuple((str(pattern), float(weight))
+                        for (pattern, weight) in (weights or ()))
+        for (pattern, weight) in weights:
+            if weight < 0:
+                raise ValueError("Negative weight for %s: %s" %
+                                 (pattern, weight))
+        self._weights = weights
+        self._tables.clear()
+
+
+    @property
+    def files(self):
+        """
+        The paths of the fortune files which we know about. This is empty if
+        we are reading from a pack.
+        """
+        return tuple(sorted(self._files.keys()))
+
+
+    @property
+    def index(self):
+        """
+        The `FortuneIndex` of all the fortunes, brought up to date.
+        """
+        if self._pack:
+            # Reopen the pack if it changed
+            if self._index_dirty:
+                self._open_pack()
+            return self._index
+
+        if self._index is None:
+            self._index = FortuneIndex.load(self._dir, self._index_dir)
+        if self._index_dirty:
+            if self._index.sync(self._files.keys()) and self._index_dir:
+                self._index.save(self._index_dir)
+            self._index_dirty = False
+        return self._index
+
+
+    def _alias_table(self, query, categories):
+        """
+        Get the alias table for picking the fortunes which match the given
+        query and categories, building it if need be.
+
+        :return: The matching fortune IDs and the `AliasTable` for picking
+                 from them, or `None` if there are none.
+        """
+        # Only rebuild things when the index, or the weights, change
+        index = self.index
+        if (self._tables_index   is not index or
+            self._tables_version !=     index.version):
+            self._tables.clear()
+            self._tables_index   = index
+            self._tables_version = index.version
+
+        if isinstance(categories, str):
+            categories = (categories,)
+        key = (query, None if categories is None else tuple(categories))
+        if key in self._tables:
+            return self._tables[key]
+
+        # Only one of each cluster of duplicates is picked, but which one can
+        # only be decided once the ones which can't be picked are gone
+        table = None
+        ids   = index.search(query=query,
+                             categories=categories,
+                             max_length=self._max_len,
+                             distinct=False)
+        if len(ids):
+            # The weight of each fortune is that of its category, and those
+            # with none are never picked
+            category_weights = np.ones(len(index.category_names))
+            for (pattern, weight) in self._weights:
+                category_weights[index.category_mask((pattern,))] = weight
+            ids     = ids[category_weights[index.category_of[ids]] > 0]
+            ids     = index.distinct(ids)
+            weights = category_weights[index.category_of[ids]]
+            if len(ids):
+                table = (ids, AliasTable(weights))
+
+        # Remember it for next time, but not too much
+        if len(self._tables) >= self._MAX_TABLES:
+            self._tables.clear()
+        self._tables[key] = table
+        return table
+
+
+    def _update(self, paths):
+        """
+        Bring the file table up to date for the given paths, which may be files
+        or directories, and which may or may not still exist.
+        """
+        if self._pack:
+            # All we care about is the pack itself
+            if any(self._dir == path or self._dir.startswith(path + os.sep)
+                   for path in paths):
+                self._index_dirty = True
+            return
+
+        for path in paths:
+            # A data file changing means that its fortune file might have
+            # become, or stopped being, one which we can use
+            if path.endswith('.dat'):
+                path = path[:-len('.dat')]
+
+            if os.path.isdir(path):
+                # Anything under here might have changed
+                self._remove(path)
+                for (subdir, _, files) in os.walk(path, followlinks=True):
+                    for filename in files:
+                        self._add(os.path.join(subdir, filename))
+            elif path in self._files or os.path.exists(path):
+                self._add(path)
+            else:
+                # Either something which we didn't care about, or a directory
+                # which has gone away
+                self._remove(path)
+
+        # The index will need updating
+        self._index_dirty = True
+
+
+    def _open_pack(self):
+        """
+        Open the pack, keeping the one we have if we can't.
+        """
+        try:
+            stat = os.stat(self._dir)
+            key  = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+            if self._index is None or self._pack_key != key:
+                index = FortunePack(self._dir)
+                if self._index is not None:
+                    self._index.close()
+                self._index    = index
+                self._pack_key = key
+        except (IOError, OSError, KeyError, ValueError) as e:
+            if self._index is None:
+                raise
+            LOG.warning("Keeping the old pack, can't open %s: %s",
+                        self._dir, e)
+        self._index_dirty = False
+
+
+    def _add(self, path):
+        """
+        Add a file to the file table, if it's a fortune file, or else make sure
+        that it's not in there.
+        """
+        # The fortune files have an associated .dat file, this means we can
+        # identify them by looking for that .dat file.
+        dat_path = path + '.dat'
+        LOG.debug("Candidate: %s %s", path, dat_path)
+        try:
+            if os.path.exists(dat_path):
+                # Open it to make sure can do so, and get the file length to
+                # use it to accumulate into our running counter
+                with open(path, 'rt'):
+                    size = os.stat(path).st_size
+                if size > 0:
+                    self._files[path] = size
+                    LOG.debug("Adding %s[%d]", path, size)
+                    return
+        except Exception as e:
+            LOG.debug("Failed to add %s: %s", path, e)
+        self._files.pop(path, None)
+
+
+    def _remove(self, path):
+        """
+        Remove a file, or everything under a directory, from the file table.
+        """
+        prefix = path + os.sep
+        for filename in tuple(self._files.keys()):
+            if filename == path or filename.startswith(prefix):
+                del self._files[filename]
+
+
+
+def load_weights(filename):
+    """
+    Read the category weights from a file. Each line is a category, or a
+    pattern, and its weight, e.g.::
+
+        wisdom = 5
+        off/*  = 0
+
+    Blank lines, and ones starting with ``#``, are ignored.
+
+    :return: The ``(pattern, weight)`` pairs, in the order in which they
+             appear in the file.
+    """
+    weights = []
+    with open(filename, 'rt') as fh:
+        for (number, line) in enumerate(fh, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                (pattern, weight) = line.split('=', 1)
+                weights.append((pattern.strip(), float(weight)))
+            except ValueError:
+                raise ValueError("Bad line %d in %s: %s" %
+                                 (number, filename, line))
+    return weights
+
+
+
+def create(max_length=200, history_size=HISTORY_SIZE, **kwargs):
+    """
+    Create a `Fortune` set up the way that the daemons use it, with the weights
+    in `WEIGHTS_FILE`, if it's there, and a persistent history.
+
+    :type history_size: int
+    :param history_size:
+        How many of the last fortunes shown not to show again, or 0 for any.
+    :param kwargs:
+        Anything else to give to `Fortune`.
+    """
+    if os.path.exists(WEIGHTS_FILE):
+        kwargs.setdefault('weights', load_weights(WEIGHTS_FILE))
+    if history_size:
+        kwargs.setdefault('history', History(history_size))
+    return Fortune(max_length=max_length, **kwargs)
 
 
 
 if __name__ == "__main__":
-    fortune = Fortune()
-    print(fortune.pick())
+    parser = argparse.ArgumentParser(description="Pick a fortune, or pack "
+                                                 "up the fortune files.")
+    parser.add_argument('--fortunes', default="/usr/share/games/fortunes",
+                        help="The fortunes directory, or a pack")
+    subparsers = parser.add_subparsers(dest='command')
+
+    sub = subparsers.add_parser('pick', help="Pick a fortune (the default)")
+    sub.add_argument('query', nargs='*',
+                     help="Words which the fortune must have in it")
+
+    sub = subparsers.add_parser('dups', help="Show the duplicate fortunes")
+
+    sub = subparsers.add_parser('pack', help="Pack up the fortune files")
+    sub.add_argument('filename', help="Where to put the pack")
+    sub.add_argument('--block-size', type=int, default=pack.BLOCK_SIZE,
+                     help="How much text to put in each compressed block")
+
+    args = parser.parse_args()
+    if args.command == 'pack':
+        fortune = Fortune(args.fortunes, index_dir=None)
+        index   = pack.write(args.fortunes, fortune.files, args.filename,
+                             block_size=args.block_size)
+        print("Packed %d fortunes from %d files into %s, %d bytes" %
+              (index.size, len(fortune.files), args.filename,
+               os.path.getsize(args.filename)))
+    elif args.command == 'dups':
+        index    = Fortune(args.fortunes).index
+        clusters = index.clusters()
+        for cluster in clusters:
+            print('%' * 30)
+            for fortune_id in cluster:
+                print("%s:" % index.category(fortune_id))
+                print(index.text(fortune_id))
+        print("%d fortunes, %d clusters of duplicates of %d of them" %
+              (index.size, len(clusters), sum(len(c) for c in clusters)))
+    else:
+        fortune = Fortune(args.fortunes)
+        print(fortune.pick(query=' '.join(getattr(args, 'query', ())) or None))
@@ -0,0 +1,203 @@
+"""
+Remembering which fortunes we have shown recently.
+
+The history is a fixed-size ring of the fingerprints of the last ``N``
+fortunes shown, which lives in a memory-mapped file so that it survives
+restarts. Alongside it we keep a count of each thing in the ring, so asking
+whether something was shown recently doesn't mean looking through all of it.
+
+The file is::
+
+    header  magic, version, how big the ring is, and how many things have
+            ever been added to it
+    ring    that many 64-bit fingerprints, where the next one goes at
+            ``added % size``
+"""
+
+import logging as LOG
+import mmap
+import numpy as np
+import os
+import struct
+
+from   index import INDEX_DIR
+
+# ----------------------------------------------------------------------
+
+# Where we keep the history by default, and how big it is. At a fortune every
+# three minutes this is about a couple of days' worth.
+HISTORY_FILE = os.path.join(INDEX_DIR, 'fortune-history.bin')
+HISTORY_SIZE = 1000
+
+# What the file starts with
+_HEADER  = struct.Struct('<8sIIQ')
+_MAGIC   = b'FORTHIST'
+_VERSION = 1
+
+# ----------------------------------------------------------------------
+
+class History():
+    """
+    The fingerprints of the most recently shown fortunes.
+    """
+    def __init__(self, size, filename=HISTORY_FILE):
+        """
+        :type size: int
+        :param size:
+            How many fortunes to remember.
+        :type filename: str
+        :param filename:
+            Where to keep the history, or `None` to only keep it in memory.
+            If the file has a history of a different size then as much of it
+            as will fit is kept.
+        """
+        size = int(size)
+        if size <= 0:
+            raise ValueError("Bad history size: %d" % size)
+        self.size     = size
+        self.filename = filename
+
+        # Whatever we had before, oldest first
+        previous = (self._read(filename) if filename
+                    else np.zeros(0, dtype=np.uint64))
+        previous = previous[-size:]
+
+        # The file, or just some memory, with the ring in it
+        length = _HEADER.size + 8 * size
+        self._fd = -1
+        if filename:
+            os.makedirs(os.path.dirname(os.path.abspath(filename)),
+                        exist_ok=True)
+            self._fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o644)
+            os.ftruncate(self._fd, length)
+            self._map = mmap.mmap(self._fd, length)
+        else:
+            self._map = mmap.mmap(-1, length)
+        self._ring = np.frombuffer(self._map, dtype=np.uint64,
+                                   count=size, offset=_HEADER.size)
+
+        # Put back what we had, and work out what's in there
+        self._added = len(previous)
+        self._ring[:len(previous)] = previous
+        self._ring[len(previous):] = 0
+        self._write_header()
+
+        # How many times each fingerprint is in the ring. It's usually once but
+        # a fortune might have had to be shown again.
+        self._recent = {}
+        for fingerprint in previous.tolist():
+            self._recent[fingerprint] = self._recent.get(fingerprint, 0) + 1
+
+
+    def __contains__(self, fingerprint):
+        """
+        Whether a fortune, by its fingerprint, was shown recently.
+        """
+        return fingerprint in self._recent
+
+
+    def __len__(self):
+        return min(self._added, self.size)
+
+
+    def add(self, fingerprint):
+        """
+        Remember that a fortune, by its fingerprint, was shown. This forgets
+        the oldest one, if the history is full.
+        """
+        fingerprint = int(fingerprint)
+        slot = self._added % self.size
+        if self._added >= self.size:
+            oldest = int(self._ring[slot])
+            count  = self._recent[oldest] - 1
+            if count:
+                self._recent[oldest] = count
+            else:
+                del self._recent[oldest]
+        self._ring[slot] = fingerprint
+        self._recent[fingerprint] = self._recent.get(fingerprint, 0) + 1
+        self._added += 1
+        self._write_header()
+
+
+    def clear(self):
+        """
+        Forget everything.
+        """
+        self._ring[:] = 0
+        self._recent.clear()
+        self._added = 0
+        self._write_header()
+
+
+    def recent(self):
+        """
+        The fingerprints in the history, oldest first.
+        """
+        if self._added <= self.size:
+            return self._ring[:self._added].copy()
+        slot = self._added % self.size
+        return np.concatenate((self._ring[slot:], self._ring[:slot]))
+
+
+    def flush(self):
+        """
+        Make sure that the history is on disk.
+        """
+        if self._fd >= 0:
+            self._map.flush()
+
+
+    def close(self):
+        """
+        Flush the history, and stop using it.
+        """
+        if self._map is None:
+            return
+        self.flush()
+        # The ring is a view onto the map, which has to go first
+        self._ring = None
+        self._map.close()
+        self._map = None
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    # ----------------------------------------------------------------------
+
+    def _write_header(self):
+        """
+        Update the header with how many things have been added.
+        """
+        self._map[:_HEADER.size] = _HEADER.pack(_MAGIC, _VERSION,
+                                                self.size, self._added)
+
+
+    @staticmethod
+    def _read(filename):
+        """
+        Read the history in a file, if there is one.
+
+        :return: The fingerprints in it, oldest first.
+        """
+        try:
+            with open(filename, 'rb') as fh:
+                header = fh.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    return np.zeros(0, dtype=np.uint64)
+                (magic, version, size, added) = _HEADER.unpack(header)
+                if magic != _MAGIC or version != _VERSION:
+                    raise ValueError("Not a version %d history" % _VERSION)
+                ring = np.frombuffer(fh.read(8 * size), dtype=np.uint64)
+                if len(ring) != size:
+                    raise ValueError("Truncated")
+        except FileNotFoundError:
+            return np.zeros(0, dtype=np.uint64)
+        except (IOError, OSError, ValueError) as e:
+            LOG.warning("Ignoring the history in %s: %s", filename, e)
+            return np.zeros(0, dtype=np.uint64)
+
+        if added <= size:
+            return ring[:added].copy()
+        slot = added % size
+        return np.concatenate((ring[slot:], ring[:slot]))
@@ -0,0 +1,923 @@
+"""
+An index of the individual fortunes in the fortune files.
+
+Every fortune gets an ID. The fortunes in each file have a contiguous range of
+IDs, so that when a file changes we can drop its range and index it afresh,
+with new IDs on the end, without touching anything else.
+
+For each fortune we keep where it is in its file, and for each file we keep its
+category, which is its path under the fortunes directory (e.g. ``computers``
+or ``off/art``). The inverted index maps each term which appears in the
+fortunes to the sorted array of the IDs of the fortunes which it appears in.
+Finding the fortunes which match a query is then just intersecting arrays.
+
+Corpora which have been put together from several places have the same
+fortunes in them more than once, sometimes with small differences. So for
+each fortune we also keep a MinHash signature of its word pairs, hashed down
+into LSH bands and a sketch of a byte per hash. Fortunes which have the same
+fingerprint, or which share a band and whose sketches are similar enough, are
+clustered together. Only the first fortune in each cluster,
+its canonical one, is found by searches.
+
+The whole thing is saved to disk, so that we don't have to read every fortune
+each time that we start.
+"""
+
+import hashlib
+import logging as LOG
+import numpy as np
+import os
+import re
+import zlib
+
+from   fnmatch import translate
+
+# ----------------------------------------------------------------------
+
+# Bump this if the format of the saved index changes
+_VERSION = 3
+
+# Where we keep the indices
+INDEX_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+    'fortunate'
+)
+
+# What a fortune is split up into terms by
+_TOKEN = re.compile(r'[a-z0-9]{2,}')
+
+# What separates the fortunes in a file
+_SEPARATOR = re.compile(rb'^%\r?$', re.MULTILINE)
+
+# An empty array of IDs
+_NONE = np.zeros(0, dtype=np.uint32)
+
+# What we split fortunes up into words by, for finding near-duplicates
+_WORD = re.compile(rb'[a-z0-9]+')
+
+# The MinHash signatures are this many bands of this many rows. Two fortunes
+# whose word pairs have a Jaccard similarity of s share a band with
+# probability 1 - (1 - s^rows)^bands, which is about a half at s = 0.7 and
+# almost certain at s = 0.85.
+_BANDS = 16
+_ROWS  = 8
+
+# Sharing a band makes two fortunes candidates. They are only put together if
+# their similarity, as estimated from the low byte of each of their hashes, is
+# at least this.
+_SIMILARITY = 0.7
+
+# Fortunes with fewer words than this are too short for the similarity to mean
+# much, so they only go with exact duplicates
+_MIN_WORDS = 6
+
+# The hash functions for the signatures, as ``(a * x + b) >> 32``. These are
+# fixed, since the signatures are saved.
+_HASH_A = (np.random.RandomState(0x5EED)
+             .randint(1, 1 << 62, size=_BANDS * _ROWS, dtype=np.int64)
+             .astype(np.uint64) * np.uint64(2) + np.uint64(1))
+_HASH_B = (np.random.RandomState(0xB)
+             .randint(0, 1 << 62, size=_BANDS * _ROWS, dtype=np.int64)
+             .astype(np.uint64))
+
+# What the rows of each band are combined with, into one number
+_BAND_MIX = (np.uint64(0x9E3779B97F4A7C15) **
+             np.arange(_ROWS, dtype=np.uint64)).astype(np.uint64)
+
+# How many shingles we work on at once, so as to bound the memory used
+_SHINGLE_CHUNK = 16 * 1024
+
+# ----------------------------------------------------------------------
+
+def tokenise(text):
+    """
+    Split some text up into the set of terms which we index it by.
+    """
+    return set(_TOKEN.findall(text.lower()))
+
+
+def fingerprint(data):
+    """
+    A 64-bit hash of the text of a fortune, which doesn't care about case or
+    whitespace. Unlike a fortune's ID this stays the same when the index
+    changes, so it's what we remember fortunes by.
+
+    :type data: bytes
+    :param data:
+        The text.
+    """
+    return int.from_bytes(
+        hashlib.blake2b(b' '.join(data.lower().split()), digest_size=8).digest(),
+        'little'
+    )
+
+
+def minhash(texts):
+    """
+    Work out the MinHash signatures of some fortunes, as their LSH bands and
+    their sketches. Fortunes which are the same but for a word or two will
+    most likely have at least one band the same, and how many of their
+    sketches' bytes are the same says how similar they are.
+
+    :type texts: list
+    :param texts:
+        The texts of the fortunes, as bytes.
+
+    :return: A ``(len(texts), _BANDS)`` array of the bands, and a
+             ``(len(texts), _BANDS * _ROWS)`` array of the sketches.
+    """
+    # Each fortune's shingles are its word pairs, or all of it if it's too
+    # short for those to be worth having
+    shingles = []
+    owners   = []
+    for (i, text) in enumerate(texts):
+        words = _WORD.findall(text.lower())
+        if len(words) >= _MIN_WORDS:
+            pairs = [zlib.crc32(b'%s %s' % pair)
+                     for pair in zip(words, words[1:])]
+        else:
+            pairs = [zlib.crc32(b' '.join(text.lower().split()))]
+        shingles.extend(pairs)
+        owners  .extend([i] * len(pairs))
+    shingles = np.array(shingles, dtype=np.uint64)
+    owners   = np.array(owners,   dtype=np.intp)
+
+    # The signature is the smallest value of each hash function over each
+    # fortune's shingles. The shingles are in fortune order so this is a
+    # reduceat over them, which we do in chunks of whole fortunes.
+    signatures = np.empty((len(texts), _BANDS * _ROWS), dtype=np.uint64)
+    starts     = np.searchsorted(owners, np.arange(len(texts) + 1))
+    first      = 0
+    while first < len(texts):
+        last = int(np.searchsorted(starts, starts[first] + _SHINGLE_CHUNK,
+                                   side='right')) - 1
+        last = min(max(last, first + 1), len(texts))
+        (lo, hi) = (starts[first], starts[last])
+        hashes = (_HASH_A[:, np.newaxis] * shingles[np.newaxis, lo:hi] +
+                  _HASH_B[:, np.newaxis]) >> np.uint64(32)
+        signatures[first:last] = np.minimum.reduceat(
+            hashes, starts[first:last] - lo, axis=1
+        ).T
+        first = last
+
+    # Each band is its rows mixed together
+    bands = (signatures.reshape(len(texts), _BANDS, _ROWS) * _BAND_MIX).sum(
+        axis=2, dtype=np.uint64
+    )
+    return (bands, signatures.astype(np.uint8))
+
+
+def similarity(a, b):
+    """
+    Estimate the Jaccard similarities of the word pairs of fortunes from their
+    sketches. Two bytes are the same by chance one time in 256 so we allow for
+    that.
+
+    :type a: array
+    :param a:
+        The sketches of some fortunes.
+    :type b: array
+    :param b:
+        The sketches of the ones to compare them with.
+    """
+    same = np.count_nonzero(a == b, axis=-1) / float(a.shape[-1])
+    return np.clip((same - 1 / 256) / (1 - 1 / 256), 0.0, 1.0)
+
+
+def split_fortunes(data):
+    """
+    Find the fortunes in the contents of a fortune file.
+
+    :type data: bytes
+    :param data:
+        The contents of the file.
+
+    :return: The ``(offset, length)`` of each of the fortunes, without the
+             surrounding newlines.
+    """
+    fortunes = []
+    start    = 0
+    for match in _SEPARATOR.finditer(data):
+        fortunes.append((start, match.start()))
+        start = match.end()
+    fortunes.append((start, len(data)))
+
+    result = []
+    for (s, e) in fortunes:
+        while s < e and data[s] in b'\r\n':
+            s += 1
+        while e > s and data[e - 1] in b'\r\n':
+            e -= 1
+        if e > s:
+            result.append((s, e - s))
+    return result
+
+
+class _File():
+    """
+    What we know about one indexed file.
+    """
+    def __init__(self, path, mtime, size, category, base, count, terms):
+        self.path     = path      # Where it is
+        self.mtime    = mtime     # Its st_mtime_ns when we indexed it
+        self.size     = size      # And its size
+        self.category = category  # Its category ID
+        self.base     = base      # The ID of its first fortune
+        self.count    = count     # How many fortunes it has
+        self.terms    = terms     # The IDs of the terms in it, as an array
+
+
+class FortuneIndex():
+    """
+    The index of all the fortunes under a directory.
+    """
+    # How many search results we remember
+    _MAX_SEARCHES = 64
+
+    def __init__(self, root):
+        """
+        :type root: str
+        :param root:
+            The fortunes directory.
+        """
+        self.root = os.path.abspath(root)
+
+        # The files, by path
+        self._files = {}
+
+        # For each fortune ID: where it is in its file, how long it is, its
+        # fingerprint, which file it's in (as a number, see _paths) and whether
+        # it's still there
+        self._offsets = np.zeros(0, dtype=np.uint32)
+        self._lengths = np.zeros(0, dtype=np.uint32)
+        self._hashes  = np.zeros(0, dtype=np.uint64)
+        self._bands    = np.zeros((0, _BANDS),          dtype=np.uint64)
+        self._sketches = np.zeros((0, _BANDS * _ROWS), dtype=np.uint8)
+        self._filenos = np.zeros(0, dtype=np.int32)
+        self._alive   = np.zeros(0, dtype=bool)
+
+        # The path of each file number, and its category ID, by file number
+        self._paths      = []
+        self._file_cats  = []
+
+        # The categories, as a list of names and a map back from name to ID
+        self._categories   = []
+        self._category_ids = {}
+
+        # The terms, likewise, and the postings for each term ID
+        self._terms    = []
+        self._term_ids = {}
+        self._postings = []
+
+        # Things we work out when we need them, including the results of
+        # recent searches
+        self._live         = None
+        self._canonical    = None
+        self._category_of  = None
+        self._searches     = {}
+        self._masks        = {}
+
+        # This goes up whenever the index changes, so that others know when to
+        # forget what they worked out from it
+        self.version = 0
+
+
+    @property
+    def size(self):
+        """
+        How many fortunes there are.
+        """
+        return int(np.count_nonzero(self._alive))
+
+
+    @property
+    def category_names(self):
+        """
+        The name of each category, by category ID. This includes categories
+        which no longer have any files in them.
+        """
+        return self._categories
+
+
+    @property
+    def categories(self):
+        """
+        The names of all the categories.
+        """
+        return tuple(sorted(self._categories[f.category]
+                            for f in self._files.values()))
+
+
+    # ----------------------------------------------------------------------
+
+    def sync(self, paths):
+        """
+        Make the index match the given fortune files. Anything which hasn't
+        changed since it was indexed is left alone.
+
+        :type paths: iterable
+        :param paths:
+            The paths of all the fortune files.
+
+        :return: Whether anything changed.
+        """
+        paths   = set(os.path.abspath(path) for path in paths)
+        changed = False
+
+        # Gone
+        for path in tuple(self._files.keys()):
+            if path not in paths:
+                self._remove(path)
+                changed = True
+
+        # New or different
+        for path in sorted(paths):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                if path in self._files:
+                    self._remove(path)
+                    changed = True
+                continue
+            entry = self._files.get(path)
+            if (entry is not None and
+                entry.mtime == stat.st_mtime_ns and
+                entry.size  == stat.st_size):
+                continue
+            if entry is not None:
+                self._remove(path)
+            self._add(path, stat)
+            changed = True
+
+        if changed:
+            self._forget()
+        return changed
+
+
+    def search(self, query=None, categories=None, max_length=None,
+               distinct=True):
+        """
+        Find the fortunes which match.
+
+        :type query: str
+        :param query:
+            The words which the fortunes must all contain, if any.
+        :type categories: iterable
+        :param categories:
+            The categories which the fortunes must be in, if any. These may be
+            glob patterns, like ``off/*``, or directories, like ``off``.
+        :type max_length: int
+        :param max_length:
+            The longest fortune to match, in bytes, if any.
+        :type distinct: bool
+        :param distinct:
+            Whether to only match one fortune of each cluster of duplicates.
+            @see FortuneIndex.distinct()
+
+        :return: The sorted array of the matching fortune IDs.
+        """
+        # We're often asked the same thing over and over
+        terms = frozenset(tokenise(query)) if query else frozenset()
+        if isinstance(categories, str):
+            categories = (categories,)
+        key = (terms,
+               None if categories is None else tuple(categories),
+               max_length,
+               distinct)
+        ids = self._searches.get(key)
+        if ids is not None:
+            return ids
+
+        # Everything which has all the terms, rarest first so that the
+        # intersections get small quickly
+        postings = []
+        for term in terms:
+            term_id = self._term_ids.get(term)
+            postings.append(_NONE if term_id is None
+                            else self._postings[term_id])
+        postings.sort(key=len)
+
+        # In the right categories. Without any terms we can get these
+        # straight from the files' ranges of IDs.
+        if categories is not None:
+            wanted = self.category_mask(categories)
+            if postings:
+                ids = postings.pop(0)
+                ids = ids[wanted[self.category_of[ids]]]
+            else:
+                ranges = sorted((f.base, f.count)
+                                for f in self._files.values()
+                                if wanted[f.category])
+                ids = _concatenate([np.arange(b, b + c, dtype=np.uint32)
+                                    for (b, c) in ranges])
+        elif postings:
+            ids = postings.pop(0)
+        else:
+            ids = self.live
+
+        for other in postings:
+            if not len(ids):
+                break
+            ids = np.intersect1d(ids, other, assume_unique=True)
+
+        # And short enough, and not the same as another
+        if max_length is not None:
+            ids = ids[self._lengths[ids] <= max_length]
+        if distinct:
+            ids = self.distinct(ids)
+
+        # Remember it for next time, but not too much
+        if len(self._searches) >= self._MAX_SEARCHES:
+            self._searches.clear()
+        self._searches[key] = ids
+        return ids
+
+
+    def category_mask(self, categories):
+        """
+        Work out which categories match the given names or patterns. A name
+        matches itself and, if it's a directory, everything under it.
+
+        :return: A boolean array, by category ID.
+        """
+        if isinstance(categories, str):
+            categories = (categories,)
+        categories = tuple(categories)
+        mask = self._masks.get(categories)
+        if mask is None:
+            pattern = re.compile('|'.join(
+                '(?:%s)' % translate(p) for c in categories
+                                        for p in (c, c + '/*')
+            ))
+            mask = np.fromiter((bool(pattern.match(name))
+                                for name in self._categories),
+                               dtype=bool, count=len(self._categories))
+            self._masks[categories] = mask
+        return mask
+
+
+    @property
+    def live(self):
+        """
+        The sorted array of the IDs of all the fortunes.
+        """
+        if self._live is None:
+            self._live = np.flatnonzero(self._alive).astype(np.uint32)
+        return self._live
+
+
+    @property
+    def canonical(self):
+        """
+        The ID of the canonical fortune of the cluster of duplicates which
+        each fortune is in, by fortune ID. This is the fortune's own ID if it's
+        not a duplicate of an earlier one.
+        """
+        if self._canonical is None:
+            self._canonical = self._cluster()
+        return self._canonical
+
+
+    def distinct(self, ids):
+        """
+        Drop the duplicates from some fortunes, keeping the first of each
+        cluster which is among them. That's not always the canonical one,
+        which might be in another category, too long, or not wanted for
+        some other reason, but the duplicate is just as good.
+
+        :type ids: numpy.ndarray
+        :param ids:
+            The sorted fortune IDs.
+
+        :return: The sorted array of the IDs which are left.
+        """
+        if not len(ids):
+            return ids
+        (_, first) = np.unique(self.canonical[ids], return_index=True)
+        first.sort()
+        return ids[first]
+
+
+    def clusters(self):
+        """
+        The clusters of duplicates.
+
+        :return: A list of the sorted arrays of the IDs of the fortunes in each
+                 cluster, canonical one first, for the clusters with more than
+                 one fortune in.
+        """
+        live      = self.live
+        canonical = self.canonical[live]
+        order     = np.lexsort((live, canonical))
+        (keys, starts, counts) = np.unique(canonical[order],
+                                           return_index=True,
+                                           return_counts=True)
+        return [live[order[s:s + c]]
+                for (s, c) in zip(starts.tolist(), counts.tolist()) if c > 1]
+
+
+    @property
+    def fingerprints(self):
+        """
+        The `fingerprint()` of each fortune, by fortune ID.
+        """
+        return self._hashes
+
+
+    @property
+    def category_of(self):
+        """
+        The category ID of each fortune, by fortune ID.
+        """
+        if self._category_of is None:
+            file_cats = np.array(self._file_cats + [-1], dtype=np.int32)
+            self._category_of = file_cats[self._filenos]
+        return self._category_of
+
+
+    def text(self, fortune_id):
+        """
+        Get the text of a fortune.
+
+        :return: The text, or `None` if it can't be read.
+        """
+        fortune_id = int(fortune_id)
+        path = self._paths[self._filenos[fortune_id]]
+        try:
+            with open(path, 'rb') as fh:
+                fh.seek(int(self._offsets[fortune_id]))
+                data = fh.read(int(self._lengths[fortune_id]))
+        except (IOError, OSError) as e:
+            LOG.debug("Failed to read fortune %d from %s: %s",
+                      fortune_id, path, e)
+            return None
+        return data.decode('utf-8', errors='replace')
+
+
+    def location(self, fortune_id):
+        """
+        Where a fortune is.
+
+        :return: The ``(path, offset, length)`` of the fortune.
+        """
+        fortune_id = int(fortune_id)
+        return (self._paths[self._filenos[fortune_id]],
+                int(self._offsets[fortune_id]),
+                int(self._lengths[fortune_id]))
+
+
+    def category(self, fortune_id):
+        """
+        The name of the category of a fortune.
+        """
+        return self._categories[self.category_of[int(fortune_id)]]
+
+    # ----------------------------------------------------------------------
+
+    @classmethod
+    def filename(cls, root, index_dir=INDEX_DIR):
+        """
+        Where the index for the given directory lives.
+        """
+        digest = hashlib.sha1(os.path.abspath(root).encode()).hexdigest()
+        return os.path.join(index_dir, 'fortune-index-%s.npz' % digest)
+
+
+    @classmethod
+    def load(cls, root, index_dir=INDEX_DIR):
+        """
+        Load the index for the given directory, if we have one, or else give
+        back an empty one.
+
+        :type root: str
+        :param root:
+            The fortunes directory.
+        :type index_dir: str
+        :param index_dir:
+            Where the saved indices live, or `None` to not look.
+        """
+        index = cls(root)
+        if not index_dir:
+            return index
+
+        path = cls.filename(root, index_dir)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if int(data['version']) != _VERSION:
+                    raise ValueError("Wrong version")
+                if str(data['root']) != index.root:
+                    raise ValueError("Wrong root")
+                index._restore(data)
+            LOG.info("Loaded index of %d fortunes from %s", index.size, path)
+        except (IOError, OSError, KeyError, ValueError) as e:
+            LOG.info("Not using index in %s: %s", path, e)
+            index = cls(root)
+        return index
+
+
+    def save(self, index_dir=INDEX_DIR):
+        """
+        Save the index, so that `load()` can find it. We write it under a
+        temporary name so that we never see a partial file.
+        """
+        self.compact()
+        path = self.filename(self.root, index_dir)
+        tmp  = '%s.%d.tmp.npz' % (path[:-4], os.getpid())
+        try:
+            os.makedirs(index_dir, exist_ok=True)
+            with open(tmp, 'wb') as fh:
+                np.savez(fh, **self._arrays())
+            os.replace(tmp, path)
+            LOG.debug("Saved index to %s", path)
+        except (IOError, OSError) as e:
+            LOG.warning("Could not save index to %s: %s", path, e)
+
+
+    def compact(self):
+        """
+        Renumber the fortunes so that there are no gaps left by the ones which
+        have gone, if there are enough of them to be worth it.
+        """
+        dead = len(self._alive) - self.size
+        if dead == 0 or dead < self.size:
+            return
+
+        # The new ID of each old one, for the ones which are still alive. This
+        # preserves the order, so the postings stay sorted.
+        new_ids = np.cumsum(self._alive, dtype=np.int64) - 1
+        for (term_id, postings) in enumerate(self._postings):
+            self._postings[term_id] = new_ids[postings].astype(np.uint32)
+        for entry in self._files.values():
+            if entry.count:
+                entry.base = int(new_ids[entry.base])
+
+        self._offsets = self._offsets[self._alive]
+        self._lengths = self._lengths[self._alive]
+        self._hashes  = self._hashes [self._alive]
+        self._bands    = self._bands   [self._alive]
+        self._sketches = self._sketches[self._alive]
+        self._filenos = self._filenos[self._alive]
+        self._alive   = self._alive  [self._alive]
+        self._forget()
+
+    # ----------------------------------------------------------------------
+
+    def _forget(self):
+        """
+        Forget everything which we worked out from the index, since it changed.
+        """
+        self._live        = None
+        self._canonical   = None
+        self._category_of = None
+        self._searches.clear()
+        self._masks   .clear()
+        self.version += 1
+
+
+    def _cluster(self):
+        """
+        Work out the clusters of duplicates. Fortunes are in the same cluster
+        if they have the same fingerprint, or share a band and have similar
+        sketches, or are in the same cluster as another which does.
+
+        :return: The canonical ID of each fortune, which is the lowest ID in
+                 its cluster.
+        """
+        canonical = np.arange(len(self._alive), dtype=np.uint32)
+        live      = self.live
+        if not len(live):
+            return canonical
+
+        # Each fortune is joined to the first fortune with the same
+        # fingerprint, and to the first in each of its bands if they are
+        # similar enough. These are indices into live.
+        sources = []
+        targets = []
+        sketches = self._sketches[live]
+        for (exact, keys) in ([(True,  self._hashes[live])] +
+                              [(False, band) for band in self._bands[live].T]):
+            (_, first, inverse) = np.unique(keys,
+                                            return_index  =True,
+                                            return_inverse=True)
+            target = first[inverse.reshape(-1)]
+            joined = np.flatnonzero(target != np.arange(len(live)))
+            if not exact and len(joined):
+                alike  = similarity(sketches[joined],
+                                    sketches[target[joined]]) >= _SIMILARITY
+                joined = joined[alike]
+            sources.append(joined)
+            targets.append(target[joined])
+        sources = np.concatenate(sources)
+        targets = np.concatenate(targets)
+
+        # Keep giving each fortune the lowest label of anything which it's
+        # joined to until nothing changes. This is usually just a few rounds.
+        labels = np.arange(len(live), dtype=np.intp)
+        while len(sources):
+            before = labels.copy()
+            np.minimum.at(labels, sources, labels[targets])
+            np.minimum.at(labels, targets, labels[sources])
+            labels = labels[labels]
+            if np.array_equal(labels, before):
+                break
+
+        canonical[live] = live[labels]
+        return canonical
+
+
+    def _add(self, path, stat):
+        """
+        Index a file.
+        """
+        try:
+            with open(path, 'rb') as fh:
+                data = fh.read()
+        except (IOError, OSError) as e:
+            LOG.debug("Failed to index %s: %s", path, e)
+            return
+
+        # Its category is its path under the root, using the same one as any
+        # earlier version of it
+        name = os.path.relpath(path, self.root).replace(os.sep, '/')
+        if name not in self._category_ids:
+            self._category_ids[name] = len(self._categories)
+            self._categories.append(name)
+        category = self._category_ids[name]
+
+        # The file number
+        fileno = len(self._paths)
+        self._paths    .append(path)
+        self._file_cats.append(category)
+
+        # The fortunes, which go on the end
+        fortunes = split_fortunes(data)
+        base  = len(self._alive)
+        count = len(fortunes)
+        self._offsets = np.concatenate(
+            (self._offsets, np.array([o for (o, _) in fortunes], dtype=np.uint32))
+        )
+        self._lengths = np.concatenate(
+            (self._lengths, np.array([l for (_, l) in fortunes], dtype=np.uint32))
+        )
+        texts = [data[o:o + l] for (o, l) in fortunes]
+        self._hashes  = np.concatenate(
+            (self._hashes,
+             np.array([fingerprint(text) for text in texts], dtype=np.uint64))
+        )
+        (bands, sketches) = minhash(texts)
+        self._bands    = np.concatenate((self._bands,    bands))
+        self._sketches = np.concatenate((self._sketches, sketches))
+        self._filenos = np.concatenate(
+            (self._filenos, np.full(count, fileno, dtype=np.int32))
+        )
+        self._alive   = np.concatenate(
+            (self._alive, np.ones(count, dtype=bool))
+        )
+
+        # And the terms in them. Since the new IDs are bigger than any others,
+        # adding them to the end of the postings keeps them sorted.
+        local = {}
+        for (i, text) in enumerate(texts):
+            text = text.decode('utf-8', errors='replace')
+            for term in tokenise(text):
+                local.setdefault(term, []).append(base + i)
+        terms = []
+        for (term, ids) in local.items():
+            term_id = self._term_ids.get(term)
+            if term_id is None:
+                term_id = self._term_ids[term] = len(self._terms)
+                self._terms.append(term)
+                self._postings.append(np.array(ids, dtype=np.uint32))
+            else:
+                self._postings[term_id] = np.concatenate(
+                    (self._postings[term_id], np.array(ids, dtype=np.uint32))
+                )
+            terms.append(term_id)
+
+        self._files[path] = _File(path, stat.st_mtime_ns, stat.st_size,
+                                  category, base, count,
+                                  np.array(sorted(terms), dtype=np.uint32))
+        LOG.debug("Indexed %d fortunes in %s", count, path)
+
+
+    def _remove(self, path):
+        """
+        Drop a file from the index.
+        """
+        entry = self._files.pop(path)
+        (lo, hi) = (entry.base, entry.base + entry.count)
+        self._alive[lo:hi] = False
+        for term_id in entry.terms:
+            postings = self._postings[term_id]
+            (s, e) = np.searchsorted(postings, (lo, hi))
+            self._postings[term_id] = np.concatenate((postings[:s],
+                                                      postings[e:]))
+
+
+    def _arrays(self):
+        """
+        The index as a dict of arrays, for saving.
+        """
+        files = sorted(self._files.values(), key=lambda f: f.base)
+        file_terms = [f.terms for f in files]
+        return {
+            'version'         : np.array(_VERSION),
+            'root'            : np.array(self.root),
+
+            'offsets'         : self._offsets,
+            'lengths'         : self._lengths,
+            'hashes'          : self._hashes,
+            'bands'           : self._bands,
+            'sketches'        : self._sketches,
+            'canonical'       : self.canonical,
+            'filenos'         : self._filenos,
+            'alive'           : self._alive,
+            'paths'           : np.array(self._paths + [''], dtype=str),
+            'file_cats'       : np.array(self._file_cats, dtype=np.int32),
+            'categories'      : np.array(self._categories + [''], dtype=str),
+
+            'file_paths'      : np.array([f.path for f in files] + [''],
+                                         dtype=str),
+            'file_mtimes'     : np.array([f.mtime    for f in files],
+                                         dtype=np.int64),
+            'file_sizes'      : np.array([f.size     for f in files],
+                                         dtype=np.int64),
+            'file_categories' : np.array([f.category for f in files],
+                                         dtype=np.int32),
+            'file_bases'      : np.array([f.base     for f in files],
+                                         dtype=np.int64),
+            'file_counts'     : np.array([f.count    for f in files],
+                                         dtype=np.int64),
+            'file_terms_ptr'  : _pointers(file_terms),
+            'file_terms'      : _concatenate(file_terms),
+
+            'terms'           : np.array(self._terms + [''], dtype=str),
+            'postings_ptr'    : _pointers(self._postings),
+            'postings'        : _concatenate(self._postings),
+        }
+
+
+    def _restore(self, data):
+        """
+        Set the index up from what `_arrays()` gave back.
+        """
+        # Each access to the data reads it afresh, so we only do that once
+        data = dict(data)
+
+        self._offsets   = data['offsets']
+        self._lengths   = data['lengths']
+        self._hashes    = data['hashes']
+        self._bands     = data['bands']
+        self._sketches  = data['sketches']
+        self._canonical = data['canonical']
+        self._filenos   = data['filenos']
+        self._alive     = data['alive']
+        self._paths     = data['paths'][:-1].tolist()
+        self._file_cats = data['file_cats'].tolist()
+
+        self._categories   = data['categories'][:-1].tolist()
+        self._category_ids = dict((n, i) for (i, n) in
+                                  enumerate(self._categories))
+
+        file_terms = _split(data['file_terms_ptr'], data['file_terms'])
+        for (path, mtime, size, category, base, count, terms) in zip(
+                data['file_paths'][:-1].tolist(),
+                data['file_mtimes'    ].tolist(),
+                data['file_sizes'     ].tolist(),
+                data['file_categories'].tolist(),
+                data['file_bases'     ].tolist(),
+                data['file_counts'    ].tolist(),
+                file_terms):
+            self._files[path] = _File(path, mtime, size, category,
+                                      base, count, terms)
+
+        self._terms    = data['terms'][:-1].tolist()
+        self._term_ids = dict((t, i) for (i, t) in enumerate(self._terms))
+        self._postings = _split(data['postings_ptr'], data['postings'])
+
+
+# ----------------------------------------------------------------------
+
+def _pointers(arrays):
+    """
+    Where each of the arrays starts when they are all concatenated, and where
+    the last one ends.
+    """
+    pointers = np.zeros(len(arrays) + 1, dtype=np.int64)
+    np.cumsum([len(a) for a in arrays], out=pointers[1:])
+    return pointers
+
+
+def _concatenate(arrays):
+    """
+    Concatenate some arrays of IDs.
+    """
+    return np.concatenate(arrays) if arrays else _NONE
+
+
+def _split(pointers, values):
+    """
+    The reverse of `_pointers()` and `_concatenate()`.
+    """
+    return [values[pointers[i]:pointers[i + 1]]
+            for i in range(len(pointers) - 1)]
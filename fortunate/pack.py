@@ -0,0 +1,259 @@
+"""
+All the fortunes in one file.
+
+A fortunes directory is hundreds of small files, which is slow to walk and
+read on an SD card. A pack holds the lot in one file:
+
+    header  magic, version, and where the table is
+    blocks  the text of the fortunes, in independently zlib-compressed blocks
+    table   the index of the fortunes, as a compressed npz
+
+Each fortune lies wholly within one block, so getting any fortune means reading
+and inflating just the one block which it's in. The table is the same as what
+`FortuneIndex` saves, with each fortune's offset being into its block, plus
+where each fortune's block is, so a pack can be searched in just the same way.
+"""
+
+from   index import FortuneIndex
+
+import io
+import logging as LOG
+import numpy as np
+import os
+import struct
+import zlib
+
+# ----------------------------------------------------------------------
+
+# What a pack starts with: the magic, the format version, and the offset and
+# length of the table
+_HEADER  = struct.Struct('<8sIQQ')
+_MAGIC   = b'FORTPACK'
+_VERSION = 3
+
+# How much text we put in each block, before compressing it. Smaller blocks
+# mean less to read and inflate for each pick, bigger ones compress better.
+BLOCK_SIZE = 8 * 1024
+
+# ----------------------------------------------------------------------
+
+class FortunePack(FortuneIndex):
+    """
+    The index of the fortunes in a pack, which also gets their text out of it.
+    Packs are read-only.
+    """
+    def __init__(self, path):
+        """
+        :type path: str
+        :param path:
+            Where the pack is.
+        """
+        super().__init__(path)
+
+        # Which block each fortune is in, and where each block is in the pack
+        self._blocks        = np.zeros(0, dtype=np.uint32)
+        self._block_offsets = np.zeros(0, dtype=np.int64)
+        self._block_lengths = np.zeros(0, dtype=np.uint32)
+
+        # The last block which we inflated, since picks often come from the
+        # same one
+        self._block = (None, None)
+
+        # We keep the pack open, so that it being replaced under us doesn't
+        # matter until we're told to look at it again
+        self._fd = -1
+        self._fd = os.open(path, os.O_RDONLY)
+        try:
+            header = os.pread(self._fd, _HEADER.size, 0)
+            if len(header) != _HEADER.size:
+                raise ValueError("%s is too short to be a pack" % path)
+            (magic, version, offset, length) = _HEADER.unpack(header)
+            if magic != _MAGIC:
+                raise ValueError("%s is not a pack" % path)
+            if version != _VERSION:
+                raise ValueError("%s is version %d, not %d" %
+                                 (path, version, _VERSION))
+            table = os.pread(self._fd, length, offset)
+            if len(table) != length:
+                raise ValueError("%s is truncated" % path)
+            with np.load(io.BytesIO(table), allow_pickle=False) as data:
+                self._restore(data)
+        except Exception:
+            self.close()
+            raise
+
+        LOG.info("Opened pack of %d fortunes in %d blocks from %s",
+                 self.size, len(self._block_offsets), path)
+
+
+    def close(self):
+        """
+        Close the pack.
+        """
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+    def __del__(self):
+        self.close()
+
+
+    def sync(self, paths):
+        """
+        @see FortuneIndex.sync()
+
+        Packs don't change, so this does nothing.
+        """
+        return False
+
+
+    def save(self, index_dir=None):
+        """
+        @see FortuneIndex.save()
+
+        The pack is its own index, so this does nothing.
+        """
+        pass
+
+
+    def text(self, fortune_id):
+        """
+        @see FortuneIndex.text()
+        """
+        fortune_id = int(fortune_id)
+        block  = int(self._blocks[fortune_id])
+        offset = int(self._offsets[fortune_id])
+        data   = self._inflate(block)
+        if data is None:
+            return None
+        return data[offset:offset + int(self._lengths[fortune_id])].decode(
+            'utf-8', errors='replace'
+        )
+
+
+    def _inflate(self, block):
+        """
+        Read a block, and inflate it.
+
+        :return: The contents of the block, or `None` if it can't be had.
+        """
+        (last, data) = self._block
+        if last == block:
+            return data
+        try:
+            data = zlib.decompress(
+                os.pread(self._fd,
+                         int(self._block_lengths[block]),
+                         int(self._block_offsets[block]))
+            )
+        except (OSError, zlib.error) as e:
+            LOG.debug("Failed to read block %d of %s: %s", block, self.root, e)
+            return None
+        self._block = (block, data)
+        return data
+
+
+    def _restore(self, data):
+        """
+        @see FortuneIndex._restore()
+        """
+        data = dict(data)
+        super()._restore(data)
+        self._blocks        = data['blocks']
+        self._block_offsets = data['block_offsets']
+        self._block_lengths = data['block_lengths']
+
+# ----------------------------------------------------------------------
+
+def write(root, paths, filename, block_size=BLOCK_SIZE):
+    """
+    Pack up some fortune files. The pack is written under a temporary name, and
+    then moved into place, so that anything reading the old one never sees a
+    partial file.
+
+    :type root: str
+    :param root:
+        The fortunes directory, which the categories are relative to.
+    :type paths: iterable
+    :param paths:
+        The paths of the fortune files in it.
+    :type filename: str
+    :param filename:
+        Where to put the pack.
+    :type block_size: int
+    :param block_size:
+        Roughly how much text to put in each block. Blocks are only ever this
+        big or bigger when a single fortune is.
+
+    :return: The `FortuneIndex` of what was packed.
+    """
+    if block_size <= 0:
+        raise ValueError("Bad block size: %d" % block_size)
+
+    index = FortuneIndex(root)
+    index.sync(paths)
+
+    # The fortunes in ID order, which is the same as each file in turn
+    count         = len(index._alive)
+    blocks        = np.zeros(count, dtype=np.uint32)
+    offsets       = np.zeros(count, dtype=np.uint32)
+    block_offsets = []
+    block_lengths = []
+
+    tmp = '%s.%d.tmp' % (filename, os.getpid())
+    try:
+        with open(tmp, 'wb') as fh:
+            # What the header will be, once we know where the table is
+            fh.write(b'\0' * _HEADER.size)
+
+            pending = []
+            size    = 0
+            source  = (None, None)
+            def flush():
+                data = zlib.compress(b''.join(pending), 9)
+                block_offsets.append(fh.tell())
+                block_lengths.append(len(data))
+                fh.write(data)
+                pending.clear()
+
+            for fortune_id in range(count):
+                # Each file is read just the once
+                (path, offset, length) = index.location(fortune_id)
+                if source[0] != path:
+                    with open(path, 'rb') as src:
+                        source = (path, src.read())
+                text = source[1][offset:offset + length]
+                if pending and size + len(text) > block_size:
+                    flush()
+                    size = 0
+                blocks [fortune_id] = len(block_offsets)
+                offsets[fortune_id] = size
+                pending.append(text)
+                size += len(text)
+            if pending:
+                flush()
+
+            # And the table, which is the index with the offsets now being
+            # into the blocks, and where the blocks are
+            arrays = index._arrays()
+            arrays['offsets']       = offsets
+            arrays['blocks']        = blocks
+            arrays['block_offsets'] = np.array(block_offsets, dtype=np.int64)
+            arrays['block_lengths'] = np.array(block_lengths, dtype=np.uint32)
+            table = io.BytesIO()
+            np.savez_compressed(table, **arrays)
+            table = table.getvalue()
+
+            offset = fh.tell()
+            fh.write(table)
+            fh.seek(0)
+            fh.write(_HEADER.pack(_MAGIC, _VERSION, offset, len(table)))
+        os.replace(tmp, filename)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    LOG.info("Packed %d fortunes into %d blocks in %s",
+             count, len(block_offsets), filename)
+    return index
@@ -2,10 +2,111 @@
 Basic wrappers around the PIL library, for me.
 """
 from   abc                  import abstractmethod
+from   collections          import OrderedDict
 from   PIL                  import Image, ImageDraw, ImageFont, ImageColor, ImageOps
 
 import logging
+import numpy as np
 import string
+import threading
+
+def layout(text, max_cols=36):
+    """
+    Lay out a fortune for the display: squash up the whitespace, drop the blank
+    lines and break any lines which are too long for it in two.
+
+    :type max_cols: int
+    :param max_cols:
+        The longest line we'd like, in characters, unless the fortune has
+        lines much longer than that.
+    """
+    text = text.split('\n')
+    line_length = max(len(line) for line in text)
+    if line_length > max_cols:
+        max_length = line_length // 2
+    else:
+        max_length = max_cols
+
+    lines = []
+    for line in text:
+        line = line.strip()
+        if not line:
+            continue
+        line = ' '.join(line.split())
+        if len(line) > max_length:
+            line1 = ''
+            line2 = ''
+            for word in line.split():
+                if len(line1) < max_length:
+                    line1 = '%s%s ' % (line1, word)
+                else:
+                    line2 = '%s%s ' % (line2, word)
+            if line1:
+                lines.append(line1.strip())
+            if line2:
+                lines.append(line2.strip())
+        else:
+            lines.append(line)
+    return '\n'.join(lines)
+
+
+def _paragraphs(text):
+    """
+    Break a fortune into the paragraphs which can be rewrapped, with their
+    whitespace squashed up. Fortunes come already wrapped, so lines are joined
+    back together unless it looks like they were meant to be apart: after a
+    blank line, or one much shorter than the rest, and before an indented one
+    or an attribution.
+    """
+    lines = text.expandtabs().split('\n')
+    width = max(len(line.rstrip()) for line in lines)
+    paragraphs = []
+    joinable   = False
+    for line in lines:
+        if not line.strip():
+            joinable = False
+            continue
+        apart = line[0].isspace() or line.lstrip().startswith('-')
+        if joinable and not apart:
+            paragraphs[-1] = '%s %s' % (paragraphs[-1], ' '.join(line.split()))
+        else:
+            paragraphs.append(' '.join(line.split()))
+        joinable = len(line.rstrip()) >= width * 0.6
+    return paragraphs
+
+
+def _wrap(words, cols):
+    """
+    Greedily wrap some words into lines of at most the given number of
+    characters, unless a word is longer than that.
+
+    :return: The lines.
+    """
+    lines = []
+    line  = None
+    for word in words:
+        if line is None:
+            line = word
+        elif len(line) + 1 + len(word) <= cols:
+            line = '%s %s' % (line, word)
+        else:
+            lines.append(line)
+            line = word
+    if line is not None:
+        lines.append(line)
+    return lines
+
+
+def _text_size(font, text):
+    """
+    How big some text is in a font, as ``(width, height)``. Newer versions of
+    PIL don't have `getsize()` so we work it out from the bounding box there.
+    """
+    if hasattr(font, 'getsize'):
+        return font.getsize(text)
+    (_, _, right, bottom) = font.getbbox(text)
+    return (right, bottom)
+
 
 class _Font():
     """
@@ -39,6 +140,249 @@ class _Font():
         return self._by_size[size]
 
 
+class GlyphAtlas():
+    """
+    The glyphs of a font, each rasterised just the once, for any size, into a
+    NumPy bitmap. Lines of text are then drawn by copying the glyphs into a
+    frame, rather than having PIL lay out and rasterise them every time.
+
+    Only the printable ASCII characters go in the atlas. Lines with anything
+    else in them are drawn by PIL.
+    """
+    # What we put in the atlas
+    CHARS = frozenset(c for c in string.printable if c not in '\t\n\r\x0b\x0c')
+
+    def __init__(self, font, max_glyphs=2048):
+        """
+        :type font: _Font
+        :param font:
+            The font.
+        :type max_glyphs: int
+        :param max_glyphs:
+            How many glyphs to keep, across all the sizes. The least recently
+            used ones are dropped when there are more.
+        """
+        self._font       = font
+        self._max_glyphs = int(max_glyphs)
+
+        # The (offset, bitmap) of each glyph, by (size, char), most recently
+        # used last, and what guards it, since more than one thread may be
+        # drawing with us
+        self._glyphs = OrderedDict()
+        self._lock   = threading.Lock()
+
+        # The advance of each ASCII character, by size, and the line height
+        self._advances = {}
+        self._heights  = {}
+
+        # How well the cache is doing
+        self.hits   = 0
+        self.misses = 0
+
+
+    def line_height(self, size):
+        """
+        How tall a line of text is in the given size.
+        """
+        height = self._heights.get(size)
+        if height is None:
+            (ascent, descent) = self._font.by_size(size).getmetrics()
+            height = self._heights[size] = ascent + descent
+        return height
+
+
+    def width(self, line, size):
+        """
+        How wide a line of text is in the given size.
+        """
+        positions = self._positions(line, size)
+        if positions is None:
+            return _text_size(self._font.by_size(size), line)[0]
+        return int(positions[-1])
+
+
+    def draw(self, ink, line, x, y, size):
+        """
+        Draw a line of text into a frame.
+
+        :type ink: numpy.ndarray
+        :param ink:
+            The ``(height, width)`` frame, where `True` means black.
+        :type line: str
+        :param line:
+            The text.
+        :type x: int
+        :param x:
+            Where the left of the line goes.
+        :type y: int
+        :param y:
+            Where the top of the line goes.
+        :type size: int
+        :param size:
+            The font size.
+        """
+        positions = self._positions(line, size)
+        if positions is None:
+            # Not something which we have, so we have PIL draw it
+            font  = self._font.by_size(size)
+            (width, height) = _text_size(font, line)
+            image = Image.new('1', (max(1, width), max(1, height)), 0)
+            ImageDraw.Draw(image).text((0, 0), line, fill=1, font=font)
+            _blit(ink, np.array(image, dtype=bool), x, y)
+            return
+
+        for (char, left) in zip(line, positions.tolist()):
+            if char == ' ':
+                continue
+            (offset, bitmap) = self._glyph(char, size)
+            _blit(ink, bitmap, x + int(left) + offset, y)
+
+
+    def _positions(self, line, size):
+        """
+        Where each character in a line goes, relative to the start of it, and
+        where the line ends.
+
+        :return: The positions, or `None` if the line has anything which isn't
+                 in the atlas.
+        """
+        if not self.CHARS.issuperset(line):
+            return None
+        advances = self._advances.get(size)
+        if advances is None:
+            font     = self._font.by_size(size)
+            advances = np.zeros(128, dtype=np.float64)
+            for char in self.CHARS:
+                advances[ord(char)] = font.getlength(char)
+            self._advances[size] = advances
+        codes = np.frombuffer(line.encode('ascii'), dtype=np.uint8)
+        positions = np.zeros(len(codes) + 1, dtype=np.float64)
+        np.cumsum(advances[codes], out=positions[1:])
+        return np.round(positions)
+
+
+    def _glyph(self, char, size):
+        """
+        Get a glyph, rasterising it if we don't already have it.
+
+        :return: How far to the left of its position the bitmap starts, and
+                 the bitmap.
+        """
+        key = (size, char)
+        with self._lock:
+            glyph = self._glyphs.get(key)
+            if glyph is not None:
+                self.hits += 1
+                self._glyphs.move_to_end(key)
+                return glyph
+
+            # The font is rasterised under the lock too, since PIL's fonts
+            # aren't safe to use from more than one thread at once
+            self.misses += 1
+            glyph = self._glyphs[key] = self._rasterise(char, size)
+            while len(self._glyphs) > self._max_glyphs:
+                self._glyphs.popitem(last=False)
+            return glyph
+
+
+    def _rasterise(self, char, size):
+        """
+        Draw a glyph the same way that PIL would draw it in a line, without
+        anti-aliasing, allowing for it sticking out to the left.
+
+        :return: The ``(offset, bitmap)`` of the glyph.
+        """
+        font = self._font.by_size(size)
+        (left, _, right, _) = font.getbbox(char)
+        offset = min(0, left)
+        width  = max(1, int(np.ceil(max(right, font.getlength(char)))) - offset)
+        image  = Image.new('1', (width, self.line_height(size)), 0)
+        ImageDraw.Draw(image).text((-offset, 0), char, fill=1, font=font)
+        return (offset, np.array(image, dtype=bool))
+
+
+def _blit(ink, bitmap, x, y):
+    """
+    Draw a bitmap into a frame, at ``(x, y)``, clipping it to the frame.
+    """
+    (height, width) = ink.shape
+    (bh, bw) = bitmap.shape
+    (x0, y0) = (max(0, x), max(0, y))
+    (x1, y1) = (min(width, x + bw), min(height, y + bh))
+    if x0 < x1 and y0 < y1:
+        ink[y0:y1, x0:x1] |= bitmap[y0 - y:y1 - y, x0 - x:x1 - x]
+
+
+def ink_image(ink, mode, white, black):
+    """
+    Turn a frame of ink into a PIL image, in one go.
+
+    :type ink: numpy.ndarray
+    :param ink:
+        The ``(height, width)`` frame, where `True` means black.
+    :param mode:  The PIL mode of the image.
+    :param white: The colour white in that mode.
+    :param black: The colour black in that mode.
+    """
+    (height, width) = ink.shape
+    if mode == '1':
+        data = np.packbits(ink == bool(black), axis=1)
+        return Image.frombytes('1', (width, height), data.tobytes())
+    if isinstance(white, tuple):
+        pixels = np.where(ink[:, :, np.newaxis],
+                          np.array(black, dtype=np.uint8),
+                          np.array(white, dtype=np.uint8))
+    else:
+        pixels = np.where(ink, np.uint8(black), np.uint8(white))
+    return Image.frombytes(mode, (width, height),
+                           np.ascontiguousarray(pixels).tobytes())
+
+
+def pack_bits(ink, turns=0, flip_rows=False, flip_cols=False, stride=None):
+    """
+    Turn a frame of ink into the packed bits which an e-ink controller wants,
+    where a set bit is white and the first pixel of each byte is its top bit.
+
+    :type ink: numpy.ndarray
+    :param ink:
+        The ``(height, width)`` frame, where `True` means black.
+    :type turns: int
+    :param turns:
+        How many quarter turns anticlockwise to rotate the frame by, to get it
+        the way round that the controller has it.
+    :type flip_rows: bool
+    :param flip_rows:
+        Whether to flip the frame top to bottom, before rotating it.
+    :type flip_cols: bool
+    :param flip_cols:
+        Whether to flip the frame left to right, before rotating it.
+    :type stride: int
+    :param stride:
+        How many bits the controller has for each row, which is at least the
+        width of the rotated frame, or `None` if the rows are all packed
+        together with no padding between them.
+
+    :return: The bytes, as a NumPy array.
+    """
+    if flip_cols:
+        ink = ink[:, ::-1]
+    if flip_rows:
+        ink = ink[::-1, :]
+    if turns % 4:
+        ink = np.rot90(ink, turns)
+    if stride is None:
+        return np.packbits(~ink)
+
+    # The padding at the end of each row is white
+    (height, width) = ink.shape
+    if stride < width:
+        raise ValueError("Stride of %d is less than the width of %d" %
+                         (stride, width))
+    white = np.ones((height, stride), dtype=bool)
+    np.logical_not(ink, out=white[:, :width])
+    return np.packbits(white, axis=1).reshape(-1)
+
+
 class Display():
     """
     Interface class for different eInk displays.
@@ -99,6 +443,18 @@ class Display():
         pass
 
 
+    def display_ink(self, ink):
+        """
+        Display the given frame of ink, where `True` means black. Displays
+        which can take this straight to their controllers should do so, this
+        turns it into an image for `display_image()`.
+
+        :param ink: The ``(height, width)`` NumPy array.
+        :type ink:  numpy.ndarray
+        """
+        self.display_image(ink_image(ink, self.mode, self.white, self.black))
+
+
 class Pink():
     """
     When I know what this does I will fill this in.
@@ -110,9 +466,12 @@ class Pink():
     def __init__(self,
                  display,
                  frame_width  =1,
-                 font_filename="/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf"):
+                 font_filename="/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf",
+                 atlas        =True):
         """
         :param font_filename: The path to the TTF font to use
+        :param atlas:         Whether to draw using a `GlyphAtlas`, rather
+                              than with PIL
         """
         # The Display to use
         self._display = display
@@ -123,10 +482,268 @@ class Pink():
         # The font we will use
         self._font = _Font(font_filename)
 
+        # What we draw the text with, if not PIL
+        self._atlas = GlyphAtlas(self._font) if atlas else None
+
+        # The server renders with us from more than one thread at once, and
+        # the fonts and atlas can only be used by one of them at a time
+        self._lock = threading.RLock()
 
-    def write(self, text):
+        # What we measure text with, when fitting it. This only ever
+        # rasterises glyphs if it's also what we draw with.
+        self._metrics = self._atlas or GlyphAtlas(self._font)
+
+        # How many layouts fitting the last text took, for seeing how well
+        # the search is doing
+        self.evaluations = 0
+
+
+    @property
+    def display(self):
+        """
+        The `Display` which we draw on.
+        """
+        return self._display
+
+
+    def write(self, text, size=None):
         """
         Write the text the the center of the screen.
+
+        :param size: The font size, or `None` for as big as will fit.
+        """
+        if self._atlas is None:
+            self.show(self.render(text, size))
+        else:
+            self.show_ink(self.render_ink(text, size))
+
+
+    def write_fitted(self, text):
+        """
+        Rewrap the text to be as big as it can be, and write it the the center
+        of the screen.
+
+        @see Pink.fit()
+        """
+        self.write(*self.fit(text))
+
+
+    def fit(self, text):
+        """
+        Lay out the text so that it's as big as it can be on the display,
+        searching over both how wide to wrap it and what size to draw it at.
+
+        Wrapping it narrower gives more lines, and so the height lets us have
+        a smaller font, while wrapping it wider means the width does. The best
+        size is where one gives way to the other, and so we binary search for
+        that. Each width is only wrapped once, and each wrapping only measured
+        once, and the width is only measured for sizes which the height allows.
+
+        :return: The ``(text, size)`` which was settled on.
+        """
+        with self._lock:
+            return self._fit(text)
+
+
+    def _fit(self, text):
+        """
+        @see Pink.fit()
+        """
+        paragraphs = _paragraphs(text)
+        self.evaluations = 0
+        if not paragraphs:
+            return (text, self._fit_size(('',)))
+        words = [paragraph.split() for paragraph in paragraphs]
+
+        # The narrowest we can wrap it is the longest word, and the widest is
+        # not wrapping it at all
+        narrowest = max(len(word) for paragraph in words for word in paragraph)
+        widest    = max(len(paragraph) for paragraph in paragraphs)
+
+        # Each width's wrapping, and each wrapping's (size, whether the height
+        # is what limits it); different widths often wrap the same way
+        wraps  = {}
+        limits = {}
+        def limit(cols):
+            lines = wraps.get(cols)
+            if lines is None:
+                lines = wraps[cols] = tuple(line
+                                            for paragraph in words
+                                            for line in _wrap(paragraph, cols))
+            if lines not in limits:
+                self.evaluations += 1
+                tallest = self._fit_size(lines, width=False)
+                if self._fits(lines, tallest, height=False):
+                    limits[lines] = (tallest, True)
+                else:
+                    limits[lines] = (self._fit_size(lines, right=tallest),
+                                     False)
+            return (lines, limits[lines])
+
+        # Find the narrowest wrapping which is limited by its width
+        (left, right) = (narrowest, widest + 1)
+        while left < right:
+            mid = (left + right) // 2
+            (_, (_, by_height)) = limit(mid)
+            if by_height:
+                left  = mid + 1
+            else:
+                right = mid
+
+        # The best is either that, or the one just narrower, which is limited
+        # by its height. On a tie, we want fewer lines.
+        best = None
+        for cols in (left, left - 1):
+            if narrowest <= cols <= widest:
+                (lines, (size, _)) = limit(cols)
+                if best is None or size > best[1]:
+                    best = (lines, size)
+        (lines, size) = best
+        logging.debug("Fitted %d lines at size %d after %d layouts",
+                      len(lines), size, self.evaluations)
+        return ('\n'.join(lines), size)
+
+
+    def show(self, image):
+        """
+        Put an image, from `render()`, on the display.
+        """
+        self._display.display_image(image)
+
+
+    def show_ink(self, ink):
+        """
+        Put a frame of ink, from `render_ink()`, on the display.
+        """
+        self._display.display_ink(ink)
+
+
+    @property
+    def atlas(self):
+        """
+        The `GlyphAtlas` which we draw with, if any.
+        """
+        return self._atlas
+
+
+    def render(self, text, size=None):
+        """
+        Render the text into the center of an image which is the size of the
+        display.
+
+        :param size: The font size, or `None` for as big as will fit.
+
+        :return: The PIL `Image`.
+        """
+        with self._lock:
+            if self._atlas is None:
+                return self._render_pil(text, size)
+            return self._to_image(self._render_ink(text, size))
+
+
+    def render_ink(self, text, size=None):
+        """
+        Render the text into the center of a frame which is the size of the
+        display, using the atlas.
+
+        :param size: The font size, or `None` for as big as will fit.
+
+        :return: The ``(height, width)`` NumPy array of where the ink goes.
+        """
+        with self._lock:
+            return self._render_ink(text, size)
+
+
+    def _render_ink(self, text, size):
+        """
+        @see Pink.render_ink()
+        """
+        atlas = self._atlas
+        (width, height) = (self._display.width, self._display.height)
+        ink   = np.empty((height, width), dtype=bool)
+        fw    = self._frame_width
+
+        # The frame, and the white inside of it, in the same place as PIL's
+        # rectangles would put them
+        ink[:, :] = fw > 0
+        ink[fw:height - 2*fw + 1, fw:width - 2*fw + 1] = False
+
+        # The text, which we break up by lines, and the biggest size which
+        # it fits with
+        lines = tuple(line.strip() for line in text.split('\n'))
+        if size is None:
+            size = self._fit_size(lines)
+        if self._font.by_size(size) is None:
+            raise ValueError("No font")
+
+        # Draw it
+        line_height = atlas.line_height(size)
+        mid_x = width  // 2
+        mid_y = height // 2
+        for (i, line) in enumerate(lines):
+            x = mid_x - atlas.width(line, size) // 2
+            y = int(mid_y + (i - len(lines) / 2) * line_height)
+            atlas.draw(ink, line, x, y, size)
+
+        return ink
+
+
+    def _fits(self, lines, size, width=True, height=True):
+        """
+        Whether some lines fit on the display in the given font size, going by
+        their width and height, or just one of them.
+        """
+        metrics = self._metrics
+        if self._font.by_size(size) is None:
+            return False
+        fw = self._frame_width
+        if height:
+            max_height = self._display.height - 2*fw - 2
+            if metrics.line_height(size) * len(lines) > max_height:
+                return False
+        if width:
+            max_width = self._display.width - 2*fw - 2
+            if any(metrics.width(line, size) > max_width for line in lines):
+                return False
+        return True
+
+
+    def _fit_size(self, lines, right=None, width=True, height=True):
+        """
+        Do a binary search to determine the maximum size which we can display
+        some lines with, just like with PIL, but measuring with the atlas.
+
+        :param right: The smallest size which we already know doesn't fit.
+        """
+        (left, right) = (self._MIN_FONT_SIZE, right or self._MAX_FONT_SIZE)
+        while left + 1 < right:
+            mid = (right - left) // 2 + left
+            if self._font.by_size(mid) is None:
+                break
+            if self._fits(lines, mid, width=width, height=height):
+                left  = mid
+            else:
+                right = mid
+        return left
+
+
+    def _to_image(self, ink):
+        """
+        Turn a frame into an image in the display's mode, in one go.
+        """
+        return ink_image(ink,
+                         self._display.mode,
+                         self._display.white,
+                         self._display.black)
+
+
+    def _render_pil(self, text, size=None):
+        """
+        Render the text using PIL to lay it out and draw it.
+
+        :param size: The font size, or `None` for as big as will fit.
+
+        :return: The PIL `Image`.
         """
         image = Image.new(self._display.mode,
                           (self._display.width, self._display.height))
@@ -152,51 +769,114 @@ class Pink():
         # And the text. We break it up by lines.
         lines = tuple(line.strip() for line in text.split('\n'))
 
-        # Do a binary search to determine the maximum size which we can display
-        # it with. We have the +1 in the test since the steps are integers and
-        # so the "midpoint" of 2 and 3 will be 2.
-        (left, right) = (self._MIN_FONT_SIZE, self._MAX_FONT_SIZE)
-        font = None
-        while left + 1 < right:
-            # Get the font which is the midpoint size
-            mid = (right - left) // 2 + left
-            logging.info("Searching %d in [%d,%d]", mid, left, right)
-
-            font = self._font.by_size(mid)
-            if font is None:
-                break
-
-            # How big for the text?
-            width  = 0
-            height = 0
-            for line in lines:
-                (w, h) = font.getsize(line)
-                width  = max(w, width)
-                height = max(h, height)
-
-            # And recurse down. The total height will be the max line height
-            # times the number of lines.
-            if width <= max_width and height * len(lines) <= max_height:
-                left  = mid
-            else:
-                right = mid
+        if size is None:
+            # Do a binary search to determine the maximum size which we can
+            # display it with. We have the +1 in the test since the steps are
+            # integers and so the "midpoint" of 2 and 3 will be 2.
+            (left, right) = (self._MIN_FONT_SIZE, self._MAX_FONT_SIZE)
+            font = None
+            while left + 1 < right:
+                # Get the font which is the midpoint size
+                mid = (right - left) // 2 + left
+                logging.info("Searching %d in [%d,%d]", mid, left, right)
+
+                font = self._font.by_size(mid)
+                if font is None:
+                    break
+
+                # How big for the text?
+                width  = 0
+                height = 0
+                for line in lines:
+                    (w, h) = _text_size(font, line)
+                    width  = max(w, width)
+                    height = max(h, height)
+
+                # And recurse down. The total height will be the max line
+                # height times the number of lines.
+                if width <= max_width and height * len(lines) <= max_height:
+                    left  = mid
+                else:
+                    right = mid
+        else:
+            left = size
 
         # Anything?
         font = self._font.by_size(left)
         if font is None:
             raise ValueError("No font")
+        if size is not None:
+            height = max(_text_size(font, line)[1] for line in lines)
 
         # Draw it using the font
         mid_x = self._display.width  // 2
         mid_y = self._display.height // 2
         for (i, line) in enumerate(lines):
-            (width, _) = font.getsize(line)
+            (width, _) = _text_size(font, line)
             x = mid_x - width // 2
             y = mid_y + (i - len(lines) / 2) * height
             draw.text((x, y), line, fill=self._display.black, font=font)
 
-        # Display the image which we drew
-        self._display.display_image(image)
+        # And give back the image which we drew
+        return image
+
+
+class Canvas(Display):
+    """
+    A display which is just an image of a given geometry, for rendering into
+    without any hardware; like when rendering for someone else's display.
+    """
+    def __init__(self, width, height, mode, white, black):
+        self._width  = int(width)
+        self._height = int(height)
+        self._mode   = mode
+        self._white  = white
+        self._black  = black
+        self.image   = None
+
+
+    @property
+    def mode(self):
+        """
+        The PIL concept mode for the display.
+        """
+        return self._mode
+
+
+    @property
+    def width(self):
+        """
+        The display width.
+        """
+        return self._width
+
+
+    @property
+    def height(self):
+        """
+        The display height.
+        """
+        return self._height
+
+
+    @property
+    def white(self):
+        """
+        The display's colour white.
+        """
+        return self._white
+
+
+    @property
+    def black(self):
+        """
+        The display's colour black.
+        """
+        return self._black
+
+
+    def display_image(self, image):
+        self.image = image
 
 
 class SSD1675Display(Display):
@@ -270,6 +950,40 @@ class SSD1675Display(Display):
         self._display.display()
 
 
+    def display_ink(self, ink):
+        """
+        @see Display.display_ink()
+
+        We write straight into the driver's black buffer, in the controller's
+        layout, rather than have it walk over an image a pixel at a time.
+        """
+        buffer = getattr(self._display, '_buffer1', None)
+        if not isinstance(buffer, bytearray):
+            # It's in the SRAM, so we have to go the slow way
+            super().display_ink(ink)
+            return
+        buffer[:] = ssd1675_buffer(ink, self._display.rotation).tobytes()
+        self._display.display()
+
+
+def ssd1675_buffer(ink, rotation):
+    """
+    Turn a frame into an SSD1675's black buffer. The driver's frame buffer
+    rotates things clockwise by the given number of quarter turns to get them
+    into the controller's orientation, and pads each row to a whole byte.
+
+    :type ink: numpy.ndarray
+    :param ink:
+        The ``(height, width)`` frame, as it appears on the display.
+    :type rotation: int
+    :param rotation:
+        The driver's rotation.
+    """
+    native_width = ink.shape[1 if rotation % 2 == 0 else 0]
+    return pack_bits(ink,
+                     turns =-rotation,
+                     stride=(native_width + 7) // 8 * 8)
+
 
 class InkyDisplay(Display):
     def __init__(self):
@@ -323,6 +1037,54 @@ class InkyDisplay(Display):
         self._display.set_image(image)
         self._display.show()
 
+
+    def display_ink(self, ink):
+        """
+        @see Display.display_ink()
+
+        For the black and white, and red or yellow, displays we put the frame
+        straight into the display's buffer, without having to go via an
+        image, and have `show()` send it.
+        """
+        display = self._display
+        buf     = inky_buffer(ink, display)
+        if buf is None:
+            super().display_ink(ink)
+            return
+        display.buf = buf
+        display.show()
+
+
+def inky_buffer(ink, display):
+    """
+    Turn a frame into what an Inky keeps in its ``buf``, which is what
+    `set_image()` would have put there: the palette index of each pixel.
+
+    This relies on how the black and white, and red or yellow, Inky classes
+    (`inky.Inky`, `InkyPHAT_SSD1608` and `InkyWHAT_SSD1683`, as of inky 2.6)
+    keep their buffer, which `show()` then rotates, flips and packs for the
+    controller.
+
+    :type ink: numpy.ndarray
+    :param ink:
+        The ``(height, width)`` frame.
+    :param display:
+        The Inky.
+
+    :return: The buffer, or `None` if it's not an Inky which we know how to
+             do this for, and so `set_image()` should be used.
+    """
+    buf = getattr(display, 'buf', None)
+    if (getattr(display, 'colour', None) not in ('black', 'red', 'yellow') or
+        not isinstance(buf, np.ndarray) or
+        buf.size != ink.size or
+        getattr(display, 'offset_x', 0) or
+        getattr(display, 'offset_y', 0)):
+        return None
+    return np.where(ink,
+                    np.uint8(display.BLACK),
+                    np.uint8(display.WHITE)).reshape(buf.shape)
+
 # --------------------------------------------------------
 
 if __name__ == "__main__":
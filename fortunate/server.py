@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+A fortune server, for when there are a number of displays.
+
+Rather than each display having its own `Fortune`, with its own copy of the
+index and of the history, one server holds them and hands out fortunes over a
+Unix domain socket. It can also render them, for a display of a given
+geometry, so that the displays don't all need to do that themselves. The next
+frame for each geometry is rendered ahead of time, while nobody is asking for
+anything.
+
+The protocol is a line of JSON from the client, e.g.::
+
+    {"op": "pick", "query": "cat", "categories": ["wisdom"]}
+    {"op": "frame", "width": 212, "height": 104, "mode": "P",
+     "white": 0, "black": 1}
+
+and a line of JSON back, with the ``text`` of the fortune, or an ``error``.
+For frames this also has the ``size`` of the image's raw bytes, which come
+straight after it.
+
+`FortuneClient` is what talks to it, and which falls back to a local `Fortune`
+if there's no server.
+"""
+
+from   pink  import Canvas, Pink
+from   PIL   import Image
+
+import asyncio
+import argparse
+import fortune
+import json
+import logging as LOG
+import os
+import socket
+import time
+
+# ----------------------------------------------------------------------
+
+# Where the server listens by default
+SOCKET = '/tmp/fortunate.sock'
+
+# The most that we'll read for a request
+_MAX_REQUEST = 64 * 1024
+
+# ----------------------------------------------------------------------
+
+class FortuneServer():
+    """
+    Serves fortunes, from a `Fortune`, over a Unix domain socket.
+    """
+    # How many frames, for different geometries, we render ahead of time
+    _MAX_GEOMETRIES = 8
+
+    def __init__(self, fortune, path=SOCKET):
+        """
+        :type fortune: fortune.Fortune
+        :param fortune:
+            Where the fortunes come from.
+        :type path: str
+        :param path:
+            The socket to listen on. Any existing file there is removed.
+        """
+        self._fortune = fortune
+        self._path    = path
+
+        # The renderer for each geometry, and its next frame, which is a
+        # future that gives the (text, image) pair
+        self._pinks = {}
+        self._next  = {}
+
+        # How many requests we have served
+        self.requests = 0
+
+
+    async def serve(self):
+        """
+        Serve forever.
+        """
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+        server = await asyncio.start_unix_server(self._handle, path=self._path,
+                                                 limit=_MAX_REQUEST)
+        LOG.info("Serving fortunes on %s", self._path)
+        async with server:
+            await server.serve_forever()
+
+
+    async def _handle(self, reader, writer):
+        """
+        Handle one client, for as long as it wants.
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    op = request.get('op')
+                    if op == 'pick':
+                        (reply, data) = (self._pick(request), b'')
+                    elif op == 'frame':
+                        (reply, data) = await self._frame(request)
+                    else:
+                        raise ValueError("Unknown op: %s" % (op,))
+                except Exception as e:
+                    LOG.debug("Bad request %r: %s", line, e)
+                    (reply, data) = ({'error' : str(e)}, b'')
+
+                self.requests += 1
+                writer.write(json.dumps(reply).encode() + b'\n')
+                if data:
+                    writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            LOG.debug("Client went away: %s", e)
+        finally:
+            writer.close()
+
+
+    def _pick(self, request):
+        """
+        Handle a pick request.
+        """
+        return {'text' : self._fortune.pick(query     =request.get('query'),
+                                            categories=request.get('categories'))}
+
+
+    async def _frame(self, request):
+        """
+        Handle a frame request, giving back the one which we rendered earlier
+        for the geometry, if we have it, and starting on the next one.
+        """
+        geometry = self._geometry(request)
+        future   = self._next.pop(geometry, None)
+        if future is None:
+            future = self._render_next(geometry)
+        (text, fortune_hash, image) = await future
+
+        # It's only been shown now that we're handing it out
+        self._fortune.remember(fortune_hash)
+
+        # Start on the next one, while we're not doing anything else. If we
+        # have too many then we drop the least recently asked for.
+        if len(self._next) >= self._MAX_GEOMETRIES:
+            self._next.pop(next(iter(self._next)))
+        self._next[geometry] = self._render_next(geometry)
+
+        if image is None:
+            return ({'text' : text}, b'')
+        data = image.tobytes()
+        return ({'text'   : text,
+                 'width'  : image.width,
+                 'height' : image.height,
+                 'mode'   : image.mode,
+                 'size'   : len(data)},
+                data)
+
+
+    def _render_next(self, geometry):
+        """
+        Pick a fortune and start rendering it, in another thread, for the given
+        geometry.
+
+        :return: The future which will give the ``(text, fingerprint, image)``.
+        """
+        pink = self._pinks.get(geometry)
+        if pink is None:
+            if len(self._pinks) >= self._MAX_GEOMETRIES:
+                self._pinks.pop(next(iter(self._pinks)))
+            (width, height, mode, white, black, frame_width) = geometry
+            pink = self._pinks[geometry] = Pink(
+                Canvas(width, height, mode, white, black),
+                frame_width=frame_width
+            )
+
+        # The picking is done here, since Fortune isn't thread-safe. It doesn't
+        # go in the history until someone is given it, so that frames which
+        # are thrown away don't count.
+        (text, fortune_hash) = self._fortune.pick(remember=False)
+        def render():
+            if not text:
+                return (text, fortune_hash, None)
+            return (text, fortune_hash, pink.render(*pink.fit(text)))
+        return asyncio.get_running_loop().run_in_executor(None, render)
+
+
+    @staticmethod
+    def _geometry(request):
+        """
+        The geometry which a frame request is for, as a hashable tuple.
+        """
+        def colour(value):
+            return tuple(value) if isinstance(value, list) else value
+        width  = int(request['width'])
+        height = int(request['height'])
+        if not (0 < width <= 4096 and 0 < height <= 4096):
+            raise ValueError("Bad geometry: %dx%d" % (width, height))
+        return (width,
+                height,
+                str(request.get('mode', '1')),
+                colour(request.get('white', 1)),
+                colour(request.get('black', 0)),
+                int(request.get('frame_width', 1)))
+
+# ----------------------------------------------------------------------
+
+class FortuneClient():
+    """
+    Gets fortunes from a `FortuneServer`, or from a local `Fortune` if there
+    isn't one.
+    """
+    # How long to wait before trying the server again after it failed
+    _RETRY_TIME = 60.0
+
+    def __init__(self, path=SOCKET, fallback=None, timeout=10.0):
+        """
+        :type path: str
+        :param path:
+            The server's socket.
+        :type fallback: function
+        :param fallback:
+            What to call to make the local `Fortune` to use when the server
+            isn't there, or `None` to not have one. It's only called when it's
+            first needed.
+        :type timeout: float
+        :param timeout:
+            How long to wait for the server, in seconds.
+        """
+        self._path     = path
+        self._make     = fallback
+        self._fallback = None
+        self._timeout  = float(timeout)
+        self._socket   = None
+        self._reader   = None
+        self._failed   = None
+
+
+    def pick(self, query=None, categories=None):
+        """
+        @see Fortune.pick()
+        """
+        if self._use_server():
+            try:
+                (reply, _) = self._request({'op'         : 'pick',
+                                            'query'      : query,
+                                            'categories' : categories})
+                return reply.get('text')
+            except (OSError, ValueError) as e:
+                self._fail(e)
+        return self._local().pick(query=query, categories=categories)
+
+
+    def frame(self, display, frame_width=1):
+        """
+        Get a fortune rendered for a display.
+
+        :type display: pink.Display
+        :param display:
+            The display which it's for. Only its geometry and colours are
+            looked at.
+
+        :return: The ``(text, image)`` of the fortune. The image is `None` if
+                 we couldn't get one from the server, in which case it's up to
+                 the caller to render the text.
+        """
+        if self._use_server():
+            try:
+                (reply, data) = self._request({'op'          : 'frame',
+                                               'width'       : display.width,
+                                               'height'      : display.height,
+                                               'mode'        : display.mode,
+                                               'white'       : display.white,
+                                               'black'       : display.black,
+                                               'frame_width' : frame_width})
+                image = None
+                if data:
+                    image = Image.frombytes(reply['mode'],
+                                            (reply['width'], reply['height']),
+                                            data)
+                return (reply.get('text'), image)
+            except (OSError, ValueError, KeyError) as e:
+                self._fail(e)
+        return (self._local().pick(), None)
+
+
+    def close(self):
+        """
+        Drop the connection to the server.
+        """
+        if self._socket is not None:
+            self._reader.close()
+            self._socket.close()
+            self._socket = None
+            self._reader = None
+
+    # ----------------------------------------------------------------------
+
+    def _use_server(self):
+        """
+        Whether we should try the server.
+        """
+        if self._failed is not None:
+            if time.monotonic() - self._failed < self._RETRY_TIME:
+                return False
+            self._failed = None
+        return self._socket is not None or os.path.exists(self._path)
+
+
+    def _request(self, request):
+        """
+        Send a request, and get the reply.
+
+        :return: The reply, and any data after it.
+        """
+        if self._socket is None:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.settimeout(self._timeout)
+            try:
+                self._socket.connect(self._path)
+            except OSError:
+                self._socket.close()
+                self._socket = None
+                raise
+            self._reader = self._socket.makefile('rb')
+
+        self._socket.sendall(json.dumps(request).encode() + b'\n')
+        line = self._reader.readline(_MAX_REQUEST)
+        if not line.endswith(b'\n'):
+            raise ConnectionError("Server went away")
+        reply = json.loads(line)
+        if 'error' in reply:
+            raise ValueError("Server said: %s" % reply['error'])
+
+        data = b''
+        size = int(reply.get('size', 0))
+        if size:
+            data = self._reader.read(size)
+            if len(data) != size:
+                raise ConnectionError("Server went away")
+        return (reply, data)
+
+
+    def _fail(self, error):
+        """
+        Note that the server failed us, so that we use the local `Fortune` for
+        a while.
+        """
+        LOG.warning("Falling back to local fortunes: %s", error)
+        self.close()
+        self._failed = time.monotonic()
+
+
+    def _local(self):
+        """
+        Get the local `Fortune`.
+        """
+        if self._fallback is None:
+            if self._make is None:
+                raise ValueError("No fortune server on %s" % self._path)
+            self._fallback = self._make()
+        return self._fallback
+
+# ----------------------------------------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--socket', default=SOCKET,
+                        help="Where to listen")
+    parser.add_argument('--fortunes', default="/usr/share/games/fortunes",
+                        help="The fortunes directory, or a pack")
+    parser.add_argument('--max-length', type=int, default=800,
+                        help="The longest fortune to serve, in bytes")
+    args = parser.parse_args()
+
+    server = FortuneServer(fortune.create(fortunes_dir=args.fortunes,
+                                          max_length  =args.max_length),
+                           path=args.socket)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,292 @@
+"""
+Watching a directory tree for changes.
+
+A watcher tells you which paths under a directory might have changed since you
+last asked. A path which is a directory means that anything under it might
+have changed. It's up to the caller to go and look at them.
+
+On Linux we use inotify, which the kernel tells us about changes through, so
+asking is just a non-blocking read. Elsewhere, or if that fails, we fall back
+to polling the modification times of the directories. That notices files being
+added, removed and renamed but not files being changed in place, which is fine
+for the likes of the fortune files.
+"""
+
+from   abc import abstractmethod
+
+import ctypes
+import ctypes.util
+import errno
+import logging as LOG
+import os
+import struct
+import time
+
+# ----------------------------------------------------------------------
+
+class Watcher():
+    """
+    Something which tells you what might have changed under a directory.
+    """
+    def __init__(self, root):
+        """
+        :type root: str
+        :param root:
+            The top of the directory tree to watch.
+        """
+        self.root = os.path.abspath(root)
+
+
+    @abstractmethod
+    def changes(self):
+        """
+        Find out what might have changed since the last time that we were asked.
+        This should be cheap to call often.
+
+        :return: The set of paths, files or directories, which might have
+                 changed.
+        """
+        pass
+
+
+    def close(self):
+        """
+        Stop watching.
+        """
+        pass
+
+
+class PollingWatcher(Watcher):
+    """
+    A watcher which looks at the directories' modification times every so
+    often.
+    """
+    def __init__(self, root, interval=1.0):
+        """
+        @see Watcher.__init__()
+
+        :type interval: float
+        :param interval:
+            The most often that we will look, in seconds.
+        """
+        super().__init__(root)
+        self._interval = float(interval)
+        self._last     = time.monotonic()
+
+        # What we last saw: the modification time of each directory and the
+        # (mtime, size) of each of the things in it
+        self._dirs = {}
+        self._snapshot(self.root, set())
+
+
+    def changes(self):
+        """
+        @see Watcher.changes()
+        """
+        # Not too often
+        now = time.monotonic()
+        if now - self._last < self._interval:
+            return set()
+        self._last = now
+
+        changed = set()
+        for path in tuple(self._dirs.keys()):
+            if path not in self._dirs:
+                # We dropped it already, as part of a parent going away
+                continue
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                # Gone, along with everything under it
+                self._drop(path)
+                changed.add(path)
+                continue
+            if mtime != self._dirs[path][0]:
+                self._snapshot(path, changed)
+        return changed
+
+
+    def _snapshot(self, path, changed):
+        """
+        Look at what's in a directory, noting anything which differs from what
+        we saw before in ``changed``. New sub-directories are looked into too.
+        """
+        (_, before) = self._dirs.get(path, (None, {}))
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            names = os.listdir(path)
+        except OSError as e:
+            LOG.debug("Can't look in %s: %s", path, e)
+            return
+
+        entries = {}
+        for name in names:
+            full = os.path.join(path, name)
+            try:
+                stat = os.stat(full)
+            except OSError:
+                continue
+            is_dir = os.path.isdir(full)
+            entries[name] = (is_dir, stat.st_mtime_ns, stat.st_size)
+            if is_dir and full not in self._dirs:
+                # Something new to watch
+                if path in self._dirs:
+                    changed.add(full)
+                self._snapshot(full, changed)
+            elif not is_dir and before.get(name) != entries[name]:
+                changed.add(full)
+        for name in before.keys() - entries.keys():
+            full = os.path.join(path, name)
+            self._drop(full)
+            changed.add(full)
+
+        self._dirs[path] = (mtime, entries)
+
+
+    def _drop(self, path):
+        """
+        Forget about a directory, and everything under it.
+        """
+        prefix = path + os.sep
+        for dirname in tuple(self._dirs.keys()):
+            if dirname == path or dirname.startswith(prefix):
+                del self._dirs[dirname]
+
+
+class InotifyWatcher(Watcher):
+    """
+    A watcher which uses Linux's inotify.
+    """
+    # From <sys/inotify.h>
+    _IN_MODIFY      = 0x00000002
+    _IN_ATTRIB      = 0x00000004
+    _IN_CLOSE_WRITE = 0x00000008
+    _IN_MOVED_FROM  = 0x00000040
+    _IN_MOVED_TO    = 0x00000080
+    _IN_CREATE      = 0x00000100
+    _IN_DELETE      = 0x00000200
+    _IN_DELETE_SELF = 0x00000400
+    _IN_MOVE_SELF   = 0x00000800
+    _IN_Q_OVERFLOW  = 0x00004000
+    _IN_IGNORED     = 0x00008000
+    _IN_ISDIR       = 0x40000000
+    _IN_NONBLOCK    = 0o4000
+    _IN_CLOEXEC     = 0o2000000
+
+    # What we want to hear about
+    _MASK = (_IN_CLOSE_WRITE | _IN_ATTRIB     | _IN_MOVED_FROM  |
+             _IN_MOVED_TO    | _IN_CREATE     | _IN_DELETE      |
+             _IN_DELETE_SELF | _IN_MOVE_SELF)
+
+    # The header of each event: wd, mask, cookie and the length of the name
+    _EVENT = struct.Struct('iIII')
+
+    def __init__(self, root):
+        """
+        @see Watcher.__init__()
+        """
+        super().__init__(root)
+
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                                 use_errno=True)
+        self._fd = self._libc.inotify_init1(self._IN_NONBLOCK |
+                                            self._IN_CLOEXEC)
+        if self._fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, "inotify_init1 failed: %s" % os.strerror(e))
+
+        # The directory for each watch descriptor
+        self._wds = {}
+        self._add_tree(self.root)
+
+
+    def changes(self):
+        """
+        @see Watcher.changes()
+        """
+        changed = set()
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+
+            offset = 0
+            while offset < len(data):
+                (wd, mask, _, length) = self._EVENT.unpack_from(data, offset)
+                offset += self._EVENT.size
+                name    = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+
+                if mask & self._IN_Q_OVERFLOW:
+                    # We missed things, so everything might have changed
+                    LOG.warning("Inotify queue overflowed for %s", self.root)
+                    changed.add(self.root)
+                    continue
+
+                dirname = self._wds.get(wd)
+                if mask & self._IN_IGNORED:
+                    self._wds.pop(wd, None)
+                    continue
+                if dirname is None:
+                    continue
+
+                path = (os.path.join(dirname, os.fsdecode(name)) if name
+                        else dirname)
+                changed.add(path)
+
+                # New directories need watching too
+                if (mask & self._IN_ISDIR and
+                    mask & (self._IN_CREATE | self._IN_MOVED_TO)):
+                    self._add_tree(path)
+
+        return changed
+
+
+    def close(self):
+        """
+        @see Watcher.close()
+        """
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+    def _add_tree(self, path):
+        """
+        Watch a directory and everything under it.
+        """
+        for (subdir, _, _) in os.walk(path, followlinks=True):
+            wd = self._libc.inotify_add_watch(self._fd,
+                                              os.fsencode(subdir),
+                                              self._MASK)
+            if wd < 0:
+                e = ctypes.get_errno()
+                if e == errno.ENOSPC:
+                    LOG.warning("Out of inotify watches, not watching %s",
+                                subdir)
+                else:
+                    LOG.debug("Can't watch %s: %s", subdir, os.strerror(e))
+                continue
+            self._wds[wd] = subdir
+
+# ----------------------------------------------------------------------
+
+def create(root, interval=1.0):
+    """
+    Create the best watcher that we can for the given directory.
+
+    :type root: str
+    :param root:
+        The top of the directory tree to watch.
+    :type interval: float
+    :param interval:
+        How often to look, if we have to poll.
+    """
+    try:
+        return InotifyWatcher(root)
+    except (OSError, AttributeError) as e:
+        LOG.info("Falling back to polling %s: %s", root, e)
+        return PollingWatcher(root, interval)
@@ -0,0 +1,487 @@
+#!/usr/bin/env python3
+"""
+Headless benchmarks for the Pimoroni projects.
+
+These use `framebuffer.FakeDisplay` in place of the real display modules, so
+they can run anywhere.
+"""
+
+from   buttons     import SimulatedButton
+from   framebuffer import FakeDisplay, FakeScrollDisplay, FrameBuffer
+
+import argparse
+import contextlib
+import io
+import random
+import sys
+import threading
+import time
+import types
+
+# ----------------------------------------------------------------------
+
+def _fake(name, display):
+    """
+    Install a fake display as the named module, so that the games can be
+    imported without the hardware.
+    """
+    sys.modules.setdefault(name, display)
+    return sys.modules[name]
+
+
+def _fake_rockfall(show_time=0.0):
+    """
+    Import rockfall with a fake display and buttons.
+
+    :return: The rockfall module and the display.
+    """
+    display = _fake('scrollphathd', FakeScrollDisplay(show_time=show_time))
+    _fake('gpiozero', types.SimpleNamespace(Button=SimulatedButton))
+    import rockfall
+    return (rockfall, display)
+
+# ----------------------------------------------------------------------
+
+def bench_pacman_render(args):
+    """
+    Compare redrawing the whole pacman grid every frame against the
+    framebuffer, with sprites moving about at about the rate which they do in
+    the game.
+    """
+    display = _fake('unicornhathd', FakeDisplay(with_buffer=not args.no_buffer))
+    import pacman
+    import pacman_engine
+
+    (width, height) = display.get_shape()
+    grid  = pacman_engine.GameState().grid
+    rng   = random.Random(0)
+    moves = [[(rng.randrange(width), rng.randrange(height)) for _ in range(5)]
+             for _ in range(args.frames // args.frames_per_move + 1)]
+
+    def full(frame):
+        display.clear()
+        for x in range(width):
+            for y in range(height):
+                (r, g, b) = pacman._GRID_COLOURS[grid[x, y]]
+                display.set_pixel(x, y, r, g, b)
+        for (x, y) in moves[frame // args.frames_per_move]:
+            display.set_pixel(x, y, 255, 255, 0)
+        display.show()
+
+    fb         = FrameBuffer(display, width, height)
+    background = pacman.draw_grid(grid)
+    def buffered(frame):
+        fb.blit(background)
+        for (x, y) in moves[frame // args.frames_per_move]:
+            fb.set_pixel(x, y, 255, 255, 0)
+        fb.show()
+
+    for (name, draw) in (('full redraw', full), ('framebuffer', buffered)):
+        (display.set_pixels, display.shows, display.spi_bytes) = (0, 0, 0)
+        start = time.perf_counter()
+        for frame in range(args.frames):
+            draw(frame)
+        took = time.perf_counter() - start
+        print("%-12s %7.1fus/frame %6.1f set_pixels/frame "
+              "%5.2f shows/frame %7.1f SPI bytes/frame" %
+              (name,
+               took / args.frames * 1e6,
+               display.set_pixels / args.frames,
+               display.shows      / args.frames,
+               display.spi_bytes  / args.frames))
+
+
+def bench_pacman_sim(args):
+    """
+    Simulate lots of pacman games headlessly, with random or scripted inputs,
+    and report how they went. This is for tuning the ghost timings.
+    """
+    from pacman_engine import Engine
+    from pacman_maze   import DIRECTIONS, UP, DOWN, LEFT, RIGHT
+
+    # The inputs, either a script of w/a/s/d/. (for no move) characters, which
+    # we loop over, or random
+    if args.script:
+        keys = {'w': UP, 's': DOWN, 'a': LEFT, 'd': RIGHT, '.': None}
+        with open(args.script, 'rt') as fh:
+            script = tuple(keys[c] for c in fh.read() if c in keys)
+        if not script:
+            raise ValueError("No moves in %s" % (args.script,))
+    else:
+        script = None
+
+    rng     = random.Random(args.seed)
+    scores  = []
+    times   = []
+    cleared = 0
+    steps   = 0
+    start   = time.perf_counter()
+    for game in range(args.games):
+        engine = Engine(rng=random.Random(rng.random()),
+                        ghost_step_time=args.ghost_step_time,
+                        ghost_eat_time =args.ghost_eat_time)
+        direction = rng.choice(DIRECTIONS)
+        while engine.now < args.max_time:
+            if script is not None:
+                direction = script[steps % len(script)]
+            elif rng.random() < 0.2:
+                direction = rng.choice(DIRECTIONS)
+            steps += 1
+            if not engine.step(direction, args.dt):
+                break
+        scores.append(engine.state.score)
+        times .append(engine.now)
+        if engine.over == Engine.CLEARED:
+            cleared += 1
+    took = time.perf_counter() - start
+
+    print("%d games in %0.2fs: %0.1f games/s, %0.0f steps/s" %
+          (args.games, took, args.games / took, steps / took))
+    print("Score: mean %0.1f, max %d" %
+          (sum(scores) / len(scores), max(scores)))
+    print("Time:  mean %0.1fs" % (sum(times) / len(times),))
+    print("Cleared: %0.1f%%" % (100.0 * cleared / args.games,))
+
+
+def bench_pacman_check(args):
+    """
+    Play lots of random pacman games on every level and check that the rules
+    hold after every step: everyone stays on the grid and out of the walls,
+    pacman moves at most one cell at a time, the pills and score only go one
+    way, and pacman never meets a ghost and lives unless it could eat it. Any
+    failure is reported with the seed which reproduces it.
+    """
+    import numpy as np
+    import pacman_levels
+    from   pacman_engine import Engine, GameState
+    from   pacman_maze   import DIRECTIONS, WALL, PILL, EATER, EXIT
+
+    def play(level, seed):
+        rng    = random.Random(seed)
+        engine = Engine(GameState(level, num_ghosts=rng.randint(1, 6)),
+                        rng            =random.Random(seed),
+                        ghost_step_time=rng.choice((0.05, 0.1, 0.3)))
+        state  = engine.state
+        shape  = np.array(state.grid.shape)
+        steps  = []
+        while engine.over is None and engine.now < args.max_time:
+            # Mostly keep going the same way, sometimes stop or turn
+            if not steps or rng.random() < 0.2:
+                move = rng.choice(DIRECTIONS + (None,))
+            (before, pills, score) = (np.array(state.positions),
+                                      state.pills,
+                                      state.score)
+            going = engine.step(move, rng.choice((0.01, 0.05, 0.1)))
+            steps.append(move)
+            after = np.array(state.positions)
+
+            def check(ok, what):
+                if not ok:
+                    raise AssertionError(
+                        "%s: seed %d step %d: %s" %
+                        (level.name, seed, len(steps), what)
+                    )
+
+            check(np.all((after >= 0) & (after < shape)), "off the grid")
+            cells = state.grid[after[:, 0], after[:, 1]]
+            check(not np.any(cells == WALL), "in a wall")
+            check(cells[0] != EXIT, "pacman in an exit")
+            jump = np.abs(after[0] - before[0])
+            jump = np.minimum(jump, shape - jump)
+            check(jump.sum() <= 1, "pacman moved %s" % (jump,))
+            check(state.pills == np.count_nonzero((state.grid == PILL) |
+                                                  (state.grid == EATER)),
+                  "pill count is wrong")
+            check(state.pills <= pills, "pills came back")
+            check(state.score >= score, "score went down")
+
+            # Meeting a ghost, or passing through one, is only survivable if
+            # it was eaten and so sent home
+            met = (np.all(after[1:] == after[0], axis=1) |
+                   (np.all(after[1:] == before[0], axis=1) &
+                    np.all(before[1:] == after[0], axis=1)))
+            if going:
+                check(not np.any(met), "pacman met a ghost")
+            elif engine.over == Engine.EATEN:
+                check(np.any(met) or
+                      np.any(np.all(before[1:] == after[0], axis=1)),
+                      "eaten without meeting a ghost")
+        return (engine.over, state.score, engine.now, len(steps))
+
+    levels = pacman_levels.LevelPack(args.levels or
+                                     pacman_levels.LEVELS_DIR).preload()
+    seeds  = random.Random(args.seed)
+    steps  = 0
+    start  = time.perf_counter()
+    try:
+        for level in levels:
+            for _ in range(args.games):
+                seed   = seeds.randrange(1 << 32)
+                result = play(level, seed)
+                if play(level, seed) != result:
+                    raise AssertionError("%s: seed %d did not replay the same" %
+                                         (level.name, seed))
+                steps += 2 * result[3]
+    except AssertionError as e:
+        print("FAILED: %s" % (e,))
+        sys.exit(1)
+    took = time.perf_counter() - start
+
+    print("%d games on %d levels passed in %0.2fs, %0.0f steps/s" %
+          (2 * args.games * len(levels), len(levels), took, steps / took))
+
+
+def bench_pacman_levels(args):
+    """
+    Time loading a pack of pacman levels from scratch, without the maze cache,
+    against switching between them once they have been loaded.
+    """
+    import pacman_levels
+    from   pacman_maze import Maze
+
+    pack = pacman_levels.LevelPack(args.levels or pacman_levels.LEVELS_DIR)
+
+    # From scratch, compiling the mazes too
+    load = Maze.load
+    Maze.load = classmethod(lambda cls, grid: cls(grid))
+    try:
+        start = time.perf_counter()
+        levels = pack.preload()
+        cold = time.perf_counter() - start
+    finally:
+        Maze.load = load
+
+    # And switching between them afterwards
+    start = time.perf_counter()
+    for _ in range(args.switches):
+        pack.advance()
+    warm = time.perf_counter() - start
+
+    print("%d levels: %0.1fms/level to load, %0.1fus/level to switch" %
+          (len(levels),
+           cold / len(levels) * 1e3,
+           warm / args.switches * 1e6))
+
+
+def bench_rockfall_step(args):
+    """
+    Time rockfall's simulation steps, and then steps along with rendering and
+    showing the arena, headlessly. The same is done with the arena as lists of
+    bools, the way that it used to be, for comparison.
+    """
+    (rockfall, display) = _fake_rockfall()
+    game = rockfall.Rockfall()
+    game._frac_new = game.MAX_FRAC
+
+    def lists():
+        # The old way: a list of bools per row, redrawn pixel by pixel
+        arena = tuple([False] * game.WIDTH for _ in range(game.HEIGHT))
+        def step():
+            for row in arena:
+                row[1:] = row[:-1]
+                row[0]  = False
+            indices = list(range(len(arena)))
+            random.shuffle(indices)
+            for index in indices[:2]:
+                arena[index][0] = True
+        def draw():
+            for (y, row) in enumerate(arena):
+                for (x, e) in enumerate(row):
+                    display.pixel(x, y, 0.5 if e else 0.0)
+            display.pixel(game._wpos, game._hpos, 1.0)
+            display.show()
+            return arena[game._hpos][game._wpos]
+        return (step, draw)
+
+    def bitboard():
+        def draw():
+            rockfall.show(game.render())
+            return game.collided
+        return (game.step, draw)
+
+    for (name, make) in (('lists', lists), ('bitboard', bitboard)):
+        (step, draw) = make()
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            step()
+        stepped = time.perf_counter() - start
+
+        (display.set_pixels, display.shows) = (0, 0)
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            step()
+            draw()
+        drawn = time.perf_counter() - start
+
+        print("%-9s %9.0f steps/s %9.0f steps+renders/s "
+              "%6.1f set_pixels/frame" %
+              (name,
+               args.steps / stepped,
+               args.steps / drawn,
+               display.set_pixels / args.steps))
+
+
+def bench_rockfall_explode(args):
+    """
+    Time rockfall's explosion animation headlessly: working it out as it's
+    played, the way that it used to be, against playing the precomputed
+    frames. These are done without any waiting between the frames, and then
+    the precomputed one is played at its proper frame rate to see that it
+    keeps to it.
+    """
+    import math
+    (rockfall, display) = _fake_rockfall(show_time=args.show_time)
+    game = rockfall.Rockfall()
+
+    def computed():
+        # The old way, which did all the maths each time
+        for r in range(int(game.WIDTH * 1.25)):
+            for s in range(r):
+                c = 1 + int(math.pi * 2 * r)
+                for a in range(c):
+                    o = 2 * math.pi / c * a
+                    x = int(math.sin(o) * s + game.WIDTH - 1)
+                    y = int(math.cos(o) * s + game._hpos)
+                    v = s / r * (0.2 + 0.8 * random.random())
+                    if 0 <= x < game.WIDTH and 0 <= y < game.HEIGHT:
+                        display.pixel(x, y, v)
+            display.show()
+
+    def precomputed():
+        game.explode(frame_time=0)
+
+    frames = int(game.WIDTH * 1.25)
+    for (name, explode) in (('computed', computed), ('precomputed', precomputed)):
+        (display.set_pixels, display.shows) = (0, 0)
+        start = time.perf_counter()
+        for i in range(args.explosions):
+            game._hpos = i % game.HEIGHT
+            explode()
+        took = time.perf_counter() - start
+        print("%-12s %7.2fms/explosion %7.1fus/frame %7.1f set_pixels/frame" %
+              (name,
+               took / args.explosions * 1e3,
+               took / (args.explosions * frames) * 1e6,
+               display.set_pixels / display.shows))
+
+    # And for real
+    start = time.perf_counter()
+    game.explode()
+    took = time.perf_counter() - start
+    print("At %0.0f frames/s: %0.1fms for %d frames, wanted %0.1fms" %
+          (1.0 / game.EXPLODE_FRAME_TIME,
+           took * 1e3,
+           frames,
+           frames * game.EXPLODE_FRAME_TIME * 1e3))
+
+
+def bench_rockfall_input(args):
+    """
+    Run rockfall headlessly, in real time, while pressing its simulated
+    buttons at random, and report how many of the presses the game saw and how
+    long they took to get to it, along with how the drawing went.
+    """
+    (rockfall, display) = _fake_rockfall()
+    buttons = dict((name, SimulatedButton(pin))
+                   for (name, pin) in rockfall.Rockfall.BUTTON_PINS.items())
+    game = rockfall.Rockfall(buttons=buttons)
+
+    # The game keeps telling us how long we survived, which we don't care
+    # about here
+    thread = threading.Thread(target=game.run)
+    with contextlib.redirect_stdout(io.StringIO()):
+        thread.start()
+        rng = random.Random(args.seed)
+        for _ in range(args.presses):
+            # Quick taps, of the sort which polling misses
+            time.sleep(rng.uniform(0, 2 * args.interval))
+            button = buttons[rng.choice('XY')]
+            button.press()
+            button.release()
+
+        # Give the game time to see the last of them
+        time.sleep(10 * game.TICK_TIME)
+        game.stop()
+        thread.join()
+
+    events = game._events
+    print("%d presses, %d seen: mean latency %0.2fms, max %0.2fms "
+          "(tick is %0.1fms)" %
+          (args.presses,
+           events.presses,
+           events.mean_latency * 1e3,
+           events.max_latency  * 1e3,
+           game.TICK_TIME      * 1e3))
+    print(game.frame_stats.summary())
+
+# ----------------------------------------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest='bench')
+    subparsers.required = True
+
+    sub = subparsers.add_parser('pacman-render',
+                                help=bench_pacman_render.__doc__)
+    sub.add_argument('--frames', type=int, default=10000)
+    sub.add_argument('--frames-per-move', type=int, default=30,
+                     help='How many frames between sprite moves')
+    sub.add_argument('--no-buffer', action='store_true',
+                     help="Make the fake display not have a _buf")
+    sub.set_defaults(function=bench_pacman_render)
+
+    sub = subparsers.add_parser('pacman-sim',
+                                help=bench_pacman_sim.__doc__)
+    sub.add_argument('--games', type=int, default=1000)
+    sub.add_argument('--seed', type=int, default=0)
+    sub.add_argument('--dt', type=float, default=0.1,
+                     help='The game time per step, i.e. pacman\'s speed')
+    sub.add_argument('--max-time', type=float, default=300.0,
+                     help='The longest game, in game seconds')
+    sub.add_argument('--ghost-step-time', type=float, default=0.3)
+    sub.add_argument('--ghost-eat-time', type=float, default=10.0)
+    sub.add_argument('--script',
+                     help='A file of w/a/s/d/. moves to use, rather than '
+                          'random ones')
+    sub.set_defaults(function=bench_pacman_sim)
+
+    sub = subparsers.add_parser('pacman-check',
+                                help=bench_pacman_check.__doc__)
+    sub.add_argument('--games', type=int, default=200,
+                     help='How many games to play on each level')
+    sub.add_argument('--seed', type=int, default=0)
+    sub.add_argument('--max-time', type=float, default=120.0,
+                     help='The longest game, in game seconds')
+    sub.add_argument('--levels',
+                     help='The directory of levels, if not the standard one')
+    sub.set_defaults(function=bench_pacman_check)
+
+    sub = subparsers.add_parser('pacman-levels',
+                                help=bench_pacman_levels.__doc__)
+    sub.add_argument('--levels',
+                     help='The directory of levels, if not the standard one')
+    sub.add_argument('--switches', type=int, default=10000)
+    sub.set_defaults(function=bench_pacman_levels)
+
+    sub = subparsers.add_parser('rockfall-step',
+                                help=bench_rockfall_step.__doc__)
+    sub.add_argument('--steps', type=int, default=100000)
+    sub.set_defaults(function=bench_rockfall_step)
+
+    sub = subparsers.add_parser('rockfall-explode',
+                                help=bench_rockfall_explode.__doc__)
+    sub.add_argument('--explosions', type=int, default=100)
+    sub.add_argument('--show-time', type=float, default=0.0,
+                     help='How long each show() should take, in seconds')
+    sub.set_defaults(function=bench_rockfall_explode)
+
+    sub = subparsers.add_parser('rockfall-input',
+                                help=bench_rockfall_input.__doc__)
+    sub.add_argument('--presses', type=int, default=500)
+    sub.add_argument('--interval', type=float, default=0.02,
+                     help='The mean time between presses, in seconds')
+    sub.add_argument('--seed', type=int, default=0)
+    sub.set_defaults(function=bench_rockfall_input)
+
+    args = parser.parse_args()
+    args.function(args)
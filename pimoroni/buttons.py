@@ -0,0 +1,156 @@
+"""
+Event-driven button input.
+
+Rather than polling the buttons, and so missing presses which happen between
+polls, we have gpiozero call us back when they're pressed and we put the
+presses on a queue. The game loop then takes everything off the queue at the
+start of each of its ticks. Since gpiozero makes its callbacks from its own
+thread, the queue is what keeps things thread-safe.
+
+There's also a `SimulatedButton`, which can stand in for a ``gpiozero.Button``,
+so that the input can be driven, and its latency measured, without the
+hardware.
+"""
+
+from   collections import namedtuple
+from   gameloop    import Clock
+
+import queue
+
+# ----------------------------------------------------------------------
+
+# A button press, by the button's name and when it happened
+Press = namedtuple('Press', ('name', 'time'))
+
+# ----------------------------------------------------------------------
+
+class ButtonEvents():
+    """
+    A queue of button presses.
+    """
+    def __init__(self, clock=None):
+        """
+        :type clock: Clock
+        :param clock:
+            The clock to timestamp the presses with, if not the real one.
+        """
+        self.clock  = Clock() if clock is None else clock
+        self._queue = queue.SimpleQueue()
+
+        # Stats: how many presses there have been and how long they waited
+        # before they were taken off the queue
+        self.presses       = 0
+        self.total_latency = 0.0
+        self.max_latency   = 0.0
+
+
+    def attach(self, name, button, repeat=True):
+        """
+        Have a button's presses come to us.
+
+        :type name: str
+        :param name:
+            What to call the button's presses.
+        :type button: gpiozero.Button
+        :param button:
+            The button.
+        :type repeat: bool
+        :param repeat:
+            Whether holding the button down should repeat the press, every
+            ``hold_time`` seconds. The button should have been created with
+            ``hold_repeat=True`` for this.
+        """
+        def pressed():
+            self.put(name)
+        button.when_pressed = pressed
+        if repeat:
+            button.when_held = pressed
+
+
+    def put(self, name):
+        """
+        Add a press of the named button. This may be called from any thread.
+        """
+        self._queue.put(Press(name, self.clock.now()))
+
+
+    def drain(self):
+        """
+        Take all the presses off the queue.
+
+        :return: The presses, in the order that they happened.
+        """
+        presses = []
+        while True:
+            try:
+                presses.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        if presses:
+            now = self.clock.now()
+            for press in presses:
+                latency = now - press.time
+                self.total_latency += latency
+                self.max_latency    = max(self.max_latency, latency)
+            self.presses += len(presses)
+        return presses
+
+
+    @property
+    def mean_latency(self):
+        """
+        The mean time, in seconds, which presses waited on the queue.
+        """
+        return self.total_latency / self.presses if self.presses else 0.0
+
+
+class SimulatedButton():
+    """
+    Something which looks enough like a ``gpiozero.Button`` to stand in for
+    one, and which can be pressed and released in code.
+    """
+    def __init__(self, pin=None, hold_time=1.0, hold_repeat=False, **kwargs):
+        """
+        The arguments are the same as ``gpiozero.Button``'s, and are ignored.
+        """
+        self.pin         = pin
+        self.hold_time   = hold_time
+        self.hold_repeat = hold_repeat
+        self.is_active   = False
+
+        # The callbacks
+        self.when_pressed  = None
+        self.when_released = None
+        self.when_held     = None
+
+
+    @property
+    def is_pressed(self):
+        return self.is_active
+
+
+    def press(self):
+        """
+        Press the button.
+        """
+        self.is_active = True
+        if self.when_pressed is not None:
+            self.when_pressed()
+
+
+    def hold(self):
+        """
+        Act as if the button had been held down for another ``hold_time``.
+        """
+        if self.is_active and self.when_held is not None:
+            self.when_held()
+
+
+    def release(self):
+        """
+        Release the button.
+        """
+        self.is_active = False
+        if self.when_released is not None:
+            self.when_released()
@@ -0,0 +1,251 @@
+"""
+A framebuffer for the Pimoroni displays, which only pushes what changed.
+
+The idea is that you draw the whole frame into a NumPy array, as cheaply as you
+like, and then call `show()`. That compares it with what was last shown and, if
+nothing changed, doesn't bother the display at all. If things did change then
+we either copy the whole frame into the driver's own buffer in one go, where
+we know how to get at it, or else we `set_pixel()` just the cells which
+changed.
+
+There is also a `FakeDisplay`, which looks enough like the `unicornhathd`
+module to stand in for it, and a `FakeScrollDisplay` for the `scrollphathd`
+one. They count what they're asked to do. That's so that we can measure things
+without the hardware.
+"""
+
+import numpy as np
+import time
+
+# ----------------------------------------------------------------------
+
+class FrameBuffer():
+    """
+    A double-buffered RGB frame, indexed as ``[x, y]``.
+    """
+    def __init__(self, device, width, height):
+        """
+        :param device:
+            The display, e.g. the ``unicornhathd`` module. This needs to have
+            `set_pixel()` and `show()`.
+        :type width: int
+        :param width:
+            The width of the display.
+        :type height: int
+        :param height:
+            The height of the display.
+        """
+        self._device = device
+
+        # What we are drawing, and what was last shown
+        self._frame = np.zeros((width, height, 3), dtype=np.uint8)
+        self._shown = np.zeros((width, height, 3), dtype=np.uint8)
+
+        # The driver's own buffer, if it has one which we understand. The
+        # unicornhathd module keeps its pixels in a module-level array.
+        buf = getattr(device, '_buf', None)
+        if isinstance(buf, np.ndarray) and buf.shape == self._frame.shape:
+            self._buf = buf
+        else:
+            self._buf = None
+
+        # Stats
+        self.shows   = 0
+        self.skipped = 0
+        self.cells   = 0
+
+        # Make sure that the display matches what we think it has on it
+        self._push(np.ones(self._frame.shape[:2], dtype=bool))
+
+
+    @property
+    def frame(self):
+        """
+        The frame being drawn, as a ``(width, height, 3)`` uint8 array. This
+        may be written to directly.
+        """
+        return self._frame
+
+
+    def clear(self):
+        """
+        Set the frame being drawn to black.
+        """
+        self._frame.fill(0)
+
+
+    def set_pixel(self, x, y, r, g, b):
+        """
+        Set a pixel in the frame being drawn.
+        """
+        self._frame[x, y] = (r, g, b)
+
+
+    def blit(self, image):
+        """
+        Copy a whole ``(width, height, 3)`` image into the frame being drawn.
+        """
+        self._frame[...] = image
+
+
+    def show(self):
+        """
+        Push the frame to the display, if it changed.
+
+        :return: Whether anything was pushed.
+        """
+        changed = np.any(self._frame != self._shown, axis=2)
+        if not changed.any():
+            self.skipped += 1
+            return False
+        self._push(changed)
+        return True
+
+
+    def _push(self, changed):
+        """
+        Push the changed cells to the display.
+        """
+        if self._buf is not None:
+            self._buf[...] = self._frame
+        else:
+            for (x, y) in zip(*np.nonzero(changed)):
+                (r, g, b) = self._frame[x, y]
+                self._device.set_pixel(int(x), int(y), int(r), int(g), int(b))
+        self._device.show()
+        self._shown[...] = self._frame
+        self.shows += 1
+        self.cells += int(np.count_nonzero(changed))
+
+
+class FakeDisplay():
+    """
+    A stand-in for the ``unicornhathd`` module, which counts what it's asked
+    to do rather than doing it.
+    """
+    # The byte which starts each frame on the wire
+    _SOF_BYTES = 1
+
+    def __init__(self, width=16, height=16, with_buffer=True, show_time=0.0):
+        """
+        :type width: int
+        :param width:
+            The width of the display.
+        :type height: int
+        :param height:
+            The height of the display.
+        :type with_buffer: bool
+        :param with_buffer:
+            Whether to have a ``_buf``, like the real driver, or not. Without
+            one a `FrameBuffer` has to `set_pixel()` each cell.
+        :type show_time: float
+        :param show_time:
+            How long each `show()` should take, in seconds, to mimic the SPI
+            transfer.
+        """
+        self._width     = width
+        self._height    = height
+        self._show_time = show_time
+        if with_buffer:
+            self._buf = np.zeros((width, height, 3), dtype=int)
+        else:
+            self._buf = None
+
+        # Stats
+        self.set_pixels = 0
+        self.shows      = 0
+        self.spi_bytes  = 0
+
+
+    def get_shape(self):
+        return (self._width, self._height)
+
+
+    def rotation(self, r):
+        pass
+
+
+    def brightness(self, b):
+        pass
+
+
+    def set_pixel(self, x, y, r, g, b):
+        self.set_pixels += 1
+        if self._buf is not None:
+            self._buf[x, y] = (r, g, b)
+
+
+    def clear(self):
+        if self._buf is not None:
+            self._buf.fill(0)
+
+
+    def show(self):
+        # The real one sends a start-of-frame byte and then every pixel
+        self.shows     += 1
+        self.spi_bytes += self._SOF_BYTES + self._width * self._height * 3
+        if self._show_time:
+            time.sleep(self._show_time)
+
+
+    def off(self):
+        self.clear()
+        self.show()
+
+
+class FakeScrollDisplay():
+    """
+    A stand-in for the ``scrollphathd`` module, which counts what it's asked
+    to do rather than doing it.
+    """
+    # The size of the Scroll HAT Mini
+    DISPLAY_WIDTH  = 17
+    DISPLAY_HEIGHT = 7
+
+    # The number of bytes which the real one sends over I2C for each frame,
+    # one per LED in the IS31FL3731's matrix
+    _FRAME_BYTES = 144
+
+    def __init__(self, show_time=0.0):
+        """
+        :type show_time: float
+        :param show_time:
+            How long each `show()` should take, in seconds, to mimic the I2C
+            transfer.
+        """
+        self._show_time = show_time
+        self.clear()
+
+        # Stats
+        self.set_pixels = 0
+        self.shows      = 0
+        self.i2c_bytes  = 0
+
+
+    def get_shape(self):
+        return (self.DISPLAY_WIDTH, self.DISPLAY_HEIGHT)
+
+
+    def set_brightness(self, b):
+        pass
+
+
+    def set_pixel(self, x, y, brightness):
+        self.set_pixels += 1
+        self.buf[x, y] = brightness
+
+
+    def pixel(self, x, y, brightness):
+        self.set_pixel(x, y, brightness)
+
+
+    def clear(self):
+        # Like the real one, this makes a new buffer
+        self.buf = np.zeros((self.DISPLAY_WIDTH, self.DISPLAY_HEIGHT))
+
+
+    def show(self):
+        self.shows     += 1
+        self.i2c_bytes += self._FRAME_BYTES
+        if self._show_time:
+            time.sleep(self._show_time)
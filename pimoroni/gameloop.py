@@ -0,0 +1,197 @@
+"""
+Timekeeping for the games.
+
+The games' simulations move on in fixed steps, so that they play the same
+however fast the host is, and the rendering happens whenever we get around to
+it. `FixedStep` keeps the accumulator which works out how many steps are due.
+The clocks are injectable so that the games can be run faster than real time,
+or deterministically, without a display. `FrameStats` keeps track of how long
+the frames took to draw, and how many didn't need drawing at all.
+"""
+
+from   collections import deque
+
+import numpy as np
+import time
+
+# ----------------------------------------------------------------------
+
+class Clock():
+    """
+    The real, monotonic, clock.
+    """
+    def now(self):
+        """
+        The current time, in seconds.
+        """
+        return time.monotonic()
+
+
+    def sleep(self, seconds):
+        """
+        Wait for the given number of seconds.
+        """
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class FakeClock(Clock):
+    """
+    A clock which only moves when it's told to, or when someone sleeps on it.
+    """
+    def __init__(self, start=0.0):
+        self._now = float(start)
+
+
+    def now(self):
+        """
+        @see Clock.now()
+        """
+        return self._now
+
+
+    def sleep(self, seconds):
+        """
+        @see Clock.sleep()
+        """
+        if seconds > 0:
+            self._now += seconds
+
+
+    def advance(self, seconds):
+        """
+        Move the clock on.
+        """
+        self._now += seconds
+
+
+class FixedStep():
+    """
+    Works out how many fixed-size simulation steps are due, carrying any
+    left-over time along to the next call.
+    """
+    def __init__(self, step, clock=None, max_steps=10):
+        """
+        :type step: float
+        :param step:
+            The size of each step, in seconds.
+        :type clock: Clock
+        :param clock:
+            The clock to use, if not the real one.
+        :type max_steps: int
+        :param max_steps:
+            The most steps to give back in one go. If we have fallen further
+            behind than this then we drop the excess rather than spiralling
+            into ever more catching up.
+        """
+        if step <= 0:
+            raise ValueError("Step must be positive: %s" % (step,))
+        self.step      = float(step)
+        self.clock     = Clock() if clock is None else clock
+        self.max_steps = int(max_steps)
+
+        # The time we last looked, and how much unsimulated time we have
+        self._last        = self.clock.now()
+        self._accumulator = 0.0
+
+        # How many steps we have had to drop
+        self.dropped = 0
+
+
+    def reset(self):
+        """
+        Start counting afresh from now.
+        """
+        self._last        = self.clock.now()
+        self._accumulator = 0.0
+
+
+    def due(self):
+        """
+        How many steps are due now.
+        """
+        now = self.clock.now()
+        self._accumulator += now - self._last
+        self._last = now
+
+        steps = int(self._accumulator // self.step)
+        self._accumulator -= steps * self.step
+        if steps > self.max_steps:
+            self.dropped += steps - self.max_steps
+            steps = self.max_steps
+        return steps
+
+
+    def wait(self):
+        """
+        Sleep until the next step is due.
+        """
+        self.clock.sleep(self.step - self._accumulator
+                         - (self.clock.now() - self._last))
+
+
+class FrameStats():
+    """
+    How long the frames took to draw, and how many were skipped because nothing
+    had changed.
+    """
+    def __init__(self, clock=None, window=1000):
+        """
+        :type clock: Clock
+        :param clock:
+            The clock to use, if not the real one.
+        :type window: int
+        :param window:
+            How many of the most recent frame times to keep, for the
+            percentiles.
+        """
+        self.clock = Clock() if clock is None else clock
+
+        self.drawn   = 0
+        self.skipped = 0
+        self.total   = 0.0
+        self.max     = 0.0
+        self._recent = deque(maxlen=window)
+
+
+    def draw(self, function, *args):
+        """
+        Call the given function, which draws a frame, and time it.
+
+        :return: What the function returned.
+        """
+        start  = self.clock.now()
+        result = function(*args)
+        took   = self.clock.now() - start
+
+        self.drawn += 1
+        self.total += took
+        self.max    = max(self.max, took)
+        self._recent.append(took)
+        return result
+
+
+    def skip(self):
+        """
+        Note that we didn't need to draw a frame.
+        """
+        self.skipped += 1
+
+
+    def summary(self):
+        """
+        The stats, as a human-readable string.
+        """
+        if not self.drawn:
+            return "No frames drawn, %d skipped" % (self.skipped,)
+        recent = np.array(self._recent)
+        return ("%d frames drawn, %d skipped (%0.0f%%); "
+                "frame time mean %0.2fms, p50 %0.2fms, p95 %0.2fms, "
+                "max %0.2fms" %
+                (self.drawn,
+                 self.skipped,
+                 100.0 * self.skipped / (self.drawn + self.skipped),
+                 self.total / self.drawn * 1e3,
+                 np.percentile(recent, 50) * 1e3,
+                 np.percentile(recent, 95) * 1e3,
+                 self.max * 1e3))
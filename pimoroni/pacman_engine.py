@@ -0,0 +1,403 @@
+"""
+The pacman game logic, without any of the display or input handling. This is
+so that it can be run, and tested, headlessly.
+
+The `Engine` is advanced by calling `step()` with the player's input and how
+much time has passed. It never looks at the wall clock, and all its randomness
+comes from the RNG which it's given, so a game can be replayed exactly and
+simulated as fast as the CPU allows.
+"""
+
+from   pacman_maze import UP, DIRECTIONS, EMPTY, WALL, PILL, EATER
+
+import numpy as np
+import pacman_levels
+import random
+
+# ----------------------------------------------------------------------
+
+# How long ghosts can be eaten for (in seconds)
+GHOST_EAT_TIME   = 10
+GHOST_EAT_REVERT =  3
+
+# How many seconds between ghost steps
+GHOST_STEP_TIME = 0.3
+
+# How long the ghosts spend heading for their corners, and then chasing pacman,
+# in each cycle (in seconds)
+GHOST_SCATTER_TIME =  7
+GHOST_CHASE_TIME   = 20
+
+# What you get for eating things
+PILL_SCORE  =  1
+GHOST_SCORE = 20
+
+# The index of each of the directions
+_DIRECTION_INDEX = dict((d, i) for (i, d) in enumerate(DIRECTIONS))
+
+# ----------------------------------------------------------------------
+
+class GameState():
+    """
+    The state of a game in progress.
+    """
+    def __init__(self, level=None, num_ghosts=4, score=0):
+        """
+        :type level: Level
+        :param level:
+            The level to play, if not the first of the standard ones.
+        :type num_ghosts: int
+        :param num_ghosts:
+            How many ghosts there are.
+        :type score: int
+        :param score:
+            The score to start with, e.g. from the previous level.
+        """
+        self.level = pacman_levels.default() if level is None else level
+
+        # Our own copy of the grid, in [x,y] order, which we eat our way through
+        self.grid = np.array(self.level.grid, dtype=np.uint8)
+
+        # How many things are left for pacman to eat. We keep track of this as
+        # we go so that we don't have to look at the grid to know when the
+        # level is over.
+        self.pills = self.level.pills
+
+        # Where everyone is, as [x,y] lists: pacman is the first and the
+        # ghosts the rest. pacman_posn and ghost_posns hold the same lists, so
+        # moving someone in one moves them in the other.
+        self.ghost_starts = self.level.ghost_starts
+        self.positions    = (
+            [list(self.level.pacman_starts[0])] +
+            [list(self.ghost_starts[i % len(self.ghost_starts)])
+             for i in range(num_ghosts)]
+        )
+        self.pacman_posn  = self.positions[0]
+        self.ghost_posns  = self.positions[1:]
+
+        # Which way the ghosts are going and when they last moved
+        self.ghost_moves  = [UP] * num_ghosts
+        self.ghost_times  = [0.0] * num_ghosts
+        self.pacman_move  = (0, 0)
+
+        # How we're doing
+        self.score       = int(score)
+        self.eating_time = None
+
+
+    @property
+    def width(self):
+        """
+        The width of the grid.
+        """
+        return self.grid.shape[0]
+
+
+    @property
+    def height(self):
+        """
+        The height of the grid.
+        """
+        return self.grid.shape[1]
+
+
+    @property
+    def cleared(self):
+        """
+        Whether pacman has eaten everything.
+        """
+        return self.pills == 0
+
+
+    def eat(self, now):
+        """
+        Have pacman eat whatever is where it is.
+
+        :type now: float
+        :param now:
+            The current time.
+
+        :return: What was eaten, which may be `EMPTY`.
+        """
+        (x, y) = self.pacman_posn
+        e = self.grid.item(x, y)
+        if e == PILL:
+            self.score += PILL_SCORE
+        elif e == EATER:
+            self.eating_time = now
+        if e in (PILL, EATER):
+            self.grid[x, y] = EMPTY
+            self.pills -= 1
+        return e
+
+
+    def eating(self, now, eat_time=GHOST_EAT_TIME):
+        """
+        Whether the ghosts can be eaten at the given time.
+        """
+        return (self.eating_time is not None and
+                now - self.eating_time < eat_time)
+
+
+    def eat_ghost(self, i):
+        """
+        Pacman ate ghost ``i``, so send it home.
+        """
+        self.score += GHOST_SCORE
+        self.ghost_posns[i][:] = self.ghost_starts[i % len(self.ghost_starts)]
+
+
+class Engine():
+    """
+    Runs the game.
+    """
+    # How a game can end
+    CLEARED = 'cleared'
+    EATEN   = 'eaten'
+
+    # The kinds of things which move around, as rows in _passable
+    _PACMAN       = 0
+    _GHOST        = 1
+    _EDIBLE_GHOST = 2
+
+    def __init__(self,
+                 state          =None,
+                 rng            =None,
+                 maze           =None,
+                 ghost_step_time=GHOST_STEP_TIME,
+                 ghost_eat_time =GHOST_EAT_TIME):
+        """
+        :type state: GameState
+        :param state:
+            The state to start from, if not a new game.
+        :type rng: random.Random
+        :param rng:
+            Where the randomness comes from.
+        :type maze: Maze
+        :param maze:
+            The compiled maze, if not the level's own.
+        :type ghost_step_time: float
+        :param ghost_step_time:
+            How many seconds between ghost steps.
+        :type ghost_eat_time: float
+        :param ghost_eat_time:
+            How long the ghosts can be eaten for, in seconds.
+        """
+        self.state = GameState() if state is None else state
+        self.rng   = random.Random() if rng is None else rng
+        self.maze  = self.state.level.maze if maze is None else maze
+
+        # Python copies of the tables which we look at the most, since
+        # indexing NumPy arrays one element at a time is slow
+        self._neighbours = self.maze.neighbours.tolist()
+        self._exits      = self.maze.exits.tolist()
+
+        # The size of the grid, for wrapping positions around it
+        (self._width, self._height) = self.state.grid.shape
+
+        # Which cells each kind of thing may be in, by cell index. Pacman may
+        # never go through the exits and the ghosts may only do so when they
+        # can't be eaten. These are worked out with NumPy but looked at one
+        # cell at a time, so they're lists.
+        open_   = self.maze.layout.ravel() != WALL
+        no_exit = open_ & ~self.maze.exits
+        self._passable = (no_exit.tolist(), open_.tolist(), no_exit.tolist())
+
+        # Where each ghost heads for when scattering, which is a corner
+        (w, h) = (self.state.width, self.state.height)
+        corners = ((w - 1, 0), (0, 0), (w - 1, h - 1), (0, h - 1))
+        self._corners = tuple(self.maze.target(*corners[i % len(corners)])
+                              for i in range(len(self.state.ghost_posns)))
+
+        self.ghost_step_time = float(ghost_step_time)
+        self.ghost_eat_time  = float(ghost_eat_time)
+
+        # The game time, which only moves on when we step
+        self.now = 0.0
+
+        # How the game ended, or None if it's still going
+        self.over = None
+
+        # The ghosts start off going in random directions
+        for i in range(len(self.state.ghost_moves)):
+            self.state.ghost_moves[i] = self._random_direction()
+
+
+    @property
+    def eating(self):
+        """
+        Whether the ghosts can currently be eaten.
+        """
+        return self.state.eating(self.now, self.ghost_eat_time)
+
+
+    def step(self, inputs, dt):
+        """
+        Move the game on.
+
+        :type inputs: tuple
+        :param inputs:
+            The direction which the player wants pacman to move in, one of the
+            `DIRECTIONS`, or `None` to stay still.
+        :type dt: float
+        :param dt:
+            How much time has passed since the last step, in seconds.
+
+        :return: Whether the game is still going.
+        """
+        if self.over is not None:
+            return False
+
+        self.now += dt
+        state = self.state
+
+        # No pills means that we're done
+        if state.cleared:
+            self.over = self.CLEARED
+            return False
+
+        # Whether ghosts can be eaten
+        eating = self.eating
+
+        # Work out where everyone wants to go. Pacman goes wherever the player
+        # says and the ghosts go wherever they choose, if it's time for them
+        # to move.
+        moves = [(0, 0) if inputs is None else inputs]
+        for i in range(len(state.ghost_moves)):
+            move = (0, 0)
+            if self.now - state.ghost_times[i] >= self.ghost_step_time:
+                state.ghost_times[i] = self.now
+                d = self._ghost_move(i, eating)
+                if d is not None:
+                    move = state.ghost_moves[i] = DIRECTIONS[d]
+            moves.append(move)
+
+        # And move them all, wrapping around the edges, except for anyone who
+        # would end up somewhere that they can't go. There are only a handful
+        # of them so this is quicker one at a time than with NumPy. We note
+        # everyone's cell index before and after, for the collisions.
+        (width, height) = (self._width, self._height)
+        passable = self._passable
+        kind     = self._PACMAN
+        was      = []
+        now      = []
+        for (posn, (dx, dy)) in zip(state.positions, moves):
+            (x, y) = posn
+            cell = x * height + y
+            was.append(cell)
+            if dx or dy:
+                x = (x + dx) % width
+                y = (y + dy) % height
+                after = x * height + y
+                if passable[kind][after]:
+                    posn[0] = x
+                    posn[1] = y
+                    cell    = after
+                    if kind == self._PACMAN and inputs is not None:
+                        state.pacman_move = inputs
+            now.append(cell)
+            kind = self._EDIBLE_GHOST if eating else self._GHOST
+
+        # What did pacman eat, if anything; that might change whether the
+        # ghosts can be eaten
+        state.eat(self.now)
+        eating = self.eating
+
+        # See if pacman met a ghost, either by landing in the same place or
+        # by passing each other going opposite ways. We compare the cells'
+        # indices, rather than their (x,y)s, since that's quicker.
+        (pacman_was, pacman_now) = (was[0], now[0])
+        for i in range(1, len(now)):
+            if (now[i] == pacman_now or
+                (now[i] == pacman_was and was[i] == pacman_now)):
+                if eating:
+                    # The ghost was eaten, put it back to the start
+                    state.eat_ghost(i - 1)
+                else:
+                    # Oh dear, the ghost ate pacman
+                    self.over = self.EATEN
+                    return False
+
+        return True
+
+
+    def _ghost_move(self, i, eating):
+        """
+        Choose which way ghost ``i`` goes next.
+
+        A ghost picks whichever way, other than back the way it came, gets it
+        closest to its target; or, if it can be eaten, furthest from pacman.
+        That's all table lookups, so it's O(1).
+
+        :return: The index into `DIRECTIONS`, or `None` if it can't move.
+        """
+        state     = self.state
+        distances = self.maze.distances
+        (x, y)    = state.ghost_posns[i]
+        options   = self._neighbours[self.maze.index(x, y)]
+        back      = self.maze.reverse[_DIRECTION_INDEX[state.ghost_moves[i]]]
+        target    = self._ghost_target(i, eating)
+
+        # Choose the best way to go. When the ghosts can be eaten then they
+        # may not leave through the exit.
+        (best, best_score) = (None, None)
+        for (d, j) in enumerate(options):
+            if j < 0 or d == back or (eating and self._exits[j]):
+                continue
+            score = distances.item(j, target)
+            if eating:
+                score = -score
+            if best is None or score < best_score:
+                (best, best_score) = (d, score)
+
+        # If there's nowhere else to go then we turn around, if we can
+        if best is None:
+            j = options[back]
+            if j < 0 or (eating and self._exits[j]):
+                return None
+            best = back
+
+        return best
+
+
+    def _ghost_target(self, i, eating):
+        """
+        Where ghost ``i`` is heading for, as a cell index. These are the
+        classic targets: the first goes straight for pacman, the second for
+        where pacman is going, the third for a spot which pincers pacman with
+        the first ghost, and the fourth chases pacman until it gets close.
+        """
+        maze     = self.maze
+        (px, py) = self.state.pacman_posn
+        pacman   = maze.index(px, py)
+
+        # When they can be eaten, they run away
+        if eating:
+            return pacman
+
+        # Scattering for a bit of each cycle
+        cycle = self.now % (GHOST_SCATTER_TIME + GHOST_CHASE_TIME)
+        if cycle < GHOST_SCATTER_TIME:
+            return self._corners[i]
+
+        (dx, dy) = self.state.pacman_move
+        kind     = i % 4
+        if kind == 0:
+            return pacman
+        elif kind == 1:
+            return maze.target(px + 4 * dx, py + 4 * dy)
+        elif kind == 2:
+            (gx, gy) = self.state.ghost_posns[0]
+            return maze.target(2 * (px + 2 * dx) - gx, 2 * (py + 2 * dy) - gy)
+        else:
+            (gx, gy) = self.state.ghost_posns[i]
+            if maze.distance(maze.index(gx, gy), pacman) > 8:
+                return pacman
+            return self._corners[i]
+
+
+    def _random_direction(self):
+        """
+        Pick a direction at random.
+        """
+        return DIRECTIONS[self.rng.randint(0, len(DIRECTIONS)-1)]
@@ -0,0 +1,367 @@
+"""
+Pacman levels, and packs of them.
+
+A level is a grid of cells along with where pacman and the ghosts start. They
+can be written as text, one character per cell::
+
+    #  A wall
+    .  A pill
+    o  A pill which makes the ghosts edible
+    -  The exit from the ghosts' pen
+       (A space) Nothing
+    P  Where pacman starts (which is otherwise empty)
+    G  Where a ghost starts (ditto)
+
+where lines starting with ``;`` are comments and short lines are padded out
+with nothing. Or they can be drawn as PNG images, one pixel per cell, using the
+colours in `PNG_COLOURS`.
+
+Loading a level compiles it, including its `Maze`, and the result is kept
+around so that going back to a level which we have seen before is free.
+A `LevelPack` is just a directory of levels, which are played in name order.
+"""
+
+from   pacman_maze import EMPTY, WALL, PILL, EATER, EXIT, Maze
+
+import logging
+import numpy as np
+import os
+
+# ----------------------------------------------------------------------
+
+# The characters in a text level
+TEXT_CELLS = {
+    ' ' : EMPTY,
+    '#' : WALL,
+    '.' : PILL,
+    'o' : EATER,
+    '-' : EXIT,
+}
+TEXT_PACMAN = 'P'
+TEXT_GHOST  = 'G'
+TEXT_COMMENT = ';'
+
+# The colours in a PNG level, which are the ones which pacman.py draws with
+PNG_COLOURS = {
+    (  0,   0,   0) : EMPTY,
+    (  0,   0, 255) : WALL,
+    (127,   0,   0) : PILL,
+    (255, 255, 255) : EATER,
+    (  0,   0, 127) : EXIT,
+}
+PNG_PACMAN = (255, 255,   0)
+PNG_GHOST  = (255,   0, 255)
+
+# The level pack which comes with the game
+LEVELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'levels')
+
+# The file types which we know how to read
+_READERS = {}
+
+# The levels which we have already loaded, by path
+_CACHE = {}
+
+# ----------------------------------------------------------------------
+
+class Level():
+    """
+    A compiled level.
+    """
+    def __init__(self, name, grid, pacman_starts, ghost_starts, maze=None):
+        """
+        :type name: str
+        :param name:
+            What the level is called.
+        :type grid: ndarray
+        :param grid:
+            The ``(width, height)`` grid of cells.
+        :type pacman_starts: tuple
+        :param pacman_starts:
+            The ``(x, y)`` places where pacman may start; we use the first.
+        :type ghost_starts: tuple
+        :param ghost_starts:
+            The ``(x, y)`` places where the ghosts start.
+        :type maze: Maze
+        :param maze:
+            The compiled maze, if we already have it.
+        """
+        self.name          = name
+        self.grid          = np.array(grid, dtype=np.uint8)
+        self.pacman_starts = tuple(tuple(int(v) for v in s)
+                                   for s in pacman_starts)
+        self.ghost_starts  = tuple(tuple(int(v) for v in s)
+                                   for s in ghost_starts)
+
+        # The grid is shared between all the games on this level, so nobody
+        # should be changing it
+        self.grid.flags.writeable = False
+
+        # Make sure that it's playable before we go to the trouble of compiling
+        # it
+        self._check()
+        self.maze = Maze.load(self.grid) if maze is None else maze
+
+
+    @property
+    def shape(self):
+        """
+        The ``(width, height)`` of the level.
+        """
+        return self.grid.shape
+
+
+    @property
+    def pills(self):
+        """
+        How many things there are to eat in the level.
+        """
+        return int(np.count_nonzero((self.grid == PILL) |
+                                    (self.grid == EATER)))
+
+
+    def validate(self, shape):
+        """
+        Make sure that the level fits a display of the given shape.
+
+        :type shape: tuple
+        :param shape:
+            The ``(width, height)`` of the display, as given by
+            ``unicornhathd.get_shape()``.
+        """
+        if tuple(shape) != self.shape:
+            raise ValueError(
+                "Sorry, wrong shape for level %s. Wanted %d x %d but had %d x %d" %
+                ((self.name,) + self.shape + tuple(shape))
+            )
+
+
+    def _check(self):
+        """
+        Make sure that the level can be played.
+        """
+        if self.grid.ndim != 2 or 0 in self.grid.shape:
+            raise ValueError("Level %s has no cells" % (self.name,))
+        if not self.pacman_starts:
+            raise ValueError("Level %s has no pacman start" % (self.name,))
+        if not self.ghost_starts:
+            raise ValueError("Level %s has no ghost starts" % (self.name,))
+        if self.pills == 0:
+            raise ValueError("Level %s has no pills" % (self.name,))
+
+        # The starts need to be on the grid and not in walls
+        (width, height) = self.shape
+        for (x, y) in self.pacman_starts + self.ghost_starts:
+            if not (0 <= x < width and 0 <= y < height):
+                raise ValueError("Level %s has a start off the grid at (%d,%d)" %
+                                 (self.name, x, y))
+            if self.grid[x, y] in (WALL, EXIT):
+                raise ValueError("Level %s has a start in a wall at (%d,%d)" %
+                                 (self.name, x, y))
+
+        # Pacman has to be able to get to all the pills, else the level can
+        # never be cleared. Pacman can't go through walls or exits but can
+        # wrap around the edges.
+        seen     = np.zeros(self.shape, dtype=bool)
+        frontier = [self.pacman_starts[0]]
+        seen[frontier[0]] = True
+        while frontier:
+            (x, y) = frontier.pop()
+            for (dx, dy) in ((0, -1), (0, 1), (1, 0), (-1, 0)):
+                (nx, ny) = ((x + dx) % width, (y + dy) % height)
+                if not seen[nx, ny] and self.grid[nx, ny] not in (WALL, EXIT):
+                    seen[nx, ny] = True
+                    frontier.append((nx, ny))
+        stranded = np.argwhere(((self.grid == PILL) | (self.grid == EATER)) &
+                               ~seen)
+        if len(stranded):
+            (x, y) = stranded[0]
+            raise ValueError("Level %s has %d pill(s) which pacman can't "
+                             "reach, e.g. at (%d,%d)" %
+                             (self.name, len(stranded), x, y))
+
+
+    def __repr__(self):
+        return 'Level(%r, %dx%d)' % ((self.name,) + self.shape)
+
+
+class LevelPack():
+    """
+    A directory of levels, played in name order.
+    """
+    def __init__(self, directory=LEVELS_DIR):
+        """
+        :type directory: str
+        :param directory:
+            Where the level files are.
+        """
+        self.directory = directory
+        self.paths = tuple(
+            os.path.join(directory, filename)
+            for filename in sorted(os.listdir(directory))
+            if os.path.splitext(filename)[1].lower() in _READERS
+        )
+        if not self.paths:
+            raise ValueError("No levels in %s" % (directory,))
+
+        # Which level we are on
+        self.current = 0
+
+
+    def __len__(self):
+        return len(self.paths)
+
+
+    def __getitem__(self, index):
+        """
+        Get the level at the given index, loading it if need be.
+        """
+        return load(self.paths[index])
+
+
+    def preload(self):
+        """
+        Load all the levels now, so that moving between them doesn't hold up
+        the game. This also means that we find out about any broken ones up
+        front.
+
+        :return: The levels.
+        """
+        return tuple(self[i] for i in range(len(self)))
+
+
+    def validate(self, shape):
+        """
+        Make sure that all the levels fit a display of the given shape.
+        """
+        for level in self.preload():
+            level.validate(shape)
+
+
+    @property
+    def level(self):
+        """
+        The level which we are on.
+        """
+        return self[self.current]
+
+
+    def advance(self):
+        """
+        Move on to the next level, going back to the first after the last.
+
+        :return: The new level.
+        """
+        self.current = (self.current + 1) % len(self)
+        return self.level
+
+# ----------------------------------------------------------------------
+
+def load(path):
+    """
+    Load the level in the given file, which may be text or a PNG image.
+
+    :type path: str
+    :param path:
+        The file to read.
+
+    :return: The `Level`.
+    """
+    path = os.path.realpath(path)
+    ext  = os.path.splitext(path)[1].lower()
+    if ext not in _READERS:
+        raise ValueError("Don't know how to read a level from %s" % (path,))
+
+    # We key on when the file was changed, so that editing a level while the
+    # game is running works as you would expect
+    stat = os.stat(path)
+    key  = (stat.st_mtime_ns, stat.st_size)
+    cached = _CACHE.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    (grid, pacman_starts, ghost_starts) = _READERS[ext](path)
+    level = Level(name, grid, pacman_starts, ghost_starts)
+    logging.debug("Loaded %s from %s", level, path)
+
+    _CACHE[path] = (key, level)
+    return level
+
+
+def default():
+    """
+    The first level of the pack which comes with the game.
+    """
+    return load(LevelPack().paths[0])
+
+
+def _read_text(path):
+    """
+    Read a text level.
+    """
+    with open(path, 'rt') as fh:
+        rows = [line.rstrip('\r\n') for line in fh
+                if not line.startswith(TEXT_COMMENT)]
+
+    # Ignore any trailing blank lines
+    while rows and not rows[-1].strip():
+        rows.pop()
+    if not rows:
+        raise ValueError("No rows in %s" % (path,))
+
+    width  = max(len(row) for row in rows)
+    height = len(rows)
+    grid   = np.full((width, height), EMPTY, dtype=np.uint8)
+    pacman_starts = []
+    ghost_starts  = []
+    for (y, row) in enumerate(rows):
+        for (x, c) in enumerate(row):
+            if c == TEXT_PACMAN:
+                pacman_starts.append((x, y))
+            elif c == TEXT_GHOST:
+                ghost_starts.append((x, y))
+            elif c in TEXT_CELLS:
+                grid[x, y] = TEXT_CELLS[c]
+            else:
+                raise ValueError("Unknown cell %r at (%d,%d) in %s" %
+                                 (c, x, y, path))
+    return (grid, pacman_starts, ghost_starts)
+
+
+def _read_png(path):
+    """
+    Read a PNG level.
+    """
+    # Only needed if we have PNG levels
+    from PIL import Image
+
+    with Image.open(path) as image:
+        pixels = np.asarray(image.convert('RGB'), dtype=np.uint8)
+
+    # The image is (height, width, 3) and we want things by [x,y]
+    pixels = pixels.transpose(1, 0, 2)
+    grid   = np.full(pixels.shape[:2], EMPTY, dtype=np.uint8)
+    known  = np.zeros(pixels.shape[:2], dtype=bool)
+    for (colour, cell) in PNG_COLOURS.items():
+        match = np.all(pixels == colour, axis=2)
+        grid [match] = cell
+        known[match] = True
+
+    # The starts, in reading order to match the text levels
+    def starts(colour):
+        match = np.all(pixels == colour, axis=2)
+        known[match] = True
+        return sorted(((int(x), int(y)) for (x, y) in np.argwhere(match)),
+                      key=lambda p: (p[1], p[0]))
+    pacman_starts = starts(PNG_PACMAN)
+    ghost_starts  = starts(PNG_GHOST)
+
+    if not np.all(known):
+        (x, y) = np.argwhere(~known)[0]
+        raise ValueError("Unknown colour %s at (%d,%d) in %s" %
+                         (tuple(pixels[x, y]), x, y, path))
+    return (grid, pacman_starts, ghost_starts)
+
+
+_READERS['.txt'] = _read_text
+_READERS['.png'] = _read_png
@@ -0,0 +1,259 @@
+"""
+The static structure of a pacman level, compiled into lookup tables.
+
+A level's walls never change, so we work out everything which the ghosts need
+to know about getting around it just once: each cell's neighbours, the
+junctions and the corridors in between them, and the shortest-path distance
+between every pair of cells. With those, choosing a ghost's next move is a
+handful of table lookups.
+
+Compiling a level is cheap for a 16x16 grid but it grows with the square of the
+number of cells, so the tables are cached on disk keyed by the level's layout.
+"""
+
+import hashlib
+import logging
+import numpy as np
+import os
+
+# ----------------------------------------------------------------------
+
+# Inverted because of the display etc
+UP    = ( 0, -1)
+DOWN  = ( 0,  1)
+LEFT  = ( 1,  0)
+RIGHT = (-1,  0)
+DIRECTIONS = (UP, DOWN, LEFT, RIGHT)
+
+# The things which can be in the grid
+EMPTY = 0
+WALL  = 1
+PILL  = 2
+EATER = 3
+EXIT  = 4
+
+# Bump this if the format of the tables changes
+_VERSION = 1
+
+# Where we cache the compiled tables
+_CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+    'miscpi'
+)
+
+# The distance which means "can't get there from here"
+UNREACHABLE = 255
+
+# ----------------------------------------------------------------------
+
+class Maze():
+    """
+    The compiled tables for a level's layout. Cells are referred to by their
+    index, which is ``x * height + y``.
+    """
+    def __init__(self, layout, tables=None):
+        """
+        :type layout: ndarray
+        :param layout:
+            The ``(width, height)`` grid. Only the walls and the exits matter.
+        :type tables: dict
+        :param tables:
+            The already-compiled tables, if we have them.
+        """
+        self.layout = _layout(layout)
+        (self.width, self.height) = self.layout.shape
+        self.size = self.width * self.height
+
+        if tables is None:
+            tables = _compile(self.layout)
+
+        # (size, 4) of the neighbouring cell in each of the DIRECTIONS, or -1
+        self.neighbours = tables['neighbours']
+
+        # (size, size) of the number of steps from one cell to another
+        self.distances = tables['distances']
+
+        # (size,) of the closest open cell to each cell, for when a ghost is
+        # aiming for somewhere which it can't actually get to
+        self.nearest = tables['nearest']
+
+        # The junction graph. A junction is any open cell which doesn't just
+        # have two ways in and out; the edges are the corridors between them,
+        # as (from, to, length) triples.
+        self.junctions = tables['junctions']
+        self.edges     = tables['edges']
+
+        # Which cells are exits, which ghosts may not use at times
+        self.exits = (self.layout == EXIT).ravel()
+
+        # The index of the direction which reverses each direction
+        self.reverse = tuple(DIRECTIONS.index((-dx, -dy))
+                             for (dx, dy) in DIRECTIONS)
+
+
+    @classmethod
+    def load(cls, grid, cache_dir=_CACHE_DIR):
+        """
+        Get the `Maze` for the given grid, from the cache if we can.
+
+        :type grid: ndarray
+        :param grid:
+            The ``(width, height)`` grid.
+        :type cache_dir: str
+        :param cache_dir:
+            Where the cache lives, or `None` to not use one.
+        """
+        layout = _layout(grid)
+        if not cache_dir:
+            return cls(layout)
+
+        # The key is the layout itself
+        digest = hashlib.sha1()
+        digest.update(str((_VERSION, layout.shape)).encode())
+        digest.update(layout.tobytes())
+        path = os.path.join(cache_dir, 'pacman-maze-%s.npz' % digest.hexdigest())
+
+        try:
+            with np.load(path) as data:
+                tables = dict(data)
+            logging.debug("Loaded maze from %s", path)
+            return cls(layout, tables)
+        except (IOError, OSError, KeyError, ValueError):
+            pass
+
+        # Not there, or broken, so compile and save it for next time. We write
+        # it under a temporary name so that we never see a partial file.
+        maze = cls(layout)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = '%s.%d.tmp.npz' % (path[:-4], os.getpid())
+            np.savez_compressed(tmp,
+                                neighbours=maze.neighbours,
+                                distances =maze.distances,
+                                nearest   =maze.nearest,
+                                junctions =maze.junctions,
+                                edges     =maze.edges)
+            os.replace(tmp, path)
+            logging.debug("Saved maze to %s", path)
+        except (IOError, OSError) as e:
+            logging.warning("Could not cache maze in %s: %s", path, e)
+        return maze
+
+
+    def index(self, x, y):
+        """
+        The index of the cell at ``(x, y)``, wrapping around the edges.
+        """
+        return (x % self.width) * self.height + (y % self.height)
+
+
+    def position(self, index):
+        """
+        The ``(x, y)`` of the cell with the given index.
+        """
+        return divmod(int(index), self.height)
+
+
+    def target(self, x, y):
+        """
+        The index of the open cell closest to ``(x, y)``, which may be off the
+        grid or in a wall.
+        """
+        x = min(max(int(x), 0), self.width  - 1)
+        y = min(max(int(y), 0), self.height - 1)
+        return int(self.nearest[x * self.height + y])
+
+
+    def distance(self, a, b):
+        """
+        The number of steps from cell ``a`` to cell ``b``.
+        """
+        return int(self.distances[a, b])
+
+# ----------------------------------------------------------------------
+
+def _layout(grid):
+    """
+    Reduce a grid down to just the parts which don't change: walls, exits, and
+    everything else being open.
+    """
+    grid   = np.asarray(grid)
+    layout = np.zeros(grid.shape, dtype=np.uint8)
+    layout[grid == WALL] = WALL
+    layout[grid == EXIT] = EXIT
+    return layout
+
+
+def _compile(layout):
+    """
+    Build all the tables for a layout.
+    """
+    (width, height) = layout.shape
+    size  = width * height
+    open_ = (layout != WALL).ravel()
+
+    # The neighbours of each cell, with the edges wrapping around
+    neighbours = np.full((size, len(DIRECTIONS)), -1, dtype=np.int16)
+    for x in range(width):
+        for y in range(height):
+            i = x * height + y
+            if not open_[i]:
+                continue
+            for (d, (dx, dy)) in enumerate(DIRECTIONS):
+                j = ((x + dx) % width) * height + ((y + dy) % height)
+                if open_[j]:
+                    neighbours[i, d] = j
+
+    # All the shortest paths, by doing a BFS from every cell
+    adjacent  = [[int(j) for j in row if j >= 0] for row in neighbours]
+    distances = np.full((size, size), UNREACHABLE, dtype=np.uint8)
+    for start in np.flatnonzero(open_):
+        row        = distances[start]
+        row[start] = 0
+        frontier   = [start]
+        depth      = 0
+        while frontier and depth < UNREACHABLE - 1:
+            depth += 1
+            following = []
+            for i in frontier:
+                for j in adjacent[i]:
+                    if row[j] == UNREACHABLE:
+                        row[j] = depth
+                        following.append(j)
+            frontier = following
+
+    # The closest open cell to each cell, as the crow flies
+    (xs, ys)  = np.divmod(np.arange(size), height)
+    open_idx  = np.flatnonzero(open_)
+    d2 = ((xs[:, np.newaxis] - xs[open_idx]) ** 2 +
+          (ys[:, np.newaxis] - ys[open_idx]) ** 2)
+    nearest = open_idx[np.argmin(d2, axis=1)].astype(np.int16)
+
+    # The junctions, and the corridors between them
+    degree    = np.count_nonzero(neighbours >= 0, axis=1)
+    junctions = np.flatnonzero(open_ & (degree != 2)).astype(np.int16)
+    is_junction = np.zeros(size, dtype=bool)
+    is_junction[junctions] = True
+    edges = []
+    for start in junctions:
+        for first in adjacent[start]:
+            # Walk along the corridor until we hit another junction
+            (previous, current, length) = (start, first, 1)
+            while not is_junction[current]:
+                following = [j for j in adjacent[current] if j != previous]
+                if not following:
+                    break
+                (previous, current) = (current, following[0])
+                length += 1
+                if current == start:
+                    break
+            edges.append((start, current, length))
+    edges = np.array(edges, dtype=np.int16).reshape(-1, 3)
+
+    return {
+        'neighbours' : neighbours,
+        'distances'  : distances,
+        'nearest'    : nearest,
+        'junctions'  : junctions,
+        'edges'      : edges,
+    }
@@ -4,27 +4,63 @@ Little game for the Scroll HAT Mini.
 """
 
 import math
+import numpy as np
 import scrollphathd
 import time
 
+from   buttons    import ButtonEvents
+from   gameloop   import FixedStep, FrameStats
 from   gpiozero   import Button
-from   random     import random, shuffle
-from   signal     import pause
+from   random     import choice, random
 
 # ------------------------------------------------------------
 
-print("""Scroll HAT Mini: rockfall.py
-
-Dodge the falling rocks using the X and Y buttons on the HAT.
-
-The A and B buttons make it easier or harder.
-
-Press Ctrl+C to exit!
+def show(frame):
+    """
+    Push a ``(width, height)`` frame of brightnesses to the display.
 
-""")
+    The scrollphathd module keeps what it's going to show in a module-level
+    array, so we copy the frame straight into that if we can, rather than
+    setting each pixel in turn.
+    """
+    (width, height) = frame.shape
+    buf = getattr(scrollphathd, 'buf', None)
+    if (isinstance(buf, np.ndarray) and
+        buf.shape[0] >= width and buf.shape[1] >= height):
+        buf[:width, :height] = frame
+    else:
+        for x in range(width):
+            for y in range(height):
+                scrollphathd.pixel(x, y, float(frame[x, y]))
+    scrollphathd.show()
+
+
+def explosion_frames(width, height, x, y):
+    """
+    Work out the frames of the explosion animation, for when the player is at
+    ``(x, y)``. The explosion is a series of rings growing out from the
+    player, each brighter towards its edge.
 
+    :return: A pair of ``(frames, width, height)`` arrays: how bright each
+             pixel is in each frame, before the shimmer is applied, and
+             whether the frame changes it at all.
+    """
+    count   = int(width * 1.25)
+    bases   = np.zeros((count, width, height), dtype=np.float32)
+    written = np.zeros((count, width, height), dtype=bool)
+    for r in range(count):
+        c = 1 + int(math.pi * 2 * r)
+        for s in range(r):
+            for a in range(c):
+                o  = 2 * math.pi / c * a
+                px = int(math.sin(o) * s + x)
+                py = int(math.cos(o) * s + y)
+                if 0 <= px < width and 0 <= py < height:
+                    bases  [r, px, py] = s / r
+                    written[r, px, py] = True
+    return (bases, written)
 
-scrollphathd.set_brightness(0.4)
+# ------------------------------------------------------------
 
 class Rockfall():
     """
@@ -46,72 +82,229 @@ class Rockfall():
     MAX_FRAC  = 4.0 / HEIGHT
     FRAC_STEP = 1.0 / HEIGHT
 
-    def __init__(self):
-        # Set up the buttons
-        self._button_A = Button(5)
-        self._button_B = Button(6)
-        self._button_X = Button(16)
-        self._button_Y = Button(24)
+    # How bright the rocks and the player are
+    ROCK   = 0.5
+    PLAYER = 1.0
+
+    # How long each frame of the explosion is shown for
+    EXPLODE_FRAME_TIME = 0.01
+
+    # How often the game ticks, in seconds, which is the 20 a second that it
+    # always ran at, and how far behind we can fall before we give up on
+    # catching up
+    TICK_TIME    = 0.05
+    MAX_CATCH_UP = 1.0
+
+    # The buttons' pins, and how long a button has to be held down before it
+    # repeats
+    BUTTON_PINS = {'A': 5, 'B': 6, 'X': 16, 'Y': 24}
+    HOLD_TIME   = 0.15
+
+    def __init__(self, buttons=None):
+        """
+        :type buttons: dict
+        :param buttons:
+            The buttons, by name, if not the ones on the HAT. This is so that
+            they can be simulated.
+        """
+        # Set up the buttons, which tell us when they're pressed
+        if buttons is None:
+            buttons = dict((name, Button(pin,
+                                         hold_time  =self.HOLD_TIME,
+                                         hold_repeat=True))
+                           for (name, pin) in self.BUTTON_PINS.items())
+        self._buttons = buttons
+        self._events  = ButtonEvents()
+        for (name, button) in buttons.items():
+            self._events.attach(name, button)
+
+        # Whether we are running, and how the drawing went when we were
+        self._running    = False
+        self.frame_stats = FrameStats()
+
+        # How long the current game has been going, in game time, and whether
+        # anything changed since we last drew it
+        self._time  = 0.0
+        self._dirty = True
 
         # How easy or hard
         self._frac_new = self.MIN_FRAC
 
-        # The wait time between tocks
-        self._wait = self.WAIT
+        # The wait time between tocks, and how long since the last one
+        self._wait  = self.WAIT
+        self._since = 0.0
+
+        # The game area as a bitboard. Each row is an int where bit x being
+        # set means that there is a rock at x. The rocks come in at bit 0 and
+        # fall towards the top bit.
+        self._arena = [0] * self.HEIGHT
+        self._mask  = (1 << self.WIDTH) - 1
 
-        # The game area as a boolean bitmap. A True means there is a rock in an
-        # entry. This is stored as a tuple of rows.
-        self._arena = tuple([[False] * (self.WIDTH)
-                             for i in range(self.HEIGHT)])
+        # All the ways of putting new rocks in, by how many there are. Each is
+        # a bitmask over the rows, where bit y being set means that a rock
+        # comes in at the start of row y.
+        self._spawns = tuple(
+            tuple(m for m in range(1 << self.HEIGHT) if bin(m).count('1') == n)
+            for n in range(self.HEIGHT + 1)
+        )
 
         # The player's position, at the end of the display
         self._hpos = self.HEIGHT // 2
         self._wpos = self.WIDTH - 3
 
+        # The value of each bit in a row, for turning rows into pixels, and
+        # what we render into
+        self._bits  = 1 << np.arange(self.WIDTH, dtype=np.int64)
+        self._frame = np.zeros((self.WIDTH, self.HEIGHT), dtype=np.float32)
+
+        # The explosion, for each row which the player might be in. It comes
+        # from the far end of the display, not where the player is.
+        self._explosions = tuple(
+            explosion_frames(self.WIDTH, self.HEIGHT, self.WIDTH - 1, y)
+            for y in range(self.HEIGHT)
+        )
+
     # ------------------------------------------------------------
 
     def init(self):
         """
         Reset the state to start of game.
         """
-        for row in self._arena:
-            for i in range(len(row)):
-                row[i] = False
-        self._hpos = self.HEIGHT // 2
-        self._wait = self.WAIT
+        self._arena[:] = [0] * self.HEIGHT
+        self._hpos  = self.HEIGHT // 2
+        self._wait  = self.WAIT
+        self._since = 0.0
+        self._time  = 0.0
+        self._dirty = True
 
+        # Anything pressed while we weren't playing doesn't count
+        self._events.drain()
 
-    def step(self):
-        # Scroll the current values along by one
-        for row in self._arena:
-            row[1:] = row[:-1]
-            row[0]  = False
 
+    def step(self):
+        """
+        Move the rocks along by one, and add some new ones.
+        """
         # This fraction new, an interval between the minimum and the
         # difficulty value
         frac_new = max(self.MIN_FRAC, self._frac_new * random())
 
-        # Add new ones at random indices
-        indices = list(range(len(self._arena)))
-        shuffle(indices)
-        end = round(min(1, max(0, frac_new)) * len(indices))
-        for index in indices[:int(end)]:
-            self._arena[index][0] = True
-
-
-    def explode(self):
-        for r in range(int(self.WIDTH * 1.25)):
-            for s in range(r):
-                c = 1 + int(math.pi * 2 * r)
-                for a in range(c):
-                    o = 2 * math.pi / c * a
-                    x = int(math.sin(o) * s + self.WIDTH - 1)
-                    y = int(math.cos(o) * s + self._hpos)
-                    v = s / r * (0.2 + 0.8 * random())
-                    if 0 <= x < self.WIDTH and 0 <= y <= self.HEIGHT:
-                        scrollphathd.pixel(x, y, v)
-            scrollphathd.show()
-            time.sleep(0.01)
+        # Which rows get new ones
+        end   = int(round(min(1, max(0, frac_new)) * self.HEIGHT))
+        spawn = choice(self._spawns[end])
+
+        # Scroll the current values along by one, and add the new ones
+        mask = self._mask
+        self._arena[:] = [((row << 1) & mask) | ((spawn >> y) & 1)
+                          for (y, row) in enumerate(self._arena)]
+        self._dirty = True
+
+
+    @property
+    def collided(self):
+        """
+        Whether the player has hit a rock.
+        """
+        return (self._arena[self._hpos] & (1 << self._wpos)) != 0
+
+
+    def render(self):
+        """
+        Render the arena and the player into a ``(width, height)`` array of
+        brightnesses.
+        """
+        rows  = np.array(self._arena, dtype=np.int64)
+        frame = self._frame
+        np.multiply((rows[np.newaxis, :] & self._bits[:, np.newaxis]) != 0,
+                    self.ROCK,
+                    out=frame)
+        frame[self._wpos, self._hpos] = self.PLAYER
+        return frame
+
+
+    def explode(self, frame_time=None):
+        """
+        Play the explosion animation, over the top of the arena.
+
+        :type frame_time: float
+        :param frame_time:
+            How long to show each frame for, if not `EXPLODE_FRAME_TIME`.
+        """
+        if frame_time is None:
+            frame_time = self.EXPLODE_FRAME_TIME
+
+        (bases, written) = self._explosions[self._hpos]
+        frame = self.render().copy()
+        due   = time.monotonic()
+        for (base, mask) in zip(bases, written):
+            # Only the shimmer is worked out as we go
+            shimmer = np.random.random(frame.shape)
+            shimmer *= 0.8
+            shimmer += 0.2
+            shimmer *= base
+            np.copyto(frame, shimmer, where=mask)
+            show(frame)
+
+            # Keep to the frame rate, however long showing took
+            due += frame_time
+            time.sleep(max(0.0, due - time.monotonic()))
+
+
+    def press(self, name):
+        """
+        Handle a press of the named button.
+        """
+        # Make it easier or harder
+        if name == 'A':
+            self._frac_new = max(self.MIN_FRAC,
+                                 self._frac_new - self.FRAC_STEP)
+        elif name == 'B':
+            self._frac_new = min(self.MAX_FRAC,
+                                 self._frac_new + self.FRAC_STEP)
+
+        # Move the player
+        elif name == 'X' and self._hpos > 0:
+            self._hpos -= 1
+            self._dirty = True
+        elif name == 'Y' and self._hpos < self.HEIGHT-1:
+            self._hpos += 1
+            self._dirty = True
+
+
+    def tick(self):
+        """
+        Move the game on by `TICK_TIME`.
+
+        :return: Whether the player hit a rock.
+        """
+        # Handle any button presses since the last tick
+        for press in self._events.drain():
+            self.press(press.name)
+
+        # Move the things down
+        self._time  += self.TICK_TIME
+        self._since += self.TICK_TIME
+        if self._since >= self._wait:
+            self.step()
+            self._since = 0.0
+            self._wait  = max(0.0, self._wait - self.WAIT_DIFF)
+
+        return self.collided
+
+
+    def stop(self):
+        """
+        Have `run()` return.
+        """
+        self._running = False
+
+
+    def draw(self):
+        """
+        Draw the field and the player, and display it all.
+        """
+        show(self.render())
+        self._dirty = False
 
 
     def run(self):
@@ -119,68 +312,72 @@ class Rockfall():
         The main running loop.
         """
 
-        # State variables
-        self.init()
-        last  = time.time()
-        start = last
-
         # Set things to the starting values
+        self.init()
 
-        # Loop forever now
-        while True:
-            now   = time.time()
-            since = now - last
-
-            # Move the things down
-            if since > self._wait:
-                self.step()
-                last = now
-                self._wait = max(0.0, self._wait - self.WAIT_DIFF)
-
-            # Make it easier or harder
-            if self._button_A.is_active:
-                self._frac_new = max(self.MIN_FRAC,
-                                     self._frac_new - self.FRAC_STEP)
-            if self._button_B.is_active:
-                self._frac_new = min(self.MAX_FRAC,
-                                     self._frac_new + self.FRAC_STEP)
-
-            # Move the player
-            if self._button_X.is_active and self._hpos > 0:
-                self._hpos -= 1
-            if self._button_Y.is_active and self._hpos < self.HEIGHT-1:
-                self._hpos += 1
-
-            # Draw the field
-            for (y, row) in enumerate(self._arena):
-                for x,e in enumerate(row):
-                    v = 0.5 if e else 0.0
-                    scrollphathd.pixel(x, y, v)
-
-            # Draw the player
-            scrollphathd.pixel(self._wpos, self._hpos, 1.0)
-
-            # And display it all
-            scrollphathd.show()
-
-            # Collision?
-            if self._arena[self._hpos][self._wpos]:
-                # Print stats
-                print("You survived for %0.1f seconds" % (now - start))
-                print()
-
-                # Draw the explosion
-                self.explode()
-
-                # And reset things
-                self.init()
-                start = now
-                last  = now
-
-            # Wait for  bit befor emoving on
-            time.sleep(0.05)
+        # The game ticks in fixed steps, catching up if drawing was slow, and
+        # we draw after those if anything changed
+        loop  = FixedStep(self.TICK_TIME,
+                          max_steps=int(self.MAX_CATCH_UP / self.TICK_TIME))
+        stats = self.frame_stats = FrameStats()
+
+        # Loop until we're told not to
+        self._running = True
+        try:
+            while self._running:
+                # Move the game on
+                collided = False
+                for _ in range(loop.due()):
+                    collided = self.tick()
+                    if collided:
+                        break
+
+                # Draw it, if there's anything new to see
+                if self._dirty:
+                    stats.draw(self.draw)
+                else:
+                    stats.skip()
+
+                # Collision?
+                if collided:
+                    # Print stats
+                    print("You survived for %0.1f seconds" % self._time)
+                    print()
+
+                    # Draw the explosion
+                    self.explode()
+
+                    # And reset things
+                    self.init()
+                    loop.reset()
+
+                # Wait for the next tick
+                loop.wait()
+
+        finally:
+            # How did this game, and the drawing, go
+            print("You survived for %0.1f seconds" % self._time)
+            print(stats.summary())
+            if loop.dropped:
+                print("Fell behind by %0.1f seconds" %
+                      (loop.dropped * loop.step,))
 
 
 if __name__ == "__main__":
+    print("""Scroll HAT Mini: rockfall.py
+
+Dodge the falling rocks using the X and Y buttons on the HAT.
+
+The A and B buttons make it easier or harder.
+
+Press Ctrl+C to exit!
+
+""")
+
+    scrollphathd.set_brightness(0.4)
+
     game = Rockfall()
-    game.run()
+    try:
+        game.run()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,234 @@
+"""
+Automatic gain control for the vest's band levels.
+
+Each band has two envelope followers. The first is a fast one, which smooths
+the raw band level into something which feels like the music rather than
+buzzing with every frame. The second is a slow one which tracks how loud that
+band generally is, and which we use as the reference for the gain. That way a
+loud venue doesn't saturate every actuator and a quiet room still does
+something.
+
+There is also a noise floor, which drops quickly to the quiet bits and only
+rises slowly, so that anything which holds steady ends up under it. Only how
+far the envelope gets above that counts, so a hum or the hubbub of a room,
+however loud, leaves the actuators alone.
+
+All the state is held as NumPy arrays and updated for all the bands at once;
+there is no per-band Python code in the per-frame path.
+"""
+
+from __future__ import print_function, division
+
+import numpy as np
+
+# ----------------------------------------------------------------------
+
+class AutoGain():
+    """
+    Per-band automatic gain control with attack/release envelope followers.
+    """
+    def __init__(self,
+                 num_bands,
+                 frame_period,
+                 attack       =0.01,
+                 release      =0.15,
+                 gain_attack  =0.5,
+                 gain_release =10.0,
+                 noise_attack =10.0,
+                 noise_release=0.1,
+                 floor        =0.0001,
+                 headroom     =2.0,
+                 threshold    =0.1,
+                 gate         =0.5):
+        """
+        :type num_bands: int
+        :param num_bands:
+            The number of bands which we are controlling.
+        :type frame_period: float
+        :param frame_period:
+            The time between frames, in seconds.
+        :type attack: float
+        :param attack:
+            The time constant, in seconds, for the envelope to follow a rising
+            level.
+        :type release: float
+        :param release:
+            The time constant, in seconds, for the envelope to follow a falling
+            level.
+        :type gain_attack: float
+        :param gain_attack:
+            The time constant, in seconds, for the gain reference to follow a
+            rising envelope. This is how quickly we turn things down when it
+            gets loud.
+        :type gain_release: float
+        :param gain_release:
+            The time constant, in seconds, for the gain reference to follow a
+            falling envelope. This is how quickly we turn things up when it
+            gets quiet.
+        :type noise_attack: float
+        :param noise_attack:
+            The time constant, in seconds, for the noise floor to follow a
+            rising envelope. This is about how long something has to hold
+            steady before we take it as background.
+        :type noise_release: float
+        :param noise_release:
+            The time constant, in seconds, for the noise floor to follow a
+            falling envelope.
+        :type floor: float
+        :param floor:
+            The smallest reference level which we allow, so that we don't
+            amplify silence into noise.
+        :type headroom: float
+        :param headroom:
+            How far above the reference level the envelope may go before the
+            output saturates.
+        :type threshold: float
+        :param threshold:
+            The fraction of the reference level below which the output is zero.
+        :type gate: float
+        :param gate:
+            How far above the noise floor, as a fraction of it, the envelope
+            has to be before it counts for anything.
+        """
+        self._num_bands = int(num_bands)
+        self._period    = float(frame_period)
+        self._floor     = float(floor)
+        self._headroom  = float(headroom)
+        self._threshold = float(threshold)
+        self._gate      = float(gate)
+        if self._headroom <= 0:
+            raise ValueError("Headroom must be positive: %s" % (headroom,))
+        if not 0.0 <= self._threshold < 1.0:
+            raise ValueError("Threshold must be in [0, 1): %s" % (threshold,))
+        if self._gate < 0:
+            raise ValueError("Gate must not be negative: %s" % (gate,))
+
+        # The per-frame smoothing coefficients
+        self._attack        = self._coefficient(attack)
+        self._release       = self._coefficient(release)
+        self._gain_attack   = self._coefficient(gain_attack)
+        self._gain_release  = self._coefficient(gain_release)
+        self._noise_attack  = self._coefficient(noise_attack)
+        self._noise_release = self._coefficient(noise_release)
+
+        # The state. We start the reference at the floor so that we ramp up to
+        # whatever the room is. The noise floor starts at the first envelope
+        # which we see, so that a steady background is ignored from the off.
+        self._envelope  = np.zeros(self._num_bands)
+        self._reference = np.full(self._num_bands, self._floor)
+        self._noise     = np.zeros(self._num_bands)
+        self._started   = False
+
+        # Scratch space, so that we don't allocate in the per-frame path
+        self._coeffs = np.empty(self._num_bands)
+        self._rising = np.empty(self._num_bands, dtype=bool)
+        self._gated  = np.empty(self._num_bands)
+        self._span   = np.empty(self._num_bands)
+
+
+    @property
+    def envelope(self):
+        """
+        The current envelope of each band.
+        """
+        return self._envelope
+
+
+    @property
+    def reference(self):
+        """
+        The current gain reference level of each band.
+        """
+        return self._reference
+
+
+    @property
+    def noise(self):
+        """
+        The current noise floor of each band.
+        """
+        return self._noise
+
+
+    def reset(self):
+        """
+        Put the state back to how it started.
+        """
+        self._envelope [:] = 0.0
+        self._reference[:] = self._floor
+        self._noise    [:] = 0.0
+        self._started      = False
+
+
+    def process(self, levels, out=None):
+        """
+        Update the state with the next frame of band levels and give back the
+        output values, in the range ``[0, 1]``.
+
+        :type levels: ndarray
+        :param levels:
+            The ``num_bands`` band levels for this frame.
+        :type out: ndarray
+        :param out:
+            Optional output array to put the values into.
+        """
+        # Follow the levels with the envelope
+        self._follow(self._envelope, levels, self._attack, self._release)
+
+        # And the envelope with the reference, which we don't let drop below
+        # the floor
+        self._follow(self._reference,
+                     self._envelope,
+                     self._gain_attack,
+                     self._gain_release)
+        np.maximum(self._reference, self._floor, out=self._reference)
+
+        # And the envelope with the noise floor, which anything steady will
+        # end up under
+        if self._started:
+            self._follow(self._noise,
+                         self._envelope,
+                         self._noise_attack,
+                         self._noise_release)
+        else:
+            np.copyto(self._noise, self._envelope)
+            self._started = True
+
+        # The output is how far the envelope is above the noise gate, relative
+        # to how far the reference is above it, with anything under the
+        # threshold removed. When the gate gets up near the reference we
+        # measure against a tenth of the reference instead, so that the odd
+        # blip over the gate isn't blown up into a full strength buzz.
+        gated = np.multiply(self._noise, 1.0 + self._gate, out=self._gated)
+        span  = np.multiply(self._reference, 0.1, out=self._span)
+        out   = np.subtract(self._envelope, gated, out=out)
+        gated = np.subtract(self._reference, gated, out=gated)
+        out /= np.maximum(gated, span, out=gated)
+        out *= 1.0 / self._headroom
+        out -= self._threshold
+        out *= 1.0 / (1.0 - self._threshold)
+        return np.clip(out, 0.0, 1.0, out=out)
+
+
+    def _coefficient(self, time_constant):
+        """
+        Turn a time constant into a per-frame smoothing coefficient.
+        """
+        time_constant = float(time_constant)
+        if time_constant <= 0:
+            return 0.0
+        return np.exp(-self._period / time_constant)
+
+
+    def _follow(self, state, target, attack, release):
+        """
+        Move the state towards the target, in place, using the attack
+        coefficient where the target is above the state and the release one
+        otherwise.
+        """
+        np.greater(target, state, out=self._rising)
+        np.copyto(self._coeffs, release)
+        self._coeffs[self._rising] = attack
+        state -= target
+        state *= self._coeffs
+        state += target
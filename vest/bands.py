@@ -0,0 +1,292 @@
+"""
+Mapping of FFT bins onto the vest's actuator bands.
+
+The bands are spaced on a log (or mel) scale since that's much closer to how
+we hear things; equal linear buckets put almost every actuator up in the
+frequencies which music barely has. All the heavy lifting is done up front: the
+band edges are computed once and, for each FFT size we are asked about, the
+per-bin weights are compiled into a matrix so that mapping a frame is a single
+matrix-vector product.
+"""
+
+from __future__ import print_function, division
+
+import numpy as np
+
+# ----------------------------------------------------------------------
+
+# The supported band spacings
+_SCALES = ('log', 'mel', 'linear')
+
+# The defaults for the band layout, these can be overridden by the config file
+_DEFAULTS = {
+    'scale'     : 'mel',
+    'low_hz'    : 60.0,
+    'high_hz'   : 8000.0,
+    'weighting' : 'a',
+    'gains'     : None,
+}
+
+# ----------------------------------------------------------------------
+
+def _hz_to_mel(hz):
+    """
+    Convert from Hertz to mels.
+    """
+    return 2595.0 * np.log10(1.0 + np.asarray(hz, dtype=np.float64) / 700.0)
+
+
+def _mel_to_hz(mel):
+    """
+    Convert from mels to Hertz.
+    """
+    return 700.0 * (10.0 ** (np.asarray(mel, dtype=np.float64) / 2595.0) - 1.0)
+
+
+def _a_weighting(hz):
+    """
+    The A-weighting curve, as a linear gain, for the given frequencies. This is
+    roughly how loud a frequency sounds to a human, relative to 1 kHz.
+    """
+    f2 = np.asarray(hz, dtype=np.float64) ** 2
+    num = (12194.0 ** 2) * f2 * f2
+    den = ((f2 + 20.6 ** 2) *
+           np.sqrt((f2 + 107.7 ** 2) * (f2 + 737.9 ** 2)) *
+           (f2 + 12194.0 ** 2))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gain = np.where(den > 0, num / den, 0.0)
+    # Normalise so that 1kHz is unity gain (which is +2dB in the raw curve)
+    return gain * 10.0 ** (2.0 / 20.0)
+
+
+def read_config(filename):
+    """
+    Read a band layout file. This is a simple file of ``key = value`` lines,
+    with ``#`` comments. The known keys are:
+
+      scale     -- One of "log", "mel" or "linear"
+      low_hz    -- The bottom edge of the lowest band
+      high_hz   -- The top edge of the highest band
+      weighting -- "a" for A-weighting, or "none"
+      gains     -- Whitespace-separated per-band gains, lowest band first
+
+    :type filename: str
+    :param filename:
+        The path of the file to read.
+
+    :return: A dict of the settings, suitable for passing to `BandMap`.
+    """
+    config = dict(_DEFAULTS)
+    with open(filename, 'rt') as fh:
+        for (lineno, line) in enumerate(fh, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            if '=' not in line:
+                raise ValueError("%s:%d: Expected 'key = value' but had %r" %
+                                 (filename, lineno, line))
+            (key, value) = (s.strip() for s in line.split('=', 1))
+            if key not in _DEFAULTS:
+                raise ValueError("%s:%d: Unknown key %r" %
+                                 (filename, lineno, key))
+            if key in ('low_hz', 'high_hz'):
+                value = float(value)
+            elif key == 'gains':
+                value = tuple(float(v) for v in value.split())
+            else:
+                value = value.lower()
+            config[key] = value
+    return config
+
+# ----------------------------------------------------------------------
+
+class BandMap():
+    """
+    Maps FFT magnitudes onto a fixed number of output bands.
+    """
+    def __init__(self,
+                 num_bands,
+                 rate,
+                 scale    =_DEFAULTS['scale'],
+                 low_hz   =_DEFAULTS['low_hz'],
+                 high_hz  =_DEFAULTS['high_hz'],
+                 weighting=_DEFAULTS['weighting'],
+                 gains    =_DEFAULTS['gains']):
+        """
+        :type num_bands: int
+        :param num_bands:
+            How many output bands to have.
+        :type rate: int
+        :param rate:
+            The sample rate of the audio, in Hz.
+        :type scale: str
+        :param scale:
+            How the band edges are spaced, one of "log", "mel" or "linear".
+        :type low_hz: float
+        :param low_hz:
+            The bottom edge of the lowest band.
+        :type high_hz: float
+        :param high_hz:
+            The top edge of the highest band. This is clipped to the Nyquist
+            frequency.
+        :type weighting: str
+        :param weighting:
+            The perceptual weighting to apply to the bins; "a" or "none".
+        :type gains: tuple
+        :param gains:
+            Optional per-band gains, lowest band first.
+        """
+        if scale not in _SCALES:
+            raise ValueError("Unknown scale %r, wanted one of %s" %
+                             (scale, ', '.join(_SCALES)))
+        if weighting not in ('a', 'none'):
+            raise ValueError("Unknown weighting %r" % (weighting,))
+
+        self._num_bands = int(num_bands)
+        self._rate      = int(rate)
+        self._weighting = weighting
+
+        # Sanity check the range
+        high_hz = min(float(high_hz), self._rate / 2.0)
+        low_hz  = float(low_hz)
+        if not 0 < low_hz < high_hz:
+            raise ValueError("Bad band range [%s, %s]" % (low_hz, high_hz))
+
+        # The edges of the bands. We have num_bands + 2 points so that each
+        # band's triangle can reach its neighbours' centres.
+        n = self._num_bands + 2
+        if scale == 'mel':
+            points = _mel_to_hz(np.linspace(_hz_to_mel(low_hz),
+                                            _hz_to_mel(high_hz),
+                                            n))
+        elif scale == 'log':
+            points = np.geomspace(low_hz, high_hz, n)
+        else:
+            points = np.linspace(low_hz, high_hz, n)
+        self._points = points
+
+        # The per-band gains
+        if gains is None:
+            self._gains = np.ones(self._num_bands)
+        else:
+            if len(gains) != self._num_bands:
+                raise ValueError("Had %d gains for %d bands" %
+                                 (len(gains), self._num_bands))
+            self._gains = np.asarray(gains, dtype=np.float64)
+
+        # The compiled matrices, keyed by FFT size
+        self._matrices = {}
+
+
+    @classmethod
+    def from_file(cls, filename, num_bands, rate):
+        """
+        Create a `BandMap` using the layout in the given file.
+
+        @see read_config()
+        """
+        return cls(num_bands, rate, **read_config(filename))
+
+
+    @property
+    def num_bands(self):
+        """
+        How many bands we map to.
+        """
+        return self._num_bands
+
+
+    @property
+    def centres(self):
+        """
+        The centre frequencies of the bands, in Hz.
+        """
+        return self._points[1:-1]
+
+
+    def matrix(self, fft_size):
+        """
+        Get the ``(num_bands, fft_size // 2 + 1)`` weight matrix for the given
+        FFT size. These are computed on first use and cached thereafter.
+
+        :type fft_size: int
+        :param fft_size:
+            The number of samples which went into the FFT.
+        """
+        fft_size = int(fft_size)
+        matrix = self._matrices.get(fft_size)
+        if matrix is None:
+            matrix = self._compile(fft_size)
+            self._matrices[fft_size] = matrix
+        return matrix
+
+
+    def map(self, magnitudes, fft_size=None, out=None):
+        """
+        Map the magnitudes of the non-negative frequency FFT bins onto the
+        bands.
+
+        :type magnitudes: ndarray
+        :param magnitudes:
+            The ``fft_size // 2 + 1`` bin magnitudes.
+        :type fft_size: int
+        :param fft_size:
+            The number of samples which went into the FFT. If not given then it
+            is inferred from the number of bins, assuming an even size.
+        :type out: ndarray
+        :param out:
+            Optional output array to put the values into.
+
+        :return: The band values, as a ``num_bands`` array.
+        """
+        if fft_size is None:
+            fft_size = 2 * (len(magnitudes) - 1)
+        matrix = self.matrix(fft_size)
+        return np.dot(matrix, magnitudes[:matrix.shape[1]], out=out)
+
+
+    def _compile(self, fft_size):
+        """
+        Build the weight matrix for an FFT size.
+        """
+        num_bins = fft_size // 2 + 1
+        freqs    = np.arange(num_bins) * (self._rate / fft_size)
+
+        # Triangular filters, rising from the previous band's centre to this
+        # one and falling to the next one's
+        lo  = self._points[:-2, np.newaxis]
+        mid = self._points[1:-1, np.newaxis]
+        hi  = self._points[2:, np.newaxis]
+        rising  = (freqs - lo) / (mid - lo)
+        falling = (hi - freqs) / (hi - mid)
+        matrix  = np.maximum(0.0, np.minimum(rising, falling))
+
+        # At small FFT sizes the low bands can be narrower than a bin, in which
+        # case they would get nothing. Give them the nearest bin instead.
+        for (i, centre) in enumerate(mid[:, 0]):
+            if not matrix[i].any():
+                matrix[i, int(round(centre * fft_size / self._rate))] = 1.0
+
+        # Normalise each band so that it's a mean of its bins
+        totals = matrix.sum(axis=1, keepdims=True)
+        totals[totals == 0] = 1.0
+        matrix /= totals
+
+        # Now perceptually weight the bins, and apply the band gains
+        if self._weighting == 'a':
+            matrix *= _a_weighting(freqs)
+        matrix *= self._gains[:, np.newaxis]
+
+        return matrix
+
+
+# ----------------------------------------------------------------------
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1:
+        bands = BandMap.from_file(sys.argv[1], 10, 44100)
+    else:
+        bands = BandMap(10, 44100)
+    for centre in bands.centres:
+        print("%8.1f Hz" % centre)
@@ -0,0 +1,112 @@
+"""
+The vest's signal processing chain: from a chunk of audio samples to the duty
+cycle of each actuator.
+"""
+
+from __future__ import print_function, division
+
+from   agc   import AutoGain
+from   bands import BandMap
+
+import metrics
+import numpy as np
+import os
+
+# ----------------------------------------------------------------------
+
+# The default band layout file, which lives alongside this one
+BANDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'bands.conf')
+
+# How long the FFTs take
+_FFT_TIME = metrics.histogram('vest_fft_seconds',
+                              'Time taken to compute the FFT of each frame')
+
+# ----------------------------------------------------------------------
+
+class Processor():
+    """
+    Turns chunks of audio into per-actuator duty cycles.
+    """
+    def __init__(self, num_out, chunk, rate, bands_file=BANDS_FILE, **gain_args):
+        """
+        :type num_out: int
+        :param num_out:
+            How many outputs to drive.
+        :type chunk: int
+        :param chunk:
+            The number of samples in each chunk of audio.
+        :type rate: int
+        :param rate:
+            The sample rate, in Hz.
+        :type bands_file: str
+        :param bands_file:
+            The band layout file. If this doesn't exist then we use the
+            default layout.
+        :param gain_args:
+            Any extra arguments for the `AutoGain`.
+        """
+        self._chunk    = int(chunk)
+        self._num_bins = self._chunk // 2 + 1
+
+        # How we map the FFT bins onto the outputs. This compiles the bin
+        # weights up front so that we don't have to do anything per-frame
+        # other than apply them.
+        if bands_file and os.path.exists(bands_file):
+            self._bands = BandMap.from_file(bands_file, num_out, rate)
+        else:
+            self._bands = BandMap(num_out, rate)
+        self._bands.matrix(self._chunk)
+
+        # The automatic gain control, which works out how hard to drive each
+        # actuator for the room which we are in
+        self._gain = AutoGain(num_out, self._chunk / rate, **gain_args)
+
+        # Scratch space for the per-frame values
+        self._levels  = np.zeros(num_out)
+        self._outputs = np.zeros(num_out)
+
+
+    @property
+    def bands(self):
+        """
+        The `BandMap` which we are using.
+        """
+        return self._bands
+
+
+    @property
+    def gain(self):
+        """
+        The `AutoGain` which we are using.
+        """
+        return self._gain
+
+
+    def process(self, samples, out=None):
+        """
+        Process a chunk of samples.
+
+        :type samples: ndarray
+        :param samples:
+            The int16 audio samples.
+        :type out: ndarray
+        :param out:
+            Where to put the duty cycles, if given.
+
+        :return: The duty cycles, as percentages.
+        """
+        # Compute the FFT and normalise it, so that a full-scale sine wave has
+        # a magnitude of 1
+        with _FFT_TIME.time():
+            yf = np.abs(np.fft.rfft(samples, self._chunk))
+        yf *= 1.0 / (32768 * self._chunk / 2)
+
+        # Map onto the outputs, apply the gain, and change to a duty cycle
+        # value in between 0 and 100 (percent)
+        self._bands.map(yf, self._chunk, out=self._levels)
+        self._gain.process(self._levels, out=self._outputs)
+        if out is None:
+            out = np.empty(len(self._outputs))
+        np.multiply(self._outputs, 100.0, out=out)
+        return out
@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+"""
+The backends which drive the vest's actuators.
+
+Each backend takes the pins, as a tuple of sides, and is given one duty cycle
+per band which is applied to that band's pin on every side. The choices are:
+
+  gpio      -- RPi.GPIO software PWM; one thread per pin
+  batched   -- One thread which bit-bangs all the pins at once
+  pigpio    -- A DMA-timed waveform, built by the pigpio daemon; no threads here
+  simulated -- Nothing at all, it just records the values which it was given
+
+Running this file will drive a backend with changing values for a while and
+report how much CPU it used, how many threads there were and, where we can
+measure it, the timing jitter.
+"""
+
+from __future__ import print_function, division
+
+from   abc import abstractmethod
+
+import argparse
+import logging as LOG
+import numpy   as np
+import os
+import threading
+import time
+
+# ----------------------------------------------------------------------
+
+class Output():
+    """
+    Interface class for the different ways of driving the actuators.
+    """
+    def __init__(self, pins):
+        """
+        :type pins: tuple
+        :param pins:
+            The tuple of sides, each being a tuple of the BCM GPIO numbers for
+            that side's bands.
+        """
+        self._pins = tuple(tuple(side) for side in pins)
+        if len(set(len(side) for side in self._pins)) != 1:
+            raise ValueError("All sides must have the same number of pins")
+        self._num_out = len(self._pins[0])
+
+
+    @property
+    def num_out(self):
+        """
+        The number of bands which we drive.
+        """
+        return self._num_out
+
+
+    @abstractmethod
+    def set(self, duty_cycles):
+        """
+        Set the duty cycles of the outputs.
+
+        :type duty_cycles: ndarray
+        :param duty_cycles:
+            The ``num_out`` duty cycles, as percentages.
+        """
+        pass
+
+
+    def close(self):
+        """
+        Stop driving the outputs.
+        """
+        pass
+
+
+    @property
+    def jitter(self):
+        """
+        The mean and max lateness of the output edges, in seconds, or `None` if
+        we can't tell.
+        """
+        return None
+
+
+    def _quantise(self, duty_cycles, steps):
+        """
+        Turn the duty cycle percentages into integers in ``[0, steps]``.
+        """
+        values = np.clip(np.asarray(duty_cycles, dtype=np.float64), 0.0, 100.0)
+        return np.rint(values * (steps / 100.0)).astype(int)
+
+
+class GpioOutput(Output):
+    """
+    Drive the outputs using RPi.GPIO's software PWM, one instance per pin.
+    """
+    def __init__(self, pins, pwm_hz):
+        """
+        :type pwm_hz: int
+        :param pwm_hz:
+            The PWM frequency.
+        """
+        super(GpioOutput, self).__init__(pins)
+
+        # Specific imports
+        import RPi.GPIO as GPIO
+        self._gpio = GPIO
+
+        # Set the pin numbering to be that of the GPIOs, not the pins on the
+        # board. And turn off noisy warnings.
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setwarnings(False)
+
+        # Init the GPIO ports etc.
+        self._pwms = list()
+        for side in self._pins:
+            pwm_side = list()
+            self._pwms.append(pwm_side)
+            for pin in side:
+                GPIO.setup (pin, GPIO.OUT)
+                GPIO.output(pin, False)
+
+                # Set up the pulse-wide modulalisation
+                pwm_pin = GPIO.PWM(pin, pwm_hz)
+                pwm_pin.start(0)
+                pwm_side.append(pwm_pin)
+
+        # What we last set, so that we only change what we need to
+        self._last = [0] * self._num_out
+
+
+    def set(self, duty_cycles):
+        """
+        @see Output.set()
+        """
+        for i in range(self._num_out):
+            duty_cycle = int(duty_cycles[i])
+            if duty_cycle != self._last[i]:
+                self._last[i] = duty_cycle
+                for pwm_side in self._pwms:
+                    pwm_side[i].ChangeDutyCycle(duty_cycle)
+
+
+    def close(self):
+        """
+        @see Output.close()
+        """
+        for pwm_side in self._pwms:
+            for pwm in pwm_side:
+                pwm.stop()
+
+
+class BatchedOutput(Output):
+    """
+    Drive all the outputs from a single thread, which bit-bangs a PWM cycle
+    across all of them at once. The duty cycles are quantised into a number of
+    steps, and each step which has pins changing is one batched write.
+    """
+    def __init__(self, pins, pwm_hz, steps=20, write=None):
+        """
+        :type pwm_hz: int
+        :param pwm_hz:
+            The PWM frequency.
+        :type steps: int
+        :param steps:
+            How many duty cycle steps to have.
+        :type write: callable
+        :param write:
+            The function to call to set a list of pins to a value, with the
+            same signature as ``RPi.GPIO.output()``. If this is not given then
+            we use RPi.GPIO.
+        """
+        super(BatchedOutput, self).__init__(pins)
+
+        if write is None:
+            # Specific imports
+            import RPi.GPIO as GPIO
+            GPIO.setmode(GPIO.BCM)
+            GPIO.setwarnings(False)
+            for side in self._pins:
+                for pin in side:
+                    GPIO.setup (pin, GPIO.OUT)
+                    GPIO.output(pin, False)
+            write = GPIO.output
+        self._write  = write
+        self._period = 1.0 / pwm_hz
+        self._steps  = int(steps)
+
+        # The pins for each band, across the sides
+        self._band_pins = tuple(tuple(side[i] for side in self._pins)
+                                for i in range(self._num_out))
+
+        # What to do each cycle. This is a tuple of the pins to turn on at the
+        # start of the cycle and a tuple of (time, pins) to turn off. We
+        # replace it wholesale when things change so that the thread always
+        # sees a consistent version.
+        self._last     = None
+        self._schedule = ((), ())
+        self.set(np.zeros(self._num_out))
+
+        # Timing stats
+        self._edges    = 0
+        self._late_sum = 0.0
+        self._late_max = 0.0
+        self.overruns  = 0
+
+        # And start the writer
+        self._running = True
+        self._thread  = threading.Thread(target=self._run, name='batched')
+        self._thread.daemon = True
+        self._thread.start()
+
+
+    def set(self, duty_cycles):
+        """
+        @see Output.set()
+        """
+        steps = self._quantise(duty_cycles, self._steps)
+        if self._last is not None and np.array_equal(steps, self._last):
+            return
+        self._last = steps
+
+        on  = []
+        off = []
+        for level in sorted(set(int(s) for s in steps)):
+            pins = [pin
+                    for i in np.flatnonzero(steps == level)
+                    for pin in self._band_pins[i]]
+            if level > 0:
+                on.extend(pins)
+            if level < self._steps:
+                off.append((level * self._period / self._steps, pins))
+        self._schedule = (tuple(on), tuple(off))
+
+
+    def close(self):
+        """
+        @see Output.close()
+        """
+        self._running = False
+        self._thread.join()
+        self._write([pin for side in self._pins for pin in side], False)
+
+
+    @property
+    def jitter(self):
+        """
+        @see Output.jitter
+        """
+        if self._edges == 0:
+            return None
+        return (self._late_sum / self._edges, self._late_max)
+
+
+    def _run(self):
+        """
+        The writer thread's body.
+        """
+        start = time.time()
+        while self._running:
+            (on, off) = self._schedule
+            if on:
+                self._write(on, True)
+            for (offset, pins) in off:
+                when = start + offset
+                wait = when - time.time()
+                if wait > 0:
+                    time.sleep(wait)
+                self._write(pins, False)
+                self._record(time.time() - when)
+
+            # On to the next cycle. If we have fallen more than a whole cycle
+            # behind then don't try to catch up, just start again from now.
+            start += self._period
+            wait = start - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            elif wait < -self._period:
+                self.overruns += 1
+                start = time.time()
+
+
+    def _record(self, late):
+        """
+        Record the lateness of an edge.
+        """
+        self._edges    += 1
+        self._late_sum += late
+        self._late_max  = max(self._late_max, late)
+
+
+class PigpioOutput(Output):
+    """
+    Drive all the outputs from a single DMA-timed waveform, built using the
+    pigpio daemon. Each PWM cycle is one waveform, which the daemon repeats, so
+    nothing here runs once it's been set up.
+    """
+    def __init__(self, pins, pwm_hz, steps=100):
+        """
+        :type pwm_hz: int
+        :param pwm_hz:
+            The PWM frequency.
+        :type steps: int
+        :param steps:
+            How many duty cycle steps to have.
+        """
+        super(PigpioOutput, self).__init__(pins)
+
+        # Specific imports
+        import pigpio
+        self._pigpio = pigpio
+
+        self._pi = pigpio.pi()
+        if not self._pi.connected:
+            raise IOError("Could not connect to the pigpio daemon")
+
+        self._period_us = int(1e6 / pwm_hz)
+        self._steps     = int(steps)
+        self._band_mask = tuple(sum(1 << side[i] for side in self._pins)
+                                for i in range(self._num_out))
+        for side in self._pins:
+            for pin in side:
+                self._pi.set_mode(pin, pigpio.OUTPUT)
+                self._pi.write(pin, 0)
+
+        # The current waveform, and the values which it's for
+        self._wave_id = None
+        self._last    = None
+        self._pi.wave_clear()
+        self.set(np.zeros(self._num_out))
+
+
+    def set(self, duty_cycles):
+        """
+        @see Output.set()
+        """
+        steps = self._quantise(duty_cycles, self._steps)
+        if self._last is not None and np.array_equal(steps, self._last):
+            return
+        self._last = steps
+
+        # Build the cycle as a list of pulses. We turn everything which is on
+        # at all on at the start, and then turn each level off in turn.
+        masks = {}
+        for (i, level) in enumerate(steps):
+            masks[int(level)] = masks.get(int(level), 0) | self._band_mask[i]
+        on_mask = sum(mask for (level, mask) in masks.items() if level > 0)
+        pulses  = []
+        (when, pending_on, pending_off) = (0, on_mask, 0)
+        for level in sorted(masks):
+            if level >= self._steps:
+                break
+            at = level * self._period_us // self._steps
+            if at > when:
+                pulses.append(self._pigpio.pulse(pending_on, pending_off,
+                                                 at - when))
+                (pending_on, pending_off) = (0, 0)
+            pending_off |= masks[level]
+            when = at
+        pulses.append(self._pigpio.pulse(pending_on, pending_off,
+                                         self._period_us - when))
+
+        # Swap to the new waveform at the end of the current cycle
+        self._pi.wave_add_generic(pulses)
+        wave_id = self._pi.wave_create()
+        self._pi.wave_send_using_mode(wave_id,
+                                      self._pigpio.WAVE_MODE_REPEAT_SYNC)
+        if self._wave_id is not None:
+            self._pi.wave_delete(self._wave_id)
+        self._wave_id = wave_id
+
+
+    def close(self):
+        """
+        @see Output.close()
+        """
+        self._pi.wave_tx_stop()
+        for side in self._pins:
+            for pin in side:
+                self._pi.write(pin, 0)
+        self._pi.stop()
+
+
+class SimulatedOutput(Output):
+    """
+    An output which just remembers what it was given. This is for testing
+    without any hardware.
+    """
+    def __init__(self, pins, pwm_hz=None):
+        super(SimulatedOutput, self).__init__(pins)
+        self.values  = np.zeros(self._num_out)
+        self.updates = 0
+
+
+    def set(self, duty_cycles):
+        """
+        @see Output.set()
+        """
+        self.values[:] = duty_cycles
+        self.updates += 1
+
+# ----------------------------------------------------------------------
+
+# The backends, by name
+BACKENDS = {
+    'gpio'      : GpioOutput,
+    'batched'   : BatchedOutput,
+    'pigpio'    : PigpioOutput,
+    'simulated' : SimulatedOutput,
+}
+
+
+def create(backend, pins, pwm_hz):
+    """
+    Create an output backend by name.
+
+    :type backend: str
+    :param backend:
+        The name of the backend, one of the keys of `BACKENDS`.
+    """
+    try:
+        cls = BACKENDS[backend]
+    except KeyError:
+        raise ValueError("Unknown output backend %r, wanted one of %s" %
+                         (backend, ', '.join(sorted(BACKENDS))))
+    LOG.info("Using %s output", backend)
+    return cls(pins, pwm_hz)
+
+# ----------------------------------------------------------------------
+
+def _num_threads():
+    """
+    How many OS threads this process has, including ones which Python doesn't
+    know about.
+    """
+    try:
+        return len(os.listdir('/proc/self/task'))
+    except OSError:
+        return threading.active_count()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('backend', choices=sorted(BACKENDS))
+    parser.add_argument('--seconds', type=float, default=10.0,
+                        help='How long to run for')
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Don't touch the GPIOs with the batched backend")
+    args = parser.parse_args()
+
+    pins = (( 2,  3,  4, 17, 27, 22, 10,  9, 11,  5),
+            ( 6, 13, 19, 26, 25,  8,  7, 16, 20, 21))
+    if args.backend == 'batched' and args.dry_run:
+        output = BatchedOutput(pins, 500, write=lambda pins, value: None)
+    else:
+        output = create(args.backend, pins, 500)
+
+    # Change the values at about the rate which the vest does
+    rng     = np.random.RandomState(0)
+    cpu     = time.process_time()
+    start   = time.time()
+    threads = _num_threads()
+    while time.time() - start < args.seconds:
+        output.set(rng.uniform(0, 100, output.num_out))
+        time.sleep(2048 / 44100)
+    cpu   = time.process_time() - cpu
+    wall  = time.time() - start
+    output.close()
+
+    print("Backend: %s" % (args.backend,))
+    print("Threads: %d" % (threads,))
+    print("CPU:     %0.1f%%" % (100 * cpu / wall))
+    if output.jitter is not None:
+        (mean, worst) = output.jitter
+        print("Jitter:  mean %0.1fus, max %0.1fus" % (mean * 1e6, worst * 1e6))
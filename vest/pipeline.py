@@ -0,0 +1,171 @@
+"""
+Bits for running the vest as a pipeline of threads.
+
+The stages hand data to one another through an `Exchange`, which is a
+single-slot "latest value" mailbox. The producer always has a buffer to write
+into, and publishing never waits for the consumer; if the consumer hasn't
+picked up the previous value then it's simply replaced, and we count that as a
+dropped frame. The consumer always gets the freshest value which was published.
+"""
+
+from __future__ import print_function, division
+
+import logging as LOG
+import numpy   as np
+import threading
+
+# ----------------------------------------------------------------------
+
+class Exchange():
+    """
+    A triple-buffered, single-producer single-consumer, latest-value exchange
+    of preallocated NumPy arrays.
+
+    The producer fills in `back` and calls `publish()`; the consumer calls
+    `take()` and reads the array which it gets back. Each side owns its buffer
+    outright until it next calls one of those, so no data is copied and the
+    lock is only ever held to swap a couple of indices around.
+    """
+    def __init__(self, shape, dtype=np.float64):
+        """
+        :type shape: tuple
+        :param shape:
+            The shape of the arrays being exchanged.
+        :type dtype: numpy.dtype
+        :param dtype:
+            The type of the arrays being exchanged.
+        """
+        self._buffers = tuple(np.zeros(shape, dtype=dtype) for _ in range(3))
+
+        # Which buffer is owned by the producer, which is the one waiting to
+        # be picked up, and which is owned by the consumer
+        self._back   = 0
+        self._middle = 1
+        self._front  = 2
+
+        # Whether the middle buffer has something which the consumer hasn't
+        # seen yet
+        self._fresh = False
+
+        self._lock  = threading.Lock()
+        self._ready = threading.Event()
+
+        # Stats
+        self.published = 0
+        self.taken     = 0
+        self.dropped   = 0
+
+
+    @property
+    def back(self):
+        """
+        The buffer which the producer should fill in before calling
+        `publish()`.
+        """
+        return self._buffers[self._back]
+
+
+    def publish(self):
+        """
+        Make the contents of `back` available to the consumer. This never
+        blocks on the consumer.
+        """
+        with self._lock:
+            (self._back, self._middle) = (self._middle, self._back)
+            if self._fresh:
+                # The consumer never saw the previous one
+                self.dropped += 1
+            self._fresh = True
+            self.published += 1
+            self._ready.set()
+
+
+    def take(self, timeout=None):
+        """
+        Get the freshest published buffer, waiting for up to the given timeout
+        for one to arrive.
+
+        :type timeout: float
+        :param timeout:
+            How long to wait, in seconds, or `None` to wait forever.
+
+        :return: The array, or `None` if nothing new arrived in time.
+        """
+        if not self._ready.wait(timeout):
+            return None
+        with self._lock:
+            if not self._fresh:
+                return None
+            (self._front, self._middle) = (self._middle, self._front)
+            self._fresh = False
+            self.taken += 1
+            self._ready.clear()
+            return self._buffers[self._front]
+
+
+class Stage():
+    """
+    A pipeline stage, which calls a function over and over in its own thread
+    until told to stop.
+    """
+    def __init__(self, name, function):
+        """
+        :type name: str
+        :param name:
+            The name of the stage, for the thread.
+        :type function: callable
+        :param function:
+            What to call each time around the loop. This should not block for
+            long since we only check for being stopped in between calls.
+        """
+        self._name     = name
+        self._function = function
+        self._running  = False
+        self._thread   = threading.Thread(target=self._run, name=name)
+        self._thread.daemon = True
+
+
+    @property
+    def name(self):
+        """
+        The name of this stage.
+        """
+        return self._name
+
+
+    def start(self):
+        """
+        Start the stage's thread.
+        """
+        self._running = True
+        self._thread.start()
+
+
+    def stop(self):
+        """
+        Stop the stage's thread, and wait for it to finish.
+        """
+        self._running = False
+        if self._thread.is_alive():
+            self._thread.join()
+
+
+    @property
+    def alive(self):
+        """
+        Whether the stage's thread is running.
+        """
+        return self._thread.is_alive()
+
+
+    def _run(self):
+        """
+        The thread's body.
+        """
+        try:
+            while self._running:
+                self._function()
+        except Exception as e:
+            LOG.error("Stage %s died: %s", self._name, e)
+            self._running = False
+            raise
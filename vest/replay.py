@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Replay recorded audio through the vest's DSP chain, without any hardware, and
+report what the actuators would have done.
+
+This is how we check that the gain control is doing its job: a good recording
+should use a decent range of the duty cycle, in both loud and quiet sections,
+without everything pinned at 100%. If no recording is given then we generate
+one which has a quiet section followed by a loud one. We also check that a
+steady background, with no music in it, leaves the actuators alone.
+"""
+
+from __future__ import print_function, division
+
+from   dsp   import BANDS_FILE, Processor
+
+import argparse
+import numpy as np
+import sys
+import wave
+
+# ----------------------------------------------------------------------
+
+# The defaults, which match vest.py
+_CHUNK      = 1024 * 2
+_RATE       = 44100
+_NUM_OUT    = 10
+
+# ----------------------------------------------------------------------
+
+def read_wav(filename):
+    """
+    Read a 16bit WAV file, mixing it down to mono.
+
+    :return: A tuple of the rate and the samples, as an int16 array.
+    """
+    with wave.open(filename, 'rb') as fh:
+        if fh.getsampwidth() != 2:
+            raise ValueError("%s is not 16bit audio" % (filename,))
+        rate     = fh.getframerate()
+        channels = fh.getnchannels()
+        data     = fh.readframes(fh.getnframes())
+    samples = np.frombuffer(data, dtype=np.int16)
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return (rate, samples)
+
+
+def synthesise(rate, seconds=20.0, seed=0):
+    """
+    Generate some fake "music": a few bass notes and some hiss which has a
+    beat to it. The first half is quiet and the second half is loud.
+    """
+    rng   = np.random.RandomState(seed)
+    t     = np.arange(int(rate * seconds)) / rate
+    beat  = 0.5 + 0.5 * (np.sin(2 * np.pi * 2.0 * t) > 0)
+    notes = sum(np.sin(2 * np.pi * f * t) for f in (55.0, 110.0, 440.0, 1760.0))
+    hiss  = rng.normal(0.0, 0.3, len(t))
+    music = (notes / 4 + hiss) * beat
+
+    # Quiet, then loud
+    scale = np.where(t < seconds / 2, 0.01, 0.5)
+    return np.clip(music * scale * 32767, -32768, 32767).astype(np.int16)
+
+
+def background(rate, seconds=20.0, seed=0):
+    """
+    Generate a steady background with no music in it: some mains hum and the
+    hiss of a room.
+    """
+    rng  = np.random.RandomState(seed)
+    t    = np.arange(int(rate * seconds)) / rate
+    hum  = sum(np.sin(2 * np.pi * f * t) for f in (50.0, 100.0, 150.0)) / 3
+    hiss = rng.normal(0.0, 0.3, len(t))
+    return np.clip((hum + hiss) * 0.05 * 32767, -32768, 32767).astype(np.int16)
+
+
+def replay(samples, processor, chunk):
+    """
+    Push the samples through the chain, a chunk at a time.
+
+    :return: The ``(frames, bands)`` array of the output values, in the range
+             ``[0, 1]``.
+    """
+    num_frames = len(samples) // chunk
+    outputs    = np.zeros((num_frames, processor.bands.num_bands))
+    for i in range(num_frames):
+        processor.process(samples[i * chunk:(i + 1) * chunk], out=outputs[i])
+    return outputs / 100.0
+
+
+def report(name, outputs):
+    """
+    Print the dynamic range statistics for a section of output.
+
+    :return: A tuple of the fraction of values which were saturated and the
+             fraction which were active.
+    """
+    saturated = float(np.mean(outputs >= 0.99))
+    active    = float(np.mean(outputs >  0.0))
+    (p5, p50, p95) = np.percentile(outputs, (5, 50, 95))
+    print("%-8s p5=%5.1f%% p50=%5.1f%% p95=%5.1f%% "
+          "active=%5.1f%% saturated=%5.1f%%" %
+          (name, p5 * 100, p50 * 100, p95 * 100, active * 100, saturated * 100))
+    return (saturated, active)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('wav', nargs='?',
+                        help='The 16bit WAV file to replay')
+    parser.add_argument('--chunk', type=int, default=_CHUNK,
+                        help='The number of samples per frame')
+    parser.add_argument('--bands', default=BANDS_FILE,
+                        help='The band layout file')
+    parser.add_argument('--attack', type=float, default=0.01)
+    parser.add_argument('--release', type=float, default=0.15)
+    parser.add_argument('--gain-attack', type=float, default=0.5)
+    parser.add_argument('--gain-release', type=float, default=10.0)
+    parser.add_argument('--noise-attack', type=float, default=10.0)
+    parser.add_argument('--noise-release', type=float, default=0.1)
+    parser.add_argument('--check', action='store_true',
+                        help='Exit non-zero if the dynamic range looks wrong')
+    args = parser.parse_args()
+
+    if args.wav:
+        (rate, samples) = read_wav(args.wav)
+    else:
+        rate    = _RATE
+        samples = synthesise(rate)
+
+    def make_processor():
+        return Processor(_NUM_OUT,
+                         args.chunk,
+                         rate,
+                         bands_file   =args.bands,
+                         attack       =args.attack,
+                         release      =args.release,
+                         gain_attack  =args.gain_attack,
+                         gain_release =args.gain_release,
+                         noise_attack =args.noise_attack,
+                         noise_release=args.noise_release)
+
+    processor = make_processor()
+    outputs   = replay(samples, processor, args.chunk)
+
+    # Look at each half separately, ignoring the first bit of each where the
+    # gain is still settling
+    half   = len(outputs) // 2
+    settle = half // 4
+    failed = False
+    for (name, section) in (('first',  outputs[settle:half]),
+                            ('second', outputs[half + settle:])):
+        (saturated, active) = report(name, section)
+        if saturated > 0.25 or active < 0.25:
+            failed = True
+
+    for (i, centre) in enumerate(processor.bands.centres):
+        report('%6.0fHz' % centre, outputs[settle:, i])
+
+    # A steady background should do next to nothing, once we have had a moment
+    # to hear it
+    noise = replay(background(rate), make_processor(), args.chunk)
+    (_, active) = report('noise', noise[len(noise) // 8:])
+    if active > 0.1:
+        failed = True
+
+    if args.check and failed:
+        print("Dynamic range check failed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
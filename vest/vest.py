@@ -1,14 +1,15 @@
 #!/usr/bin/python
 
-from __future__ import print_function
+from __future__ import print_function, division
 
-import RPi.GPIO as GPIO
+import metrics
 import numpy    as np
+import outputs
 import pyaudio
-import struct
 import time
 
-from scipy.fftpack import fft
+from dsp      import Processor
+from pipeline import Exchange, Stage
 
 # ----------------------------------------------------------------------
 
@@ -39,33 +40,34 @@ _CHANNELS = 1
 # The PWM frequency
 _PWM_HZ = 500
 
+# How we drive the actuators, see outputs.py for the choices
+_OUTPUT = 'gpio'
+
+# How often to print the pipeline stats, in seconds
+_STATS_INTERVAL = 60
+
+# Where to serve the metrics from, or None to not do so
+_METRICS_SOCKET = '/tmp/vest.metrics.sock'
+
+# The metrics which we record as we go
+_FRAME_TIME  = metrics.histogram('vest_frame_seconds',
+                                 'Time taken to process each frame of audio')
+_OUTPUT_TIME = metrics.histogram('vest_output_seconds',
+                                 'Time taken to set the outputs for a frame')
+
 # ----------------------------------------------------------------------
 
-def init_gpio():
+def init_gpio(backend=_OUTPUT):
     """
     Set up the GPIO ports and put them into the right state.
-    """
-    # Set the pin numbering to be that of the GPIOs, not the pins on the board. And
-    # turn off noisy warnings.
-    GPIO.setmode(GPIO.BCM)
-    GPIO.setwarnings(False)
-
-    # Init the GPIO ports etc.
-    pwm = list()
-    for side in _PINS:
-        pwm_side = list()
-        pwm.append(pwm_side)
-        for pin in side:
-            GPIO.setup (pin, GPIO.OUT)
-            GPIO.output(pin, False)
 
-            # Set up the pulse-wide modulalisation
-            pwm_pin = GPIO.PWM(pin, _PWM_HZ)
-            pwm_pin.start(0)
-            pwm_side.append(pwm_pin)
+    :type backend: str
+    :param backend:
+        The name of the output backend to use.
 
-    # And give back the PWMs
-    return pwm
+    :return: The `outputs.Output` which drives them.
+    """
+    return outputs.create(backend, _PINS, _PWM_HZ)
 
 
 def open_microphone():
@@ -82,60 +84,136 @@ def open_microphone():
     )
 
 
+class Capture():
+    """
+    The capture stage of the pipeline, which reads from the microphone and
+    hands the samples on.
+    """
+    def __init__(self, stream, exchange):
+        """
+        :param stream:   The audio stream to read from.
+        :param exchange: The `Exchange` to publish the samples to.
+        """
+        self._stream   = stream
+        self._exchange = exchange
+
+        # How many times we didn't read fast enough and lost audio
+        self.overflows = 0
+
+
+    def __call__(self):
+        """
+        Read the next chunk.
+        """
+        # We want to know about overflows, rather than have them silently
+        # dropped, so that we can tell if we're falling behind
+        try:
+            data = self._stream.read(_CHUNK, exception_on_overflow=True)
+        except IOError as e:
+            if e.errno != pyaudio.paInputOverflowed:
+                raise
+            self.overflows += 1
+            return
+
+        # Copy into the buffer and hand it on. This never blocks, even if the
+        # DSP stage is behind.
+        self._exchange.back[:] = np.frombuffer(data, dtype=np.int16)
+        self._exchange.publish()
+
+
+class Dsp():
+    """
+    The DSP stage of the pipeline, which turns the samples into duty cycles.
+    """
+    def __init__(self, processor, samples, duty_cycles):
+        """
+        :param processor:   The `Processor` to use.
+        :param samples:     The `Exchange` to get the samples from.
+        :param duty_cycles: The `Exchange` to publish the duty cycles to.
+        """
+        self._processor   = processor
+        self._samples     = samples
+        self._duty_cycles = duty_cycles
+
+
+    def __call__(self):
+        """
+        Process the freshest chunk of samples.
+        """
+        # Wait for a bit, so that we can be stopped
+        samples = self._samples.take(timeout=0.1)
+        if samples is None:
+            return
+        with _FRAME_TIME.time():
+            self._processor.process(samples, out=self._duty_cycles.back)
+        self._duty_cycles.publish()
+
+
 def main():
     """
     Entry point.
-    """
-    # Get the PWM controllers
-    pwms = init_gpio()
 
-    # How many outputs for the FFT?
-    xf = np.linspace(0, _RATE, _CHUNK)
-    count = len(xf)
+    We run as a pipeline of three stages: capture and DSP, each in their own
+    thread, and the output, in this one. That way a stall while we are writing to the GPIOs doesn't
+    cause us to lose audio, and the outputs are always set from the freshest
+    frame.
+    """
+    # Get the actuator outputs
+    output = init_gpio()
 
-    # How many outputs to average over to set the PWM
-    bucket_start = count * 0.1
-    bucket_size  = (count - bucket_start) / _NUM_OUT
+    # The signal processing chain, and where each stage puts its results
+    processor   = Processor(_NUM_OUT, _CHUNK, _RATE)
+    samples     = Exchange(_CHUNK, dtype=np.int16)
+    duty_cycles = Exchange(_NUM_OUT)
 
     # Start streaming!
-    stream = open_microphone()
-
-    # And around we go...
-    while True:
-        # Pull in the next sample
-        data     = stream.read(_CHUNK, exception_on_overflow=False)
-        data_int = struct.unpack(str(2 * _CHUNK) + 'B', data)
-
-        # Compute the FFT
-        data_fft = fft(data_int)
-
-        # Normalise it
-        yf = np.abs(data_fft[0:_CHUNK]) / (128 * _CHUNK)
-
-        # Accumulate and set the duty cycle of each pin
-        for i in range(_NUM_OUT):
-            # Accumulate from here to here
-            freq  = xf[int(i * bucket_size + bucket_start)]
-            start = int(i       * bucket_size + bucket_start)
-            end   = int((i + 1) * bucket_size + bucket_start)
-
-            # Change to duty cycle to be a value in between 0 and 100 (percent)
-            duty_cycle = \
-                int(
-                    np.max((
-                        0.0,
-                        np.min((
-                            100.0,
-                            (np.mean(yf[start:end]) - 0.01) * 10000
-                        ))
-                    ))
-                )
-            pwms[0][i].ChangeDutyCycle(duty_cycle)
-            pwms[1][i].ChangeDutyCycle(duty_cycle)
+    capture = Capture(open_microphone(), samples)
+    stages  = (Stage('capture', capture),
+                Stage('dsp', Dsp(processor, samples, duty_cycles)))
+    for stage in stages:
+        stage.start()
+
+    # Export how we're doing. These all just read the values which the
+    # pipeline is already keeping track of.
+    if _METRICS_SOCKET:
+        metrics.counter('vest_overflows_total',
+                        'Chunks of audio lost because we did not read in time',
+                        lambda: capture.overflows)
+        metrics.counter('vest_dropped_chunks_total',
+                        'Chunks of audio which the DSP stage never saw',
+                        lambda: samples.dropped)
+        metrics.counter('vest_dropped_frames_total',
+                        'Frames of duty cycles which were never output',
+                        lambda: duty_cycles.dropped)
+        metrics.counter('vest_frames_total',
+                        'Frames of duty cycles which were output',
+                        lambda: duty_cycles.taken)
+        metrics.serve(_METRICS_SOCKET)
+
+    # And around we go, with this thread handling the outputs
+    next_stats = time.time() + _STATS_INTERVAL
+    while all(stage.alive for stage in stages):
+        # Get the freshest duty cycles, if any
+        values = duty_cycles.take(timeout=1.0)
+        if values is not None:
+            # Set the duty cycle of each pin
+            with _OUTPUT_TIME.time():
+                output.set(values)
             if _PRINT:
-                print("%d %d %d" % (i, freq, duty_cycle))
-        if _PRINT:
-            print('')
+                for i in range(_NUM_OUT):
+                    print("%d %d %d" %
+                          (i, processor.bands.centres[i], values[i]))
+                print('')
+
+        # Say how we're doing, so that we can tell if we're falling behind
+        now = time.time()
+        if now >= next_stats:
+            next_stats = now + _STATS_INTERVAL
+            print("Overflows: %d; "
+                  "Dropped: %d of %d chunks, %d of %d duty cycles" %
+                  (capture.overflows,
+                   samples    .dropped, samples    .published,
+                   duty_cycles.dropped, duty_cycles.published))
         
 
 if __name__ == "__main__":